@@ -0,0 +1,96 @@
+"""准入控制与降级
+
+所有受控请求共享 max_concurrent 个名额（进程内）。名额用完时请求按优先级排队：
+名额释放后先交给优先级最高、排队最早的请求。每个优先级有自己的队列上限和最长等待时间，
+排队的请求数已满，或按平均处理时间估计等不到名额，就立即拒绝而不是排队到超时。
+被拒绝的请求由调用方决定是直接返回 503 还是降级处理（例如返回缓存的题目、延后写入统计）。
+"""
+import heapq
+import itertools
+import threading
+import time
+
+# 越靠前优先级越高
+PRIORITY_CLASSES = ('gameplay', 'stats', 'admin')
+
+
+class _Waiter:
+    __slots__ = ('cls', 'event', 'granted', 'cancelled')
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent, classes):
+        """classes: {类别: (最多排队数, 最长等待秒数)}"""
+        self.max_concurrent = max(1, max_concurrent)
+        self.classes = {cls: (PRIORITY_CLASSES.index(cls), int(queue), float(wait))
+                        for cls, (queue, wait) in classes.items()}
+        self.active = 0
+        self._waiters = []      # (优先级, 序号, _Waiter)
+        self._queued = {cls: 0 for cls in self.classes}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._service_time = 0.05   # 平均处理时间（秒），指数滑动平均
+        self.counters = {cls: {"admitted": 0, "rejected": 0} for cls in self.classes}
+
+    def _expected_wait(self, priority):
+        """排在前面（优先级不低于自己）的请求处理完之前需要等待的时间（在锁内调用）"""
+        ahead = sum(1 for p, _, w in self._waiters if p <= priority and not w.cancelled)
+        return (ahead + 1) / self.max_concurrent * self._service_time
+
+    def acquire(self, cls):
+        """取得名额返回令牌，被拒绝返回 None；release(令牌) 归还名额"""
+        priority, max_queue, max_wait = self.classes[cls]
+        with self._lock:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                self.counters[cls]["admitted"] += 1
+                return (cls, time.perf_counter())
+            if self._queued[cls] >= max_queue or self._expected_wait(priority) > max_wait:
+                self.counters[cls]["rejected"] += 1
+                return None
+            waiter = _Waiter(cls)
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            self._queued[cls] += 1
+
+        waiter.event.wait(max_wait)
+        with self._lock:
+            if waiter.granted:
+                self.counters[cls]["admitted"] += 1
+                return (cls, time.perf_counter())
+            # 超时：留在堆里的条目由 release 跳过
+            waiter.cancelled = True
+            self._queued[cls] -= 1
+            self.counters[cls]["rejected"] += 1
+            return None
+
+    def release(self, token):
+        _, started = token
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                # 名额直接转交给排队的请求，active 不变
+                waiter.granted = True
+                self._queued[waiter.cls] -= 1
+                waiter.event.set()
+                return
+            self.active -= 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "max_concurrent": self.max_concurrent,
+                "queued": dict(self._queued),
+                "avg_service_ms": round(self._service_time * 1000, 2),
+                "counters": {cls: dict(c) for cls, c in self.counters.items()}
+            }
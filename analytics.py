@@ -0,0 +1,82 @@
+"""只读分析快照
+
+管理和调试接口的全表扫描不应该和玩家的写入争用同一个数据库文件。
+定时用 SQLite 在线备份 API 把主库复制成一个独立文件（WAL 模式下备份只是一个读事务，不阻塞写入），
+分析类查询以只读方式连接这个快照。启用答题统计分片时，各分片文件也一起复制，并以同样的库名附加到快照连接上。
+"""
+import os
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+from warmstart import file_lock
+
+
+class AnalyticsSnapshot:
+    def __init__(self, db_path, snapshot_path, max_age=600, attached=None):
+        self.db_path = db_path
+        self.path = snapshot_path
+        self.max_age = max_age
+        self.attached = attached or {}  # 库名 -> 分片数据库路径
+
+    def age(self):
+        """快照距今的秒数，不存在时返回 None"""
+        try:
+            return time.time() - os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def refresh(self, force=False):
+        """快照过期时重新生成；多个 worker 同时调用时只有一个真正复制，返回是否生成了新快照"""
+        age = self.age()
+        if not force and age is not None and age < self.max_age:
+            return False
+        with file_lock(self.path + '.lock'):
+            age = self.age()
+            if not force and age is not None and age < self.max_age:
+                return False
+
+            started = time.perf_counter()
+            # 主库快照最后替换，它的修改时间代表整套快照的时间
+            for schema, path in self.attached.items():
+                self._copy(path, self._attached_path(schema))
+            self._copy(self.db_path, self.path)
+            print(f"📸 已生成分析快照: {self.path}（{time.perf_counter() - started:.2f}秒）")
+            return True
+
+    @staticmethod
+    def _copy(src_path, dst_path):
+        tmp_path = f"{dst_path}.tmp.{os.getpid()}"
+        src = sqlite3.connect(src_path)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst)
+            # 快照只读，不需要 WAL 文件
+            dst.execute("PRAGMA journal_mode=DELETE")
+            dst.commit()
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp_path, dst_path)
+
+    def _attached_path(self, schema):
+        return f"{self.path}.{schema}"
+
+    @staticmethod
+    def _uri(path):
+        return f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+
+    def connect(self):
+        """只读连接快照，快照不存在时返回 None"""
+        if not os.path.exists(self.path):
+            return None
+        conn = sqlite3.connect(self._uri(self.path), uri=True, check_same_thread=False)
+        try:
+            for schema in self.attached:
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (self._uri(self._attached_path(schema)),))
+        except sqlite3.Error:
+            # 开启分片后还没生成过带分片的快照
+            conn.close()
+            return None
+        conn.row_factory = sqlite3.Row
+        return conn
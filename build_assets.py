@@ -0,0 +1,266 @@
+"""静态资源构建脚本
+
+把 static/js 下的脚本压缩合并成一个带内容哈希的 bundle，CSS 同样处理，
+并预先生成 .gz / .br 压缩版本，最后把 index.html 里的引用改写成新文件名。
+
+用法: python build_assets.py
+产物: static/dist/ 和 templates/dist/index.html
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli  # 可选依赖，没有安装时只生成 gzip 版本
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+TEMPLATE_DIST_DIR = os.path.join(TEMPLATE_DIR, "dist")
+
+# 合并顺序与 index.html 中原来的加载顺序一致
+JS_BUNDLE = ["js/leaderboard.js", "js/wire.js", "js/statistics-chart.js", "js/script.js", "js/animation-system.js"]
+CSS_FILES = ["css/style.css"]
+
+# 出现在这些字符或关键字之后的 "/" 是正则字面量而不是除号
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "delete", "void", "throw", "new", "instanceof"}
+
+
+def minify_js(src):
+    """保守的 JS 压缩：去掉注释、行首行尾空白和空行，字符串/模板/正则原样保留。
+
+    保留换行，避免破坏依赖自动分号插入的代码。
+    """
+    out = []
+    i, n = 0, len(src)
+    # 模板字符串里 ${...} 的嵌套层级，每层记录对应的花括号深度
+    template_stack = []
+    brace_depth = 0
+    line_start = True
+    pending_space = False
+
+    def last_significant():
+        for chunk in reversed(out):
+            stripped = chunk.rstrip()
+            if stripped:
+                return stripped
+        return ""
+
+    def regex_allowed():
+        prev = last_significant()
+        if not prev:
+            return True
+        if prev[-1] in REGEX_PRECEDERS:
+            return True
+        word = re.search(r"[A-Za-z_$][\w$]*$", prev)
+        return bool(word) and word.group(0) in REGEX_KEYWORDS
+
+    def emit(text):
+        nonlocal line_start, pending_space
+        if pending_space and not line_start:
+            out.append(" ")
+        pending_space = False
+        line_start = False
+        out.append(text)
+
+    def copy_template(start):
+        """从反引号开始复制模板字符串，遇到 ${ 时返回代码状态"""
+        j = start
+        while j < n:
+            ch = src[j]
+            if ch == "\\":
+                j += 2
+                continue
+            if ch == "`":
+                return j + 1, False
+            if ch == "$" and j + 1 < n and src[j + 1] == "{":
+                return j + 2, True
+            j += 1
+        return n, False
+
+    while i < n:
+        ch = src[i]
+
+        if ch == "\n":
+            if not line_start:
+                out.append("\n")
+            line_start = True
+            pending_space = False
+            i += 1
+            continue
+
+        if ch in " \t\r":
+            pending_space = True
+            i += 1
+            continue
+
+        nxt = src[i + 1] if i + 1 < n else ""
+
+        if ch == "/" and nxt == "/":
+            while i < n and src[i] != "\n":
+                i += 1
+            continue
+
+        if ch == "/" and nxt == "*":
+            end = src.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            pending_space = True
+            continue
+
+        if ch in "'\"":
+            j = i + 1
+            while j < n and src[j] != ch:
+                if src[j] == "\\":
+                    j += 1
+                elif src[j] == "\n":
+                    break
+                j += 1
+            emit(src[i:j + 1])
+            i = j + 1
+            continue
+
+        if ch == "`":
+            j, opened = copy_template(i + 1)
+            emit(src[i:j])
+            if opened:
+                template_stack.append(brace_depth)
+            i = j
+            continue
+
+        if ch == "/" and regex_allowed():
+            j = i + 1
+            in_class = False
+            while j < n and src[j] != "\n":
+                c = src[j]
+                if c == "\\":
+                    j += 2
+                    continue
+                if c == "[":
+                    in_class = True
+                elif c == "]":
+                    in_class = False
+                elif c == "/" and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and (src[j].isalnum() or src[j] == "_"):
+                j += 1  # 正则标志位
+            emit(src[i:j])
+            i = j
+            continue
+
+        if ch == "{":
+            brace_depth += 1
+        elif ch == "}":
+            if template_stack and template_stack[-1] == brace_depth:
+                # 回到模板字符串内部
+                template_stack.pop()
+                j, opened = copy_template(i + 1)
+                emit(src[i:j])
+                if opened:
+                    template_stack.append(brace_depth)
+                i = j
+                continue
+            brace_depth -= 1
+
+        emit(ch)
+        i += 1
+
+    return "".join(out).strip() + "\n"
+
+
+def minify_css(src):
+    """CSS 压缩：去掉注释并合并空白"""
+    src = re.sub(r"/\*.*?\*/", "", src, flags=re.S)
+    src = re.sub(r"\s+", " ", src)
+    src = re.sub(r"\s*([{};,])\s*", r"\1", src)
+    src = src.replace(";}", "}")
+    return src.strip() + "\n"
+
+
+def read_text(rel_path):
+    with open(os.path.join(STATIC_DIR, rel_path), encoding="utf-8-sig") as f:
+        return f.read()
+
+
+def write_variants(name, content):
+    """写出原文件和预压缩版本，返回带哈希的文件名"""
+    data = content.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    stem, ext = os.path.splitext(name)
+    hashed_name = f"{stem}.{digest}{ext}"
+    path = os.path.join(DIST_DIR, hashed_name)
+
+    with open(path, "wb") as f:
+        f.write(data)
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+    print(f"✅ {hashed_name}: {len(data)} 字节")
+    return hashed_name
+
+
+def rewrite_index(manifest):
+    """把 index.html 中的脚本和样式引用改写为构建产物"""
+    with open(os.path.join(TEMPLATE_DIR, "index.html"), encoding="utf-8") as f:
+        html = f.read()
+
+    bundle_tag = f'<script src="/static/dist/{manifest["js/app.js"]}"></script>'
+    placed = False
+    # 去掉所有被合并的脚本标签，在最后一个的位置放入 bundle
+    for rel in reversed(JS_BUNDLE):
+        pattern = re.compile(r'[ \t]*<script src="/static/' + re.escape(rel) + r'"></script>[ \t]*\r?\n?')
+        match = pattern.search(html)
+        if not match:
+            continue
+        if not placed:
+            indent = re.match(r"[ \t]*", match.group(0)).group(0)
+            html = html[:match.start()] + indent + bundle_tag + "\n" + html[match.end():]
+            placed = True
+        else:
+            html = html[:match.start()] + html[match.end():]
+
+    for rel in CSS_FILES:
+        html = html.replace(f'href="/static/{rel}"', f'href="/static/dist/{manifest[rel]}"')
+
+    os.makedirs(TEMPLATE_DIST_DIR, exist_ok=True)
+    with open(os.path.join(TEMPLATE_DIST_DIR, "index.html"), "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def build():
+    os.makedirs(DIST_DIR, exist_ok=True)
+    for old in os.listdir(DIST_DIR):
+        os.remove(os.path.join(DIST_DIR, old))
+
+    if brotli is None:
+        print("⚠️ 未安装 brotli，跳过 .br 文件生成")
+
+    manifest = {}
+
+    # 每个文件之间加分号，防止上一个文件末尾缺分号导致拼接出错
+    js = ";\n".join(minify_js(read_text(rel)) for rel in JS_BUNDLE)
+    manifest["js/app.js"] = write_variants("app.js", js)
+
+    for rel in CSS_FILES:
+        manifest[rel] = write_variants(os.path.basename(rel), minify_css(read_text(rel)))
+
+    with open(os.path.join(DIST_DIR, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    rewrite_index(manifest)
+    print("✅ 静态资源构建完成")
+    return manifest
+
+
+if __name__ == "__main__":
+    build()
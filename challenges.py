@@ -0,0 +1,59 @@
+"""每日/每周挑战
+
+题目集合由 (周期, 周期编号, 难度) 决定的种子选出，所有玩家拿到同一套题。
+每套题只序列化一次，JSON 和 gzip 两种形式都缓存在内存里，请求时直接返回字节。
+下发的内容不含答案，答案只留在服务端判分。
+"""
+import gzip
+import hashlib
+import json
+import random
+import threading
+
+
+def challenge_seed(period, period_key, difficulty):
+    digest = hashlib.sha256(f"{period}:{period_key}:{difficulty}".encode('utf-8')).hexdigest()
+    return int(digest[:16], 16)
+
+
+def pick_question_ids(question_ids, seed, count):
+    """用固定种子从题目ID中抽题，同样的输入永远得到同样的结果"""
+    ordered = sorted(question_ids)
+    return random.Random(seed).sample(ordered, min(count, len(ordered)))
+
+
+class ChallengePayload:
+    __slots__ = ('period_key', 'source', 'question_ids', 'answers', 'body', 'gzip_body', 'etag')
+
+    def __init__(self, period, period_key, difficulty, questions, source=None):
+        # source: 生成时题库映射的指纹，题库重新编译后需要重新生成
+        self.period_key = period_key
+        self.source = source
+        self.question_ids = [q["id"] for q in questions]
+        self.answers = {q["id"]: q["a"] for q in questions}
+        self.body = json.dumps({
+            "period": period,
+            "key": period_key,
+            "difficulty": difficulty,
+            "questions": [{k: v for k, v in q.items() if k != "a"} for q in questions]
+        }, ensure_ascii=False).encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest()[:16] + '"'
+
+
+class ChallengeCache:
+    """{(周期, 难度): ChallengePayload}，只保留当前周期的题目"""
+
+    def __init__(self):
+        self.payloads = {}
+        self._lock = threading.Lock()
+
+    def get(self, period, difficulty, period_key, source=None):
+        payload = self.payloads.get((period, difficulty))
+        if payload is not None and payload.period_key == period_key and payload.source == source:
+            return payload
+        return None
+
+    def put(self, period, difficulty, payload):
+        with self._lock:
+            self.payloads[(period, difficulty)] = payload
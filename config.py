@@ -19,6 +19,119 @@ class Config:
     STATIC_PATH = os.environ.get('STATIC_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
     STATIC_NEW_PATH = os.environ.get('STATIC_NEW_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), "static1")
 
+    # 限流设置 - 每个路由 (每秒补充令牌数, 桶容量)
+    # 可用 RATE_LIMITS 环境变量覆盖，格式: "login=0.2:5,register=0.05:3"
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+    RATE_LIMIT_DEFAULTS = {
+        'login': (0.2, 5),                  # 平均每5秒1次，最多连续5次
+        'register': (0.05, 3),              # 平均每20秒1次，最多连续3次
+        'submit_answer': (2, 20),
+        'update_question_stats': (2, 20),
+    }
+    RATE_LIMITS_SPEC = os.environ.get('RATE_LIMITS', '')
+    RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 10000))
+    # 这些路由对已登录用户按 user_id 计数而不是按 IP，同一 NAT 后的玩家互不影响
+    RATE_LIMIT_USER_KEYED = {'submit_answer', 'update_question_stats'}
+    # 前面有几层可信的反向代理（如 Nginx 为 1），按 X-Forwarded-For 取客户端 IP；0 表示直连
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 0))
+
+    # 准入控制 - 每个 worker 同时处理的受控请求数，按类别 (最多排队数, 最长等待秒数)
+    # 优先级 gameplay > stats > admin，可用 ADMISSION_CLASSES 覆盖，格式: "stats=16:0.3,admin=2:0.1"
+    # 被拒绝时 /get_questions 返回最近一批缓存的题目，/update_question_stats 延后批量写入，其余返回 503
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '0') == '1'
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 8))
+    ADMISSION_CLASS_DEFAULTS = {
+        'gameplay': (64, 2.0),
+        'stats': (32, 0.5),
+        'admin': (4, 0.2),
+    }
+    ADMISSION_CLASSES_SPEC = os.environ.get('ADMISSION_CLASSES', '')
+    ADMISSION_DEFER_MAX = int(os.environ.get('ADMISSION_DEFER_MAX', 10000))
+
+    # 密码哈希设置 - 修改哈希参数后，用户下次登录时会自动按新参数重新哈希
+    # 例如 "pbkdf2:sha256:600000" 或 "scrypt:32768:8:1"
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2'
+    PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+    PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', 2))  # 0 表示在请求线程内直接计算
+    PASSWORD_POOL_MAX_PENDING = int(os.environ.get('PASSWORD_POOL_MAX_PENDING', 16))
+    PASSWORD_POOL_ADMISSION_TIMEOUT = float(os.environ.get('PASSWORD_POOL_ADMISSION_TIMEOUT', 2.0))
+
+    # 是否使用 build_assets.py 生成的压缩合并资源（static/dist、templates/dist）
+    USE_BUILT_ASSETS = os.environ.get('USE_BUILT_ASSETS', '0') == '1'
+
+    # JSON 响应压缩：超过该字节数才压缩
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+    # 预构建快照（题库、排行榜前列），worker 启动时直接加载
+    WARM_START_ENABLED = os.environ.get('WARM_START_ENABLED', '1') != '0'
+    SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH') or DATABASE_PATH + '.snapshot'
+    # 定时比对题库映射与 questions 表内容的间隔（秒），不一致时重新编译
+    QUESTION_BANK_CHECK_SECONDS = int(os.environ.get('QUESTION_BANK_CHECK_SECONDS', 60))
+
+    # 后台定时任务（榜单跨天等）
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1') != '0'
+    # 就绪检查（/readyz）在后台探测数据库的间隔（秒）
+    HEALTH_PROBE_SECONDS = int(os.environ.get('HEALTH_PROBE_SECONDS', 5))
+    # 日榜/周榜的时区偏移（小时），数据库时间为 UTC
+    LEADERBOARD_UTC_OFFSET_HOURS = int(os.environ.get('LEADERBOARD_UTC_OFFSET_HOURS', 0))
+    # 分类/难度榜：至少答过这么多题才上榜
+    DIMENSION_BOARD_MIN_ANSWERED = int(os.environ.get('DIMENSION_BOARD_MIN_ANSWERED', 20))
+
+    # 实时多人房间（需要安装 flask-sock）
+    ROOMS_ENABLED = os.environ.get('ROOMS_ENABLED', '1') != '0'
+    ROOM_TICK_SECONDS = float(os.environ.get('ROOM_TICK_SECONDS', 0.5))
+    ROOM_REVEAL_SECONDS = float(os.environ.get('ROOM_REVEAL_SECONDS', 3))
+    ROOM_MAX_PLAYERS = int(os.environ.get('ROOM_MAX_PLAYERS', 500))
+    ROOM_MAX_ROOMS = int(os.environ.get('ROOM_MAX_ROOMS', 100))
+    # 每个连接最多排队的待发送帧数，超过说明客户端跟不上，断开它
+    ROOM_SEND_QUEUE_FRAMES = int(os.environ.get('ROOM_SEND_QUEUE_FRAMES', 64))
+
+    # 进行中对局：多久内有活动算在线（秒），超过多久未结束视为放弃，由定时任务结算或删除
+    SESSION_ACTIVE_WINDOW_SECONDS = int(os.environ.get('SESSION_ACTIVE_WINDOW_SECONDS', 300))
+    SESSION_ABANDON_SECONDS = int(os.environ.get('SESSION_ABANDON_SECONDS', 2 * 3600))
+
+    # 每日/每周挑战每套题的题数
+    CHALLENGE_QUESTION_COUNT = int(os.environ.get('CHALLENGE_QUESTION_COUNT', 20))
+
+    # 错题复习（/get_questions?mode=review）：答错后多少分钟再次到期；下发后多少分钟内不重复下发
+    REVIEW_RELEARN_MINUTES = int(os.environ.get('REVIEW_RELEARN_MINUTES', 10))
+    REVIEW_HOLD_MINUTES = int(os.environ.get('REVIEW_HOLD_MINUTES', 10))
+
+    # 程序生成数学题在 /get_questions 中所占比例（0 关闭，1 全部生成）；种子为空时每次启动随机
+    MATH_GENERATOR_RATIO = float(os.environ.get('MATH_GENERATOR_RATIO', 0))
+    MATH_GENERATOR_SEED = os.environ.get('MATH_GENERATOR_SEED') or None
+
+    # 答题日志：答题先追加写入每个进程的日志文件，定时批量合并进 question_stats
+    JOURNAL_ENABLED = os.environ.get('JOURNAL_ENABLED', '0') == '1'
+    JOURNAL_FSYNC_BATCH = int(os.environ.get('JOURNAL_FSYNC_BATCH', 0))  # 每 N 条 fsync 一次，0 不主动 fsync
+    JOURNAL_COMPACT_SECONDS = float(os.environ.get('JOURNAL_COMPACT_SECONDS', 2))
+
+    # 管理/调试接口读取的分析快照，每隔这么多秒从主库复制一次
+    ANALYTICS_SNAPSHOT_ENABLED = os.environ.get('ANALYTICS_SNAPSHOT_ENABLED', '1') != '0'
+    ANALYTICS_SNAPSHOT_SECONDS = int(os.environ.get('ANALYTICS_SNAPSHOT_SECONDS', 600))
+
+    # 答题统计按 question_id 分到 N 个 SQLite 文件（0 不分片，最多 10）；启用后不要再修改
+    QUESTION_STATS_SHARDS = int(os.environ.get('QUESTION_STATS_SHARDS', 0))
+
+    # 流量录制（配合 replay.py 回放），用户名等按 TRAFFIC_RECORD_SALT 加盐哈希
+    TRAFFIC_RECORD_ENABLED = os.environ.get('TRAFFIC_RECORD_ENABLED', '0') == '1'
+    TRAFFIC_RECORD_DIR = os.environ.get('TRAFFIC_RECORD_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), "traffic")
+    TRAFFIC_RECORD_MAX_BYTES = int(os.environ.get('TRAFFIC_RECORD_MAX_BYTES', 10 * 1024 * 1024))
+    TRAFFIC_RECORD_BACKUPS = int(os.environ.get('TRAFFIC_RECORD_BACKUPS', 5))
+    TRAFFIC_RECORD_SALT = os.environ.get('TRAFFIC_RECORD_SALT') or SECRET_KEY
+
+    # 多租户：TENANT_MODE=subdomain（foo.TENANT_BASE_DOMAIN）或 path（/t/foo/），每个租户一个 {TENANT_DIR}/foo.db
+    # 同时保持加载的租户不超过 TENANT_MAX_LOADED 个，其余按最久未使用淘汰
+    TENANT_MODE = os.environ.get('TENANT_MODE', '')
+    TENANT_DIR = os.environ.get('TENANT_DIR') or os.path.join(os.path.dirname(DATABASE_PATH), "tenants")
+    TENANT_BASE_DOMAIN = os.environ.get('TENANT_BASE_DOMAIN', '')
+    TENANT_MAX_LOADED = int(os.environ.get('TENANT_MAX_LOADED', 8))
+
+    # 按需剖析（/admin/profile/*）的默认采样间隔（毫秒）与每个 worker 最多剖析的请求数
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
+    PROFILE_MAX_REQUESTS = int(os.environ.get('PROFILE_MAX_REQUESTS', 200))
+
 class DevelopmentConfig(Config):
     """开发环境配置"""
     DEBUG = True
@@ -28,6 +141,7 @@ class ProductionConfig(Config):
     """生产环境配置"""
     DEBUG = False
     TESTING = False
+    USE_BUILT_ASSETS = os.environ.get('USE_BUILT_ASSETS', '1') == '1'
     
     def __init__(self):
         # 将验证移到初始化时，而不是类定义时
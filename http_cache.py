@@ -0,0 +1,181 @@
+"""JSON 响应压缩与 HTTP 缓存校验中间件
+
+- 超过阈值的 JSON 响应用 gzip 压缩，压缩器预先初始化一次，之后每个响应 copy() 复用
+- 可缓存的 GET 接口加上 ETag / Last-Modified，条件请求命中时直接返回 304，不进入视图
+
+数据版本用版本文件的修改时间表示，写入数据的一方提交事务后调用 bump()，
+所有 worker 进程 stat 同一个文件即可得到一致的版本号。
+"""
+import os
+import time
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
+
+
+class VersionStore:
+    """按数据分组（排行榜、答题统计等）记录最后修改时间"""
+
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+
+    def _path(self, group):
+        return os.path.join(self.directory, f"{self.prefix}.{group}.version")
+
+    def get(self, group):
+        """返回版本号（纳秒时间戳），文件不存在时返回 0"""
+        try:
+            return os.stat(self._path(group)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def bump(self, group):
+        """数据已修改，推进版本号（必须在事务提交之后调用）"""
+        path = self._path(group)
+        # 保证版本号严格递增，即使两次写入落在同一时钟刻度内
+        new_ns = max(time.time_ns(), self.get(group) + 1000)
+        try:
+            with open(path, 'a'):
+                pass
+            os.utime(path, ns=(new_ns, new_ns))
+        except OSError as e:
+            print(f"⚠️ 更新缓存版本失败: {group} {e}")
+
+
+class _PrefixedResponse:
+    """先输出已经取出的数据块，再继续原响应的迭代器，close() 转给原响应"""
+
+    def __init__(self, chunks, iterator, app_iter):
+        self.chunks = chunks
+        self.iterator = iterator
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        yield from self.chunks
+        yield from self.iterator
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
+
+
+class CompressionCacheMiddleware:
+    """WSGI 中间件：JSON 压缩 + 条件请求"""
+
+    def __init__(self, app, versions, cacheable, min_size=1024, level=6):
+        # cacheable: [(路径前缀, 数据分组)]，只对 GET/HEAD 生效
+        self.app = app
+        self.versions = versions
+        self.cacheable = cacheable
+        self.min_size = min_size
+        # wbits=31 表示 gzip 格式
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def _cache_group(self, environ):
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return None
+        path = environ.get('PATH_INFO', '')
+        for prefix, group in self.cacheable:
+            if path.startswith(prefix):
+                return group
+        return None
+
+    def _validators(self, environ, group):
+        version = self.versions.get(group)
+        resource = zlib.crc32(f"{environ.get('PATH_INFO', '')}?{environ.get('QUERY_STRING', '')}".encode('utf-8'))
+        etag = f'W/"{group}-{version:x}-{resource:x}"'
+        last_modified = formatdate(version / 1e9, usegmt=True) if version else None
+        return etag, version // 1_000_000_000, last_modified
+
+    @staticmethod
+    def _not_modified(environ, etag, modified_seconds):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # 有 If-None-Match 时忽略 If-Modified-Since
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags or etag[2:] in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since and modified_seconds:
+            try:
+                return modified_seconds <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _accepts_gzip(self, environ):
+        return 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', '').lower()
+
+    def __call__(self, environ, start_response):
+        group = self._cache_group(environ)
+        cache_headers = []
+        if group is not None:
+            etag, modified_seconds, last_modified = self._validators(environ, group)
+            cache_headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+            if last_modified:
+                cache_headers.append(('Last-Modified', last_modified))
+            if self._not_modified(environ, etag, modified_seconds):
+                start_response('304 Not Modified', cache_headers + [('Vary', 'Accept-Encoding')])
+                return [b'']
+
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            return lambda data: captured.setdefault('written', []).append(data)
+
+        app_iter = self.app(environ, capture_start_response)
+        iterator = iter(app_iter)
+        buffered = []
+        # WSGI 允许应用在第一次迭代时才调用 start_response
+        while 'status' not in captured:
+            try:
+                buffered.append(next(iterator))
+            except StopIteration:
+                break
+        if 'status' not in captured:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            raise RuntimeError("应用没有调用 start_response")
+        # 通过 write() 写出的数据在响应体最前面
+        buffered = captured.get('written', []) + buffered
+        status = captured['status']
+        headers = list(captured['headers'])
+        exc_info = captured['exc_info']
+
+        if status.startswith('200'):
+            headers.extend(cache_headers)
+
+        header_names = {name.lower(): value for name, value in headers}
+        compressible = (
+            environ.get('REQUEST_METHOD') != 'HEAD'
+            and status.startswith('200')
+            and header_names.get('content-type', '').startswith('application/json')
+            and 'content-encoding' not in header_names
+            and self._accepts_gzip(environ)
+            and int(header_names.get('content-length') or self.min_size) >= self.min_size
+        )
+        if not compressible:
+            start_response(status, headers, exc_info)
+            if not buffered:
+                return app_iter
+            return _PrefixedResponse(buffered, iterator, app_iter)
+
+        try:
+            body = b''.join(buffered) + b''.join(iterator)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        if len(body) >= self.min_size:
+            compressor = self._compressor.copy()
+            body = compressor.compress(body) + compressor.flush()
+            vary = header_names.get('vary')
+            headers = [(k, v) for k, v in headers if k.lower() != 'vary']
+            headers.append(('Content-Encoding', 'gzip'))
+            headers.append(('Vary', f"{vary}, Accept-Encoding" if vary else 'Accept-Encoding'))
+        headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+        headers.append(('Content-Length', str(len(body))))
+        start_response(status, headers, exc_info)
+        return [body]
@@ -0,0 +1,256 @@
+"""答题日志：先追加写文件，再批量合并进 SQLite
+
+每个 worker 进程写自己的日志文件，答题请求只做一次追加写，不再和其他 worker 争抢 SQLite 的写锁。
+定时任务把日志封存（rename 成 .sealed），再由压缩器在一个大事务里写入 question_stats。
+
+记录格式（小端）：
+    uint32 负载长度 | 负载 | uint32 CRC32(负载)
+负载：question_id int64, user_id int64, 标志位 uint8, is_correct uint8, is_difficult uint8,
+      answer_time float64（NaN 表示空）, created_at float64（Unix 时间），
+      然后是 selected_option、session_id 两个 uint16 长度前缀的 UTF-8 字符串（0xFFFF 表示空）
+
+崩溃恢复：进程意外退出时最后一条记录可能只写了一半，读取时长度或 CRC 不对就停在那里。
+活动日志文件由写入进程持有 flock，压缩器能拿到锁就说明写入进程已经不在了，按孤儿文件合并。
+每个文件合并时在同一事务里记下文件名（journal_compacted 表），合并后、删除前崩溃也不会重复写入；
+启用答题统计分片时按分片分别写入，每个分片一个事务，文件名也记在各自分片里。
+"""
+import math
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，按修改时间判断孤儿文件
+    fcntl = None
+
+FRAME = struct.Struct('<I')
+RECORD = struct.Struct('<qqBBBdd')
+STRING_LEN = struct.Struct('<H')
+NONE_STRING = 0xFFFF
+HAS_USER = 1
+
+INSERT_SQL = """
+    INSERT INTO {schema}.question_stats (question_id, user_id, is_correct, selected_option, answer_time, is_difficult, session_id, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _pack_string(value):
+    if value is None:
+        return STRING_LEN.pack(NONE_STRING)
+    data = str(value).encode('utf-8')[:NONE_STRING - 1]
+    return STRING_LEN.pack(len(data)) + data
+
+
+def _unpack_string(payload, offset):
+    (length,) = STRING_LEN.unpack_from(payload, offset)
+    offset += STRING_LEN.size
+    if length == NONE_STRING:
+        return None, offset
+    return payload[offset:offset + length].decode('utf-8', 'replace'), offset + length
+
+
+def encode_record(question_id, user_id, is_correct, selected_option, answer_time, is_difficult, session_id, created_at):
+    payload = RECORD.pack(
+        int(question_id),
+        int(user_id) if user_id is not None else 0,
+        HAS_USER if user_id is not None else 0,
+        1 if is_correct else 0,
+        1 if is_difficult else 0,
+        float(answer_time) if answer_time is not None else math.nan,
+        created_at
+    ) + _pack_string(selected_option) + _pack_string(session_id)
+    return FRAME.pack(len(payload)) + payload + FRAME.pack(zlib.crc32(payload))
+
+
+def decode_record(payload):
+    """返回与 INSERT_SQL 参数顺序一致的元组，created_at 为 Unix 时间"""
+    question_id, user_id, flags, is_correct, is_difficult, answer_time, created_at = RECORD.unpack_from(payload)
+    selected_option, offset = _unpack_string(payload, RECORD.size)
+    session_id, _ = _unpack_string(payload, offset)
+    return (question_id, user_id if flags & HAS_USER else None, bool(is_correct), selected_option,
+            None if math.isnan(answer_time) else answer_time, bool(is_difficult), session_id, created_at)
+
+
+def read_records(f):
+    """读取一个日志文件中的全部完整记录，遇到写了一半或损坏的记录即停止"""
+    data = f.read()
+    records = []
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        (length,) = FRAME.unpack_from(data, offset)
+        end = offset + FRAME.size + length + FRAME.size
+        if end > len(data):
+            break
+        payload = data[offset + FRAME.size:offset + FRAME.size + length]
+        if FRAME.unpack_from(data, end - FRAME.size)[0] != zlib.crc32(payload):
+            print(f"⚠️ 答题日志记录校验失败，忽略之后的内容: {getattr(f, 'name', '')} @ {offset}")
+            break
+        records.append(decode_record(payload))
+        offset = end
+    return records
+
+
+class AnswerJournal:
+    """当前进程的日志写入器 + 所有进程日志的压缩器"""
+
+    def __init__(self, directory, prefix, fsync_batch=0, orphan_after=300):
+        self.directory = directory
+        self.prefix = prefix
+        self.fsync_batch = fsync_batch      # 每 N 条记录 fsync 一次，0 表示交给操作系统
+        self.orphan_after = orphan_after    # 没有 flock 时，超过这么多秒未修改的活动文件视为孤儿
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._name = None
+        self._seq = 0
+        self._unsynced = 0
+
+    # ---------- 写入 ----------
+    def _open(self):
+        if self._pid != os.getpid():
+            # fork 出来的子进程不能沿用父进程的文件
+            self._file = None
+            self._pid = os.getpid()
+            self._seq = 0
+        if self._file is None:
+            self._name = f"{self.prefix}.{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self._file = open(os.path.join(self.directory, self._name + '.active'), 'ab')
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return self._file
+
+    def append(self, question_id, user_id, is_correct, selected_option, answer_time,
+               is_difficult=False, session_id=None, created_at=None):
+        frame = encode_record(question_id, user_id, is_correct, selected_option, answer_time,
+                              is_difficult, session_id, created_at if created_at is not None else time.time())
+        with self._lock:
+            f = self._open()
+            f.write(frame)
+            f.flush()
+            self._unsynced += 1
+            if self.fsync_batch and self._unsynced >= self.fsync_batch:
+                os.fsync(f.fileno())
+                self._unsynced = 0
+
+    def seal(self):
+        """封存当前活动文件，之后的记录写入新文件；返回封存后的路径"""
+        with self._lock:
+            if self._file is None or self._pid != os.getpid():
+                return None
+            f, name = self._file, self._name
+            self._file = None
+            self._seq += 1
+            f.flush()
+            if self.fsync_batch:
+                os.fsync(f.fileno())
+            self._unsynced = 0
+            sealed = os.path.join(self.directory, f"{name}.{self._seq}.sealed")
+            # 先改名再关闭（释放 flock），压缩器不会把它当成孤儿的活动文件
+            os.replace(os.path.join(self.directory, name + '.active'), sealed)
+            f.close()
+            return sealed
+
+    # ---------- 压缩 ----------
+    def _journal_files(self, suffix):
+        head = self.prefix + '.'
+        return sorted(n for n in os.listdir(self.directory) if n.startswith(head) and n.endswith(suffix))
+
+    def _open_orphan(self, name):
+        """活动文件的写入进程已退出时返回打开的文件（持有锁），否则返回 None"""
+        path = os.path.join(self.directory, name)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return None
+            try:
+                # 加锁前文件可能已被封存改名，这时不是孤儿
+                if os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                    raise FileNotFoundError(path)
+            except FileNotFoundError:
+                f.close()
+                return None
+        elif time.time() - os.fstat(f.fileno()).st_mtime < self.orphan_after:
+            f.close()
+            return None
+        return f
+
+    def pending_sessions(self):
+        """未合并的日志记录中出现的 session_id（包括其他进程正在写入的活动文件）
+
+        先列活动文件再列封存文件：读取期间被封存的文件会出现在第二次列表里，
+        读取前已被合并删除的文件，其记录已经在数据库中。
+        """
+        sessions = set()
+        for name in self._journal_files('.active') + self._journal_files('.sealed'):
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    sessions.update(r[6] for r in read_records(f) if r[6] is not None)
+            except FileNotFoundError:
+                continue
+        return sessions
+
+    def compact(self, db, router=None):
+        """把封存文件和孤儿文件写入 question_stats（每个库一个事务），返回写入的记录数
+
+        router: shards.StatsShardRouter，为 None 时全部写入主库。
+        调用方负责用跨进程锁保证同一时间只有一个压缩器。
+        """
+        schemas = router.schemas() if router is not None else ["main"]
+        done = {schema: {row[0] for row in db.execute(f"SELECT name FROM {schema}.journal_compacted")}
+                for schema in schemas}
+        opened = []
+        for name in self._journal_files('.sealed'):
+            try:
+                opened.append((name, open(os.path.join(self.directory, name), 'rb')))
+            except FileNotFoundError:
+                continue
+        for name in self._journal_files('.active'):
+            f = self._open_orphan(name)
+            if f is not None:
+                opened.append((name, f))
+
+        try:
+            pending = {schema: ([], set()) for schema in schemas}  # 库名 -> (行, 文件名)
+            for name, f in opened:
+                for r in read_records(f):
+                    schema = router.schema(r[0]) if router is not None else "main"
+                    if name in done[schema]:
+                        continue  # 上次已合并，只是没来得及删除
+                    rows, names = pending[schema]
+                    rows.append(r[:7] + (time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(r[7])),))
+                    names.add(name)
+
+            total = 0
+            for schema, (rows, names) in pending.items():
+                if not rows:
+                    continue
+                db.executemany(INSERT_SQL.format(schema=schema), rows)
+                db.executemany(f"INSERT OR IGNORE INTO {schema}.journal_compacted (name) VALUES (?)",
+                               [(n,) for n in names])
+                db.commit()
+                total += len(rows)
+
+            for name, _ in opened:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+            if opened:
+                for schema in schemas:
+                    db.executemany(f"DELETE FROM {schema}.journal_compacted WHERE name = ?", [(n,) for n, _ in opened])
+                db.commit()
+            return total
+        finally:
+            for _, f in opened:
+                f.close()
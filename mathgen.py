@@ -0,0 +1,128 @@
+"""程序生成的数学题
+
+每道题完全由它的 ID 决定：ID = GENERATED_ID_BASE + 种子 * 4 + 难度序号。
+服务端不需要保存生成过的题目，拿到 ID 重新生成一遍就能得到题面和答案，用来判分。
+ID 保持在 2^53 以内，前端 JavaScript 可以按普通数字处理。
+"""
+import random
+
+DIFFICULTIES = ("easy", "medium", "hard", "sadistic")
+GENERATED_ID_BASE = 1 << 52
+SEED_BITS = 48
+CATEGORY = "math"
+
+
+def is_generated_id(qid):
+    try:
+        return int(qid) >= GENERATED_ID_BASE
+    except (TypeError, ValueError):
+        return False
+
+
+def _signed(n):
+    return f"+ {n}" if n >= 0 else f"- {-n}"
+
+
+# ---------- 各难度的题型，返回 (题面, 答案) ----------
+def _easy(rng):
+    kind = rng.randrange(3)
+    if kind == 0:
+        a, b = rng.randint(10, 99), rng.randint(10, 99)
+        return f"\\({a} + {b} = ?\\)", a + b
+    if kind == 1:
+        a, b = sorted((rng.randint(10, 99), rng.randint(10, 99)), reverse=True)
+        return f"\\({a} - {b} = ?\\)", a - b
+    a, b = rng.randint(2, 12), rng.randint(2, 12)
+    return f"\\({a} \\times {b} = ?\\)", a * b
+
+
+def _medium(rng):
+    kind = rng.randrange(3)
+    if kind == 0:
+        a, b, c = rng.randint(3, 19), rng.randint(3, 19), rng.randint(10, 99)
+        return f"\\({a} \\times {b} + {c} = ?\\)", a * b + c
+    if kind == 1:
+        b, q = rng.randint(3, 15), rng.randint(3, 30)
+        return f"\\({b * q} \\div {b} = ?\\)", q
+    a, b, c, d = rng.randint(5, 30), rng.randint(5, 30), rng.randint(2, 9), rng.randint(1, 50)
+    return f"\\(({a} + {b}) \\times {c} - {d} = ?\\)", (a + b) * c - d
+
+
+def _hard(rng):
+    kind = rng.randrange(3)
+    if kind == 0:
+        # ax + b = c，保证 x 为整数
+        a, x, b = rng.randint(2, 12), rng.randint(-20, 20), rng.randint(-50, 50)
+        return f"\\({a}x {_signed(b)} = {a * x + b}\\)，求 \\(x\\)", x
+    if kind == 1:
+        a, b = rng.randint(11, 40), rng.randint(2, 10)
+        return f"\\({a}^2 - {b}^2 = ?\\)", a * a - b * b
+    pct, base = rng.choice((5, 10, 15, 20, 25, 40, 60, 75)), rng.randint(2, 40) * 20
+    return f"\\({base}\\) 的 \\({pct}\\%\\) 是多少？", base * pct // 100
+
+
+def _sadistic(rng):
+    kind = rng.randrange(4)
+    if kind == 0:
+        # (x - r1)(x - r2) = 0 展开后求较大的根
+        r1, r2 = rng.randint(-15, 15), rng.randint(-15, 15)
+        b, c = -(r1 + r2), r1 * r2
+        return f"\\(x^2 {_signed(b)}x {_signed(c)} = 0\\)，求较大的根", max(r1, r2)
+    if kind == 1:
+        x, y = rng.randint(-10, 10), rng.randint(-10, 10)
+        a1, b1, a2, b2 = rng.randint(1, 6), rng.randint(1, 6), rng.randint(1, 6), rng.randint(-6, -1)
+        return (f"\\({a1}x {_signed(b1)}y = {a1 * x + b1 * y}\\)，"
+                f"\\({a2}x {_signed(b2)}y = {a2 * x + b2 * y}\\)，求 \\(x + y\\)"), x + y
+    if kind == 2:
+        a, k, m = rng.randint(2, 19), rng.randint(5, 40), rng.randint(7, 97)
+        return f"\\({a}^{{{k}}} \\bmod {m} = ?\\)", pow(a, k, m)
+    first, step, n = rng.randint(1, 30), rng.randint(2, 9), rng.randint(10, 40)
+    last = first + (n - 1) * step
+    return f"\\({first} + {first + step} + {first + 2 * step} + \\cdots + {last} = ?\\)", n * (first + last) // 2
+
+
+TEMPLATES = {
+    "easy": _easy,
+    "medium": _medium,
+    "hard": _hard,
+    "sadistic": _sadistic,
+}
+
+
+def generate_question(qid):
+    """按 ID 重新生成题目，格式与数据库中的数学题相同；不是生成题的 ID 返回 None"""
+    if not is_generated_id(qid):
+        return None
+    qid = int(qid)
+    seed, tier = divmod(qid - GENERATED_ID_BASE, len(DIFFICULTIES))
+    if seed >= 1 << SEED_BITS:
+        return None
+    difficulty = DIFFICULTIES[tier]
+    text, answer = TEMPLATES[difficulty](random.Random(seed))
+    return {
+        "id": qid,
+        "difficulty": difficulty,
+        "category": CATEGORY,
+        "q": text,
+        "a": str(answer),
+        "type": "math",
+        "opts": []
+    }
+
+
+def generated_meta(qid):
+    """(分类, 难度)，不需要生成题面"""
+    tier = (int(qid) - GENERATED_ID_BASE) % len(DIFFICULTIES)
+    return CATEGORY, DIFFICULTIES[tier]
+
+
+class MathGenerator:
+    """批量出题；rng 只负责挑选种子，每道题用自己的种子生成"""
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def batch(self, difficulty, count):
+        tier = DIFFICULTIES.index(difficulty)
+        seeds = [self.rng.getrandbits(SEED_BITS) for _ in range(count)]
+        return [generate_question(GENERATED_ID_BASE + s * len(DIFFICULTIES) + tier) for s in seeds]
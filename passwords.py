@@ -0,0 +1,128 @@
+"""密码哈希工作池
+
+generate_password_hash / check_password_hash 是 CPU 密集型操作，放到独立的
+有界进程池里执行，避免注册高峰时占满所有请求线程。
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import (
+    generate_password_hash,
+    check_password_hash,
+    DEFAULT_PBKDF2_ITERATIONS,
+)
+
+
+class PasswordPoolBusy(Exception):
+    """哈希池已满、等待结果超时或子进程崩溃，本次请求无法完成"""
+
+
+def normalize_method(method):
+    """把 'scrypt' / 'pbkdf2' 之类的简写补全成哈希字符串里实际存储的前缀"""
+    parts = method.split(':')
+    name = parts[0]
+    if name == 'scrypt':
+        n = parts[1] if len(parts) > 1 else str(2 ** 15)
+        r = parts[2] if len(parts) > 2 else '8'
+        p = parts[3] if len(parts) > 3 else '1'
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2':
+        hash_name = parts[1] if len(parts) > 1 else 'sha256'
+        iterations = parts[2] if len(parts) > 2 else str(DEFAULT_PBKDF2_ITERATIONS)
+        return f"pbkdf2:{hash_name}:{iterations}"
+    return method
+
+
+def method_params(method):
+    """把方法字符串解析成可比较的参数元组，省略默认值或数字写法不同都得到相同结果"""
+    parts = normalize_method(method).split(':')
+    try:
+        if parts[0] == 'scrypt':
+            return ('scrypt', int(parts[1]), int(parts[2]), int(parts[3]))
+        if parts[0] == 'pbkdf2':
+            return ('pbkdf2', parts[1].lower(), int(parts[2]))
+    except (IndexError, ValueError):
+        pass
+    return tuple(parts)
+
+
+class PasswordHasher:
+    """在有界进程池中执行密码哈希，带准入控制"""
+
+    def __init__(self, method='pbkdf2', salt_length=16, workers=2,
+                 max_pending=16, admission_timeout=2.0, result_timeout=10.0):
+        self.method = normalize_method(method)
+        self.params = method_params(self.method)
+        self.salt_length = salt_length
+        self.workers = workers
+        self.admission_timeout = admission_timeout
+        self.result_timeout = result_timeout
+        # 正在执行 + 排队中的任务总数上限
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        # 延迟创建，避免在 gunicorn 主进程预加载时就 fork 出子进程
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _reset_pool(self, pool):
+        """子进程崩溃后进程池不能再用，丢弃它，下次请求时重新创建"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        if not self._slots.acquire(timeout=self.admission_timeout):
+            raise PasswordPoolBusy()
+        pool = self._get_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset_pool(pool)
+            raise PasswordPoolBusy()
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.result_timeout)
+        except FutureTimeoutError:
+            raise PasswordPoolBusy()
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            raise PasswordPoolBusy()
+
+    def hash(self, password):
+        """生成密码哈希"""
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        """校验密码"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """存储的哈希参数或盐长度与当前配置不一致时需要重新哈希
+
+        哈希字符串格式为 方法$盐$哈希值，盐长度即盐部分的字符数。
+        """
+        parts = password_hash.split('$')
+        if len(parts) != 3:
+            return True
+        method, salt, _ = parts
+        return method_params(method) != self.params or len(salt) != self.salt_length
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
@@ -0,0 +1,276 @@
+"""按需请求剖析
+
+管理员指定接口（Flask endpoint 名）和采样比例后，每个 worker 对该接口每 N 个请求剖析一个：
+- sample：后台线程定时读取请求线程的调用栈（sys._current_frames），开销很低，适合线上
+- cprofile：用 cProfile 记录完整调用信息，开销较大，只在明确要求时使用
+
+剖析配置写在文件里，用数据版本通知所有 worker；各 worker 把聚合后的栈写到自己的 .folded 文件，
+查看结果时合并全部文件，输出 collapsed stack（flamegraph.pl / speedscope 可直接读取）或 SVG 火焰图。
+未开启剖析时每个请求只比较一次时间戳，每秒最多检查一次配置文件。
+"""
+import cProfile
+import html
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+MODES = ("sample", "cprofile")
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfiler:
+    def __init__(self, directory, prefix, versions, check_interval=1.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.versions = versions
+        self.check_interval = check_interval
+        self.config = None
+        self._config_version = None
+        self._next_check = 0
+        self._seen = 0          # 本进程内匹配到的请求数
+        self._profiled = 0      # 本进程内已剖析的请求数
+        self.counts = {}        # collapsed stack -> 样本数（cprofile 模式为微秒）
+        self._active = {}       # 正在采样的线程 ident -> 采样间隔（sample 模式）
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._sampler_pid = None
+
+    # ---------- 配置 ----------
+    def _config_path(self):
+        return os.path.join(self.directory, f"{self.prefix}.profile.json")
+
+    def _result_path(self, session_id, pid):
+        return os.path.join(self.directory, f"{self.prefix}.profile.{session_id}.{pid}.folded")
+
+    def _refresh_config(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return self.config
+        self._next_check = now + self.check_interval
+        version = self.versions.get('profile')
+        if version != self._config_version:
+            try:
+                with open(self._config_path(), encoding='utf-8') as f:
+                    config = json.load(f)
+            except (OSError, ValueError):
+                config = None
+            with self._lock:
+                if (config or {}).get("id") != (self.config or {}).get("id"):
+                    self._seen = self._profiled = 0
+                    self.counts = {}
+                self.config = config
+                self._config_version = version
+        return self.config
+
+    def start(self, endpoint, every=10, mode="sample", interval_ms=5, max_requests=100):
+        """开始新一轮剖析，上一轮的结果文件会被删除"""
+        for name in os.listdir(self.directory):
+            if name.startswith(f"{self.prefix}.profile.") and name.endswith('.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        config = {
+            "id": uuid.uuid4().hex[:8],
+            "endpoint": endpoint,
+            "every": max(1, int(every)),
+            "mode": mode,
+            "interval": max(1, int(interval_ms)) / 1000,
+            "max_requests": max(1, int(max_requests)),
+            "started_at": time.time()
+        }
+        tmp_path = f"{self._config_path()}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        os.replace(tmp_path, self._config_path())
+        self.versions.bump('profile')
+        self._next_check = 0
+        return config
+
+    def stop(self):
+        try:
+            os.remove(self._config_path())
+        except FileNotFoundError:
+            pass
+        self.versions.bump('profile')
+        self._next_check = 0
+
+    # ---------- 请求钩子 ----------
+    def begin(self, endpoint):
+        """请求开始时调用；需要剖析时返回令牌，交给 end()"""
+        config = self._refresh_config()
+        if config is None or endpoint != config["endpoint"]:
+            return None
+        with self._lock:
+            self._seen += 1
+            if self._profiled >= config["max_requests"] or (self._seen - 1) % config["every"]:
+                return None
+            self._profiled += 1
+
+        if config["mode"] == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            return ("cprofile", config["id"], profile)
+
+        self._ensure_sampler()
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = config["interval"]
+        self._wakeup.set()
+        return ("sample", config["id"], ident)
+
+    def end(self, token):
+        if token is None:
+            return
+        mode, session_id, handle = token
+        if mode == "cprofile":
+            handle.disable()
+            self._merge_cprofile(handle)
+        else:
+            with self._lock:
+                self._active.pop(handle, None)
+        self._flush(session_id)
+
+    # ---------- 采样 ----------
+    def _ensure_sampler(self):
+        if self._sampler_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sampler_pid == os.getpid():
+                return
+            self._sampler_pid = os.getpid()
+            threading.Thread(target=self._sample_loop, name="profiler", daemon=True).start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in active:
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    key = ";".join(reversed(stack))
+                    self.counts[key] = self.counts.get(key, 0) + 1
+            time.sleep(min(active.values()))
+
+    def _merge_cprofile(self, profile):
+        """cProfile 没有完整调用栈，按 调用者;函数 两层折叠，权重为函数自身耗时（微秒）"""
+        stats = pstats.Stats(profile).stats
+        with self._lock:
+            for (filename, line, name), (_, _, tottime, _, callers) in stats.items():
+                label = f"{name} ({os.path.basename(filename)}:{line})"
+                total = max(1, int(tottime * 1e6))
+                if not callers:
+                    self.counts[label] = self.counts.get(label, 0) + total
+                    continue
+                caller_total = sum(c[2] for c in callers.values()) or 1
+                for (c_file, c_line, c_name), caller_stats in callers.items():
+                    key = f"{c_name} ({os.path.basename(c_file)}:{c_line});{label}"
+                    share = max(1, int(total * caller_stats[2] / caller_total))
+                    self.counts[key] = self.counts.get(key, 0) + share
+
+    def _flush(self, session_id):
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.counts.items()]
+        tmp_path = f"{self._result_path(session_id, os.getpid())}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines))
+            os.replace(tmp_path, self._result_path(session_id, os.getpid()))
+        except OSError as e:
+            print(f"⚠️ 写入剖析结果失败: {e}")
+
+    # ---------- 结果 ----------
+    def status(self):
+        config = self._refresh_config()
+        return {
+            "active": config is not None,
+            "config": config,
+            "process": {"pid": os.getpid(), "seen": self._seen, "profiled": self._profiled}
+        }
+
+    def collapsed(self, session_id=None):
+        """合并所有 worker 的结果：{collapsed stack: 权重}"""
+        if session_id is None:
+            session_id = (self._refresh_config() or {}).get("id")
+        if session_id is None:
+            return {}
+        head = f"{self.prefix}.profile.{session_id}."
+        merged = {}
+        for name in os.listdir(self.directory):
+            if not (name.startswith(head) and name.endswith('.folded')):
+                continue
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack:
+                        merged[stack] = merged.get(stack, 0) + int(count)
+        return merged
+
+
+def render_flamegraph(counts, title="Flame Graph", width=1200, row_height=16):
+    """把 collapsed stacks 渲染成 SVG 火焰图（根在底部）"""
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, count in counts.items():
+        root["value"] += count
+        node = root
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"name": frame, "value": 0, "children": {}})
+            node["value"] += count
+
+    def depth_of(node):
+        return 1 + max((depth_of(c) for c in node["children"].values()), default=0)
+
+    depth = depth_of(root)
+    height = (depth + 2) * row_height
+    total = root["value"] or 1
+    rects = []
+
+    def emit(node, x, level):
+        w = node["value"] / total * width
+        if w < 0.3:
+            return
+        y = height - (level + 1) * row_height
+        hue = 20 + (hash(node["name"]) % 40)
+        label = html.escape(node["name"])
+        pct = node["value"] / total * 100
+        if w > 7 * len(node["name"]):
+            text = label
+        elif w > 30:
+            text = html.escape(node["name"][:int(w / 7) - 2]) + ".."
+        else:
+            text = ""
+        rects.append(
+            f'<g><title>{label} ({node["value"]}, {pct:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{text}</text></g>'
+        )
+        child_x = x
+        for child in sorted(node["children"].values(), key=lambda c: c["name"]):
+            emit(child, child_x, level + 1)
+            child_x += child["value"] / total * width
+
+    emit(root, 0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<text x="{width / 2}" y="{row_height}" text-anchor="middle" font-size="14">{html.escape(title)}</text>'
+        + "".join(rects) + '</svg>'
+    )
@@ -0,0 +1,241 @@
+"""内存映射的只读题库
+
+把 questions 表编译成一个不可变的二进制文件，所有 worker 进程 mmap 同一个文件，
+操作系统只在页缓存里保存一份，进程里不再各自持有一份题目字典。
+
+文件布局（小端）：
+    头部      magic, 格式版本, 题目数, 难度数, 各段偏移, 来源指纹
+    ids       int64[题目数]，按 ID 升序，用二分查找定位题目
+    records   每题一条定长记录：难度序号 + 分类/题干/答案/选项 在字符串区的 (偏移, 长度)
+    order     uint32[题目数]，按难度分组的记录下标，抽题时直接在对应区间里随机取
+    groups    每个难度一条：名称 (偏移, 长度), 在 order 中的起点, 数量
+    blob      UTF-8 字符串区
+
+指纹是全部题目内容的哈希。重新导入或原地修改题目后，worker 的定时检查发现指纹不一致，
+用 compile_bank 生成新文件并 rename 覆盖，SharedQuestionBank 发现文件变化后重新映射，
+旧的映射由已经打开它的请求用完后释放。
+
+命令行：python question_bank.py [数据库路径] [输出路径]
+"""
+import bisect
+import hashlib
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import sys
+
+MAGIC = b'QBNK'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIIIQQQQQI')   # magic, 版本, 题目数, 难度数, ids/records/order/groups/blob 偏移, 指纹长度
+RECORD = struct.Struct('<I8I')           # 难度序号, 分类/题干/答案/选项 各 (偏移, 长度)
+GROUP = struct.Struct('<IIII')           # 名称偏移, 名称长度, 起点, 数量
+OPTION_SEPARATOR = '\x1f'
+
+
+SOURCE_COLUMNS = "id, difficulty, category, question, answer, option_a, option_b, option_c, option_d, option_e"
+
+
+def _source_rows(db):
+    return [tuple(row) for row in db.execute(f"SELECT {SOURCE_COLUMNS} FROM questions ORDER BY id")]
+
+
+def _fingerprint_rows(rows):
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr(row).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def source_fingerprint(db):
+    """题库指纹：全部题目内容的哈希，保持ID不变修改题干、答案或选项也会变化"""
+    return _fingerprint_rows(_source_rows(db))
+
+
+def _align(n, size=8):
+    return (n + size - 1) // size * size
+
+
+def compile_bank(path, questions, fingerprint):
+    """questions: 与 question_to_dict 相同格式的字典；写临时文件后原子替换 path"""
+    questions = sorted(questions, key=lambda q: q["id"])
+    blob = bytearray()
+    strings = {}
+
+    def add_string(text):
+        data = ('' if text is None else str(text)).encode('utf-8')
+        ref = strings.get(data)
+        if ref is None:
+            ref = strings[data] = (len(blob), len(data))
+            blob.extend(data)
+        return ref
+
+    difficulties = sorted({q["difficulty"] or '' for q in questions})
+    difficulty_index = {d: i for i, d in enumerate(difficulties)}
+    records = bytearray()
+    for q in questions:
+        refs = [add_string(q["category"]), add_string(q["q"]), add_string(q["a"]),
+                add_string(OPTION_SEPARATOR.join(q["opts"]))]
+        records += RECORD.pack(difficulty_index[q["difficulty"] or ''], *[x for ref in refs for x in ref])
+
+    order = []
+    groups = bytearray()
+    for d in difficulties:
+        members = [i for i, q in enumerate(questions) if (q["difficulty"] or '') == d]
+        name = add_string(d)
+        groups += GROUP.pack(name[0], name[1], len(order), len(members))
+        order.extend(members)
+
+    fp = fingerprint.encode('utf-8')
+    ids_offset = _align(HEADER.size + len(fp))
+    records_offset = ids_offset + 8 * len(questions)
+    order_offset = _align(records_offset + len(records))
+    groups_offset = _align(order_offset + 4 * len(order))
+    blob_offset = groups_offset + len(groups)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(questions), len(difficulties),
+                            ids_offset, records_offset, order_offset, groups_offset, blob_offset, len(fp)))
+        f.write(fp)
+        f.write(b'\0' * (ids_offset - f.tell()))
+        f.write(struct.pack(f'<{len(questions)}q', *[q["id"] for q in questions]))
+        f.write(records)
+        f.write(b'\0' * (order_offset - f.tell()))
+        f.write(struct.pack(f'<{len(order)}I', *order))
+        f.write(b'\0' * (groups_offset - f.tell()))
+        f.write(groups)
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(questions)
+
+
+class QuestionBank:
+    """一个已映射的题库文件；题目字典按需从映射区解码"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._map)
+        (magic, version, self.count, n_groups, ids_offset, self._records_offset,
+         order_offset, groups_offset, self._blob_offset, fp_len) = HEADER.unpack_from(buf)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"不是题库文件或版本不符: {path}")
+        self.fingerprint = bytes(buf[HEADER.size:HEADER.size + fp_len]).decode('utf-8')
+        self._ids = buf[ids_offset:ids_offset + 8 * self.count].cast('q')
+        self._order = buf[order_offset:order_offset + 4 * self.count].cast('I')
+        self._buf = buf
+
+        self.difficulties = []
+        self.groups = {}  # 难度 -> (起点, 数量)
+        for i in range(n_groups):
+            name_offset, name_len, start, size = GROUP.unpack_from(buf, groups_offset + i * GROUP.size)
+            name = self._string(name_offset, name_len)
+            self.difficulties.append(name)
+            self.groups[name] = (start, size)
+
+    def __len__(self):
+        return self.count
+
+    def _string(self, offset, length):
+        start = self._blob_offset + offset
+        return str(self._buf[start:start + length], 'utf-8')
+
+    def _record(self, index):
+        fields = RECORD.unpack_from(self._buf, self._records_offset + index * RECORD.size)
+        return self.difficulties[fields[0]], fields[1:]
+
+    def _decode(self, index):
+        difficulty, refs = self._record(index)
+        category, text, answer, opts = [self._string(refs[i], refs[i + 1]) for i in range(0, 8, 2)]
+        return {
+            "id": self._ids[index],
+            "difficulty": difficulty,
+            "category": category,
+            "q": text,
+            "a": answer,
+            "type": "choice" if opts else "math",
+            "opts": opts.split(OPTION_SEPARATOR) if opts else []
+        }
+
+    def _index_of(self, qid):
+        try:
+            qid = int(qid)
+        except (TypeError, ValueError):
+            return None
+        i = bisect.bisect_left(self._ids, qid)
+        return i if i < self.count and self._ids[i] == qid else None
+
+    def get(self, qid):
+        index = self._index_of(qid)
+        return self._decode(index) if index is not None else None
+
+    def meta(self, qid):
+        """(分类, 难度)，不解码题干和答案"""
+        index = self._index_of(qid)
+        if index is None:
+            return None
+        difficulty, refs = self._record(index)
+        return self._string(refs[0], refs[1]), difficulty
+
+    def size(self, difficulty):
+        return self.groups.get(difficulty, (0, 0))[1]
+
+    def ids(self, difficulty):
+        start, size = self.groups.get(difficulty, (0, 0))
+        return [self._ids[self._order[i]] for i in range(start, start + size)]
+
+    def sample(self, difficulty, k, rng=random):
+        start, size = self.groups.get(difficulty, (0, 0))
+        picked = rng.sample(range(start, start + size), min(k, size))
+        return [self._decode(self._order[i]) for i in picked]
+
+
+class SharedQuestionBank:
+    """按路径持有当前映射，文件被替换（inode 或修改时间变化）后自动重新映射"""
+
+    def __init__(self, path):
+        self.path = path
+        self._bank = None
+        self._stat_key = None
+
+    def current(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._bank = self._stat_key = None
+            return None
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key != self._stat_key:
+            try:
+                bank = QuestionBank(self.path)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"⚠️ 加载题库映射失败: {e}")
+                return None
+            self._bank, self._stat_key = bank, key
+        return self._bank
+
+
+def _question_dict(row):
+    return {
+        "id": row[0],
+        "difficulty": row[1],
+        "category": row[2],
+        "q": row[3],
+        "a": row[4],
+        "opts": [opt for opt in row[5:] if opt]
+    }
+
+
+def compile_from_db(db, path):
+    # 指纹和题目来自同一次查询，编译期间题目被修改时下次检查会再次编译
+    rows = _source_rows(db)
+    return compile_bank(path, [_question_dict(row) for row in rows], _fingerprint_rows(rows))
+
+
+if __name__ == '__main__':
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'questions.db'
+    out_path = sys.argv[2] if len(sys.argv) > 2 else f"{db_path}.bank"
+    count = compile_from_db(sqlite3.connect(db_path), out_path)
+    print(f"✅ 已编译题库: {out_path}（{count} 题）")
@@ -1,9 +1,35 @@
 from flask import Flask, g, jsonify, request, send_from_directory, render_template, session
-from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3, os, random
-from datetime import datetime
+from werkzeug.middleware.proxy_fix import ProxyFix
+import sqlite3, os, random, mimetypes, threading, json, uuid, base64, heapq, collections, itertools
+from datetime import datetime, timedelta, timezone
 import time
+import atexit
 from dotenv import load_dotenv  # 用于加载.env文件
+from ratelimit import RateLimiter, parse_limits
+from admission import AdmissionController
+from passwords import PasswordHasher, PasswordPoolBusy
+from http_cache import VersionStore, CompressionCacheMiddleware
+from warmstart import file_lock, save_snapshot, load_snapshot
+from ranking import RankIndex, WindowedLeaderboard, DimensionLeaderboard
+from scheduler import Scheduler
+from rooms import RoomManager, utc_timestamp, answers_match
+from challenges import ChallengeCache, ChallengePayload, challenge_seed, pick_question_ids
+from mathgen import MathGenerator, generate_question, generated_meta, is_generated_id
+from wire import wants_columnar, encode_questions, encode_chart_data
+from question_bank import SharedQuestionBank, compile_from_db, source_fingerprint
+from journal import AnswerJournal
+from analytics import AnalyticsSnapshot
+from shards import StatsShardRouter
+from traffic import TrafficRecorder
+from review import ReviewScheduler
+from session_registry import ActiveSessionRegistry
+from tenants import TenantDispatcher, loading_tenant, derive_secret
+from profiler import RequestProfiler, MODES as PROFILE_MODES, render_flamegraph
+
+try:
+    from flask_sock import Sock  # 可选依赖：实时房间需要 WebSocket 支持
+except ImportError:
+    Sock = None
 
 # 加载环境变量（开发环境）
 load_dotenv()
@@ -15,19 +41,126 @@ if env == 'production':
 else:
     from config import DevelopmentConfig as Config
 
-# 创建Flask应用
-app = Flask(__name__)
+# 创建Flask应用（静态文件由下面的路由自行处理）
+app = Flask(__name__, static_folder=None)
 
 # 应用配置
 app.config.from_object(Config)
 app.secret_key = Config.SECRET_KEY  # 或者 app.config['SECRET_KEY']
 
+# 多租户：作为某个租户加载时（见 tenants.py）使用该租户自己的数据库文件和会话密钥
+TENANT = loading_tenant()
+if TENANT is not None:
+    app.config['DATABASE_PATH'] = TENANT.db_path
+    app.config['SNAPSHOT_PATH'] = TENANT.db_path + '.snapshot'
+    app.config['SESSION_COOKIE_NAME'] = f"session_{TENANT.name}"
+    app.secret_key = derive_secret(app.secret_key, TENANT.name)
+
 # 现在使用app.config来获取配置
 ADMIN_USERS = app.config['ADMIN_USERS']
 DB_PATH = app.config['DATABASE_PATH']
 STATIC_PATH = app.config['STATIC_PATH']
 STATIC_NEW_PATH = app.config['STATIC_NEW_PATH']
-
+SNAPSHOT_PATH = app.config['SNAPSHOT_PATH']
+STARTUP_LOCK_PATH = DB_PATH + '.lock'
+QUESTION_BANK_PATH = DB_PATH + '.bank'
+JOURNAL_LOCK_PATH = DB_PATH + '.journal.lock'
+
+# 数据库结构版本，建表/加字段/加索引时递增，启动时落后才执行迁移
+SCHEMA_VERSION = 7
+
+# 答题统计分片路由（未启用时所有表名都指向主库）
+stats_router = StatsShardRouter(DB_PATH, app.config['QUESTION_STATS_SHARDS'])
+
+# 所有 worker 共享的内存映射题库（python question_bank.py 或启动时编译），以及进程内缓存 {榜单类型: (数据版本, 前10名)}
+question_bank = SharedQuestionBank(QUESTION_BANK_PATH)
+leaderboard_cache = {}
+DIST_PATH = os.path.join(STATIC_PATH, 'dist')
+
+# 构建产物（python build_assets.py），启动时读取一次文件列表
+INDEX_TEMPLATE = 'index.html'
+DIST_FILES = set()
+if app.config['USE_BUILT_ASSETS']:
+    if os.path.exists(os.path.join(app.root_path, 'templates', 'dist', 'index.html')) and os.path.isdir(DIST_PATH):
+        INDEX_TEMPLATE = 'dist/index.html'
+        DIST_FILES = set(os.listdir(DIST_PATH))
+    else:
+        print("⚠️ 未找到构建产物，使用未压缩的静态资源（请先运行 python build_assets.py）")
+
+# 定时任务（每个 worker 进程一个后台线程，收到第一个请求时启动）
+scheduler = Scheduler(app)
+
+# 限流器（进程内，按 IP / 用户 / 路由计数）
+rate_limiter = None
+if app.config['RATE_LIMIT_ENABLED']:
+    rate_limiter = RateLimiter(
+        parse_limits(app.config['RATE_LIMITS_SPEC'], app.config['RATE_LIMIT_DEFAULTS']),
+        max_keys=app.config['RATE_LIMIT_MAX_KEYS'],
+        user_keyed=app.config['RATE_LIMIT_USER_KEYED']
+    )
+
+# 密码哈希工作池
+password_hasher = PasswordHasher(
+    method=app.config['PASSWORD_HASH_METHOD'],
+    salt_length=app.config['PASSWORD_SALT_LENGTH'],
+    workers=app.config['PASSWORD_POOL_WORKERS'],
+    max_pending=app.config['PASSWORD_POOL_MAX_PENDING'],
+    admission_timeout=app.config['PASSWORD_POOL_ADMISSION_TIMEOUT']
+)
+
+# 数据版本（用于 ETag / Last-Modified），写入后调用 cache_versions.bump(分组)
+cache_versions = VersionStore(os.path.dirname(DB_PATH), os.path.basename(DB_PATH))
+
+# JSON 压缩与条件请求中间件，可缓存的接口: (路径前缀, 数据分组)
+app.wsgi_app = CompressionCacheMiddleware(
+    app.wsgi_app,
+    cache_versions,
+    cacheable=[
+        ('/api/leaderboard/category/', 'question_stats'),
+        ('/api/leaderboard/difficulty/', 'question_stats'),
+        ('/api/leaderboard/', 'leaderboard'),
+        ('/get_question_chart_data/', 'question_stats'),
+        ('/api/question_chart_data', 'question_stats'),
+    ],
+    min_size=app.config['COMPRESS_MIN_SIZE'],
+    level=app.config['COMPRESS_LEVEL']
+)
+
+
+
+def share_with_tenant(module):
+    """租户应用共用本进程的密码哈希池和限流器"""
+    module.password_hasher = password_hasher
+    module.rate_limiter = rate_limiter
+
+
+# 多租户分发在压缩层之外：每个租户应用有自己的数据版本和压缩/条件请求中间件
+tenant_dispatcher = None
+if TENANT is None and app.config['TENANT_MODE']:
+    tenant_dispatcher = TenantDispatcher(
+        app.wsgi_app,
+        os.path.abspath(__file__),
+        app.config['TENANT_DIR'],
+        app.config['TENANT_MODE'],
+        base_domain=app.config['TENANT_BASE_DOMAIN'],
+        max_loaded=app.config['TENANT_MAX_LOADED'],
+        on_load=share_with_tenant
+    )
+    app.wsgi_app = tenant_dispatcher
+
+# 流量录制放在最外层，记录的耗时包含压缩和 304 处理（租户应用的请求已经在默认应用这一层录制）
+if app.config['TRAFFIC_RECORD_ENABLED'] and TENANT is None:
+    app.wsgi_app = TrafficRecorder(
+        app.wsgi_app,
+        app.config['TRAFFIC_RECORD_DIR'],
+        app.config['TRAFFIC_RECORD_SALT'],
+        max_bytes=app.config['TRAFFIC_RECORD_MAX_BYTES'],
+        backups=app.config['TRAFFIC_RECORD_BACKUPS']
+    )
+
+# 反向代理后面 REMOTE_ADDR 是代理的地址，按配置的代理层数从 X-Forwarded-For 取客户端 IP（限流依赖它）
+if app.config['PROXY_FIX_HOPS'] > 0 and TENANT is None:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'], x_proto=app.config['PROXY_FIX_HOPS'])
 
 
 def is_admin_user():
@@ -48,50 +181,231 @@ def get_db():
         g.db.execute("PRAGMA synchronous=NORMAL;")
         # 添加这行：让查询返回字典形式
         g.db.row_factory = sqlite3.Row
+        stats_router.attach(g.db)
     return g.db
 
 
+# ---------------- 分析快照 ----------------
+analytics_snapshot = None
+if app.config['ANALYTICS_SNAPSHOT_ENABLED']:
+    analytics_snapshot = AnalyticsSnapshot(
+        DB_PATH, DB_PATH + '.analytics', max_age=app.config['ANALYTICS_SNAPSHOT_SECONDS'],
+        attached={f"stats{i}": stats_router.path(i) for i in range(stats_router.count)} if stats_router.enabled else None
+    )
+
+
+def get_analytics_db():
+    """管理和调试类查询使用的只读连接：优先连接分析快照，没有快照时回退到主库"""
+    if "analytics_db" not in g:
+        conn = analytics_snapshot.connect() if analytics_snapshot is not None else None
+        g.analytics_db = conn if conn is not None else get_db()
+    return g.analytics_db
+
+
 @app.teardown_appcontext
 def close_db(exception):
+    analytics_db = g.pop("analytics_db", None)
     db = g.pop("db", None)
+    if analytics_db is not None and analytics_db is not db:
+        analytics_db.close()
     if db is not None:
         db.close()
 
+
+@app.before_request
+def start_scheduler():
+    if app.config['SCHEDULER_ENABLED']:
+        scheduler.ensure_started()
+        health_scheduler.ensure_started()
+
+
+# ---------------- 限流 ----------------
+@app.before_request
+def apply_rate_limit():
+    """在进入视图之前限流，被拒绝的请求不会触碰数据库或密码哈希"""
+    if rate_limiter is None or request.endpoint not in rate_limiter.tables:
+        return None
+
+    allowed, retry_after = rate_limiter.check(
+        request.endpoint, request.remote_addr, session.get('user_id')
+    )
+    if allowed:
+        return None
+
+    response = jsonify({"success": False, "message": "请求过于频繁，请稍后再试"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+# ---------------- 准入控制 ----------------
+admission = None
+if app.config['ADMISSION_ENABLED']:
+    admission = AdmissionController(
+        app.config['ADMISSION_MAX_CONCURRENT'],
+        parse_limits(app.config['ADMISSION_CLASSES_SPEC'], app.config['ADMISSION_CLASS_DEFAULTS'])
+    )
+
+# 对局主流程优先；未列出的接口按 stats 处理，/admin、/debug 开头的按 admin 处理
+ADMISSION_GAMEPLAY = {
+    'get_questions', 'submit_answer', 'start_session', 'end_session', 'login', 'register', 'logout',
+    'get_current_user', 'get_challenge', 'submit_challenge', 'create_room', 'get_room'
+}
+# 不受控：页面、静态文件和长连接
+ADMISSION_EXEMPT = {'index', 'favicon', 'static_files', 'static1_files', 'room_socket', 'healthz', 'readyz'}
+ADMISSION_ADMIN_PREFIXES = ('/admin', '/debug', '/api/debug', '/cleanup_stats')
+
+# 降级用：每个难度最近一批返回的题目，以及被延后写入的答题记录
+last_question_batches = {}
+deferred_answers = collections.deque()
+
+
+def admission_class():
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in ADMISSION_EXEMPT:
+        return None
+    if endpoint in ADMISSION_GAMEPLAY:
+        return 'gameplay'
+    if request.url_rule is not None and request.url_rule.rule.startswith(ADMISSION_ADMIN_PREFIXES):
+        return 'admin'
+    return 'stats'
+
+
+@app.before_request
+def admit_request():
+    """名额不足时按接口降级：题目返回缓存，答题统计延后写入，其余返回 503"""
+    if admission is None:
+        return None
+    cls = admission_class()
+    if cls is None:
+        return None
+    token = admission.acquire(cls)
+    if token is not None:
+        g.admission_token = token
+        return None
+
+    if request.endpoint == 'update_question_stats' and len(deferred_answers) < app.config['ADMISSION_DEFER_MAX']:
+        g.defer_answers = True
+        return None
+    if request.endpoint == 'get_questions' and request.args.get("mode") != "review":
+        data = cached_question_batch()
+        if data is not None:
+            response = jsonify(encode_questions(data)) if wants_columnar(request.args) else jsonify(data)
+            response.headers['X-Degraded'] = 'cached'
+            return response
+
+    response = jsonify({"success": False, "message": "服务器繁忙，请稍后再试"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@app.teardown_request
+def release_admission(exception):
+    token = g.pop("admission_token", None)
+    if token is not None:
+        admission.release(token)
+
+
+# ---------------- 按需剖析 ----------------
+request_profiler = RequestProfiler(os.path.dirname(DB_PATH), os.path.basename(DB_PATH), cache_versions)
+
+
+@app.before_request
+def begin_profiling():
+    """未开启剖析时只做一次时间比较；注册在限流之后，被限流的请求不计入"""
+    g.profile_token = request_profiler.begin(request.endpoint)
+
+
+@app.teardown_request
+def end_profiling(exception):
+    request_profiler.end(g.pop("profile_token", None))
+
 # ---------------- 静态文件 ----------------
+# 预压缩版本，按优先级排列
+PRECOMPRESSED_VARIANTS = [('br', '.br'), ('gzip', '.gz')]
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
 @app.route('/static1/<path:filename>')
 def static1_files(filename):
-    return send_from_directory(STATIC_PATH, filename)
+    return send_from_directory(STATIC_NEW_PATH, filename)
 
 @app.route('/static/<path:filename>')
 def static_files(filename):
-    return send_from_directory(STATIC_NEW_PATH, filename)
+    if filename.startswith('dist/'):
+        return send_built_asset(filename[len('dist/'):])
+    return send_from_directory(STATIC_PATH, filename)
+
+
+def send_built_asset(filename):
+    """发送带哈希的构建产物，按 Accept-Encoding 选择预压缩版本，永久缓存"""
+    if filename not in DIST_FILES:
+        return not_found(None)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = None
+    for encoding, suffix in PRECOMPRESSED_VARIANTS:
+        if request.accept_encodings[encoding] and filename + suffix in DIST_FILES:
+            response = send_from_directory(DIST_PATH, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(DIST_PATH, filename, mimetype=mimetype)
+
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 
 # ---------------- 获取题目 ----------------
-@app.route("/get_questions")
-def get_questions():
-    score = int(request.args.get("score", 0))
-    level = int(request.args.get("level", 0))  # 获取前端传递的level参数
-    limit = int(request.args.get("limit", 50))
+LEVEL_DIFFICULTIES = ["easy", "medium", "hard", "sadistic"]
+QUESTION_COLUMNS = """id, difficulty, category, question, answer,
+               option_a, option_b, option_c, option_d, option_e"""
+
+
+def difficulty_for(score, level):
+    """根据level参数选择难度（优先使用level参数），否则按分数判断"""
+    if 0 <= level < len(LEVEL_DIFFICULTIES):
+        return LEVEL_DIFFICULTIES[level]
+    if score < 100:
+        return "easy"
+    elif score < 200:
+        return "medium"
+    elif score < 300:
+        return "hard"
+    return "sadistic"
+
+
+def question_to_dict(row):
+    """把 questions 表的一行转换成前端使用的格式"""
+    qid, difficulty, category, q, a, oa, ob, oc, od, oe = row
+    qtype = "choice"
+    opts = [opt for opt in [oa, ob, oc, od, oe] if opt]
+    if not opts:
+        qtype = "math"
+    return {
+        "id": qid,
+        "difficulty": difficulty,
+        "category": category,
+        "q": q,
+        "a": a,
+        "type": qtype,
+        "opts": opts
+    }
 
-    # 根据level参数选择难度（优先使用level参数）
-    if level == 0:
-        diff = "easy"
-    elif level == 1:
-        diff = "medium"
-    elif level == 2:
-        diff = "hard"
-    elif level == 3:
-        diff = "sadistic"
-    else:
-        if score < 100:
-            diff = "easy"
-        elif score < 200:
-            diff = "medium"
-        elif score < 300:
+
+def sample_questions(diff, limit):
+    """按难度随机抽取题目，SADISTIC 无题时回退到 HARD
+
+    有题库映射文件时直接从映射中抽取，否则查询数据库。
+    """
+    bank = question_bank.current()
+    if bank is not None:
+        if not bank.size(diff) and diff == "sadistic":
+            print("⚠️ SADISTIC难度无题目，回退到HARD难度")
             diff = "hard"
-        else:
-            diff = "sadistic"
+        return bank.sample(diff, limit)
 
     db = get_db()
     cur = db.cursor()
@@ -102,12 +416,9 @@ def get_questions():
     if total_count == 0 and diff == "sadistic":
         print("⚠️ SADISTIC难度无题目，回退到HARD难度")
         diff = "hard"
-        cur.execute("SELECT COUNT(*) FROM questions WHERE difficulty=?", (diff,))
-        total_count = cur.fetchone()[0]
 
-    cur.execute("""
-        SELECT id, difficulty, category, question, answer,
-               option_a, option_b, option_c, option_d, option_e
+    cur.execute(f"""
+        SELECT {QUESTION_COLUMNS}
         FROM questions
         WHERE difficulty=?
         ORDER BY RANDOM()
@@ -117,28 +428,84 @@ def get_questions():
 
     print(f"📥 实际查询到的题目数: {len(rows)}")
 
+    data = [question_to_dict(r) for r in rows]
+    random.shuffle(data)
+    return data
+
+
+MATH_GENERATOR_RATIO = min(1.0, max(0.0, app.config['MATH_GENERATOR_RATIO']))
+math_generator = MathGenerator(app.config['MATH_GENERATOR_SEED'])
+
+
+def generated_is_correct(qid, selected_option):
+    """生成题由服务端按 ID 重新出题判分，不信任前端传来的结果"""
+    return answers_match(generate_question(qid)["a"], selected_option)
+
+
+# 错题复习卡片（review_cards 表），由 sync_answer_stream 从答题记录增量更新
+review_scheduler = ReviewScheduler(
+    relearn_seconds=app.config['REVIEW_RELEARN_MINUTES'] * 60,
+    hold_seconds=app.config['REVIEW_HOLD_MINUTES'] * 60
+)
+
+
+def review_questions(user_id, limit):
+    """取出当前用户到期的复习题，按到期先后排列"""
+    sync_answer_stream()
+    qids = review_scheduler.pop_due(get_db(), user_id, limit)
+    stored = {q['id']: q for q in load_questions_by_id([qid for qid in qids if not is_generated_id(qid)])}
     data = []
-    for r in rows:
-        qid, difficulty, category, q, a, oa, ob, oc, od, oe = r
-        qtype = "choice"
-        opts = [opt for opt in [oa, ob, oc, od, oe] if opt]
-        if not opts:
-            qtype = "math"
-        data.append({
-            "id": qid,
-            "difficulty": difficulty,
-            "category": category,
-            "q": q,
-            "a": a,
-            "type": qtype,
-            "opts": opts
-        })
+    for qid in qids:
+        question = generate_question(qid) if is_generated_id(qid) else stored.get(qid)
+        if question is not None:
+            data.append(question)
+    return data
 
-    random.shuffle(data)
+
+def cached_question_batch():
+    """过载时使用：当前难度最近一次返回的题目"""
+    score = int(request.args.get("score", 0))
+    level = int(request.args.get("level", 0))
+    return last_question_batches.get(difficulty_for(score, level))
+
+
+@app.route("/get_questions")
+def get_questions():
+    score = int(request.args.get("score", 0))
+    level = int(request.args.get("level", 0))  # 获取前端传递的level参数
+    limit = int(request.args.get("limit", 50))
+
+    if request.args.get("mode") == "review":
+        if 'user_id' not in session:
+            return jsonify({"success": False, "message": "请先登录"}), 401
+        data = review_questions(session['user_id'], limit)
+        print(f"📤 复习模式返回的题目数: {len(data)}")
+        if wants_columnar(request.args):
+            return jsonify(encode_questions(data))
+        return jsonify(data)
+
+    diff = difficulty_for(score, level)
+    generated = int(round(limit * MATH_GENERATOR_RATIO))
+    data = sample_questions(diff, limit - generated) if generated < limit else []
+    if generated:
+        data += math_generator.batch(diff, generated)
+        random.shuffle(data)
+    last_question_batches[diff] = data
     print(f"📤 最终返回的题目数: {len(data)}")
+    if wants_columnar(request.args):
+        return jsonify(encode_questions(data))
     return jsonify(data)
 
 
+@app.route("/api/review")
+def review_summary():
+    """当前用户复习队列的题数和最近一次到期时间（秒级时间戳）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    sync_answer_stream()
+    return jsonify({"success": True, **review_scheduler.summary(get_db(), session['user_id'])})
+
+
 
 
 
@@ -154,7 +521,8 @@ def not_found(e):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # 路径前缀模式下 script_root 为 /t/<租户>，前端请求接口时加上这个前缀
+    return render_template(INDEX_TEMPLATE, base_path=request.script_root)
 
 
 # ---------------- 用户注册 ----------------
@@ -193,7 +561,7 @@ def register():
                 return jsonify({"success": False, "message": "邮箱已被注册"})
         
         # 创建新用户
-        password_hash = generate_password_hash(password)
+        password_hash = password_hasher.hash(password)
         db.execute("""
             INSERT INTO users (username, password_hash, email) 
             VALUES (?, ?, ?)
@@ -202,6 +570,8 @@ def register():
         
         return jsonify({"success": True, "message": "注册成功"})
         
+    except PasswordPoolBusy:
+        return jsonify({"success": False, "message": "服务器繁忙，请稍后再试"}), 503
     except Exception as e:
         return jsonify({"success": False, "message": f"注册失败: {str(e)}"})
 
@@ -226,11 +596,21 @@ def login():
         return jsonify({"success": False, "message": "用户名或密码错误"})
     
     # 使用索引访问：id=0, username=1, password_hash=2, 等等
-    if not check_password_hash(user[2], password):  # password_hash是第3个字段（索引2）
-        return jsonify({"success": False, "message": "用户名或密码错误"})
+    try:
+        if not password_hasher.verify(user[2], password):  # password_hash是第3个字段（索引2）
+            return jsonify({"success": False, "message": "用户名或密码错误"})
+        
+        # 哈希参数已过时则按当前配置重新哈希
+        new_hash = password_hasher.hash(password) if password_hasher.needs_rehash(user[2]) else None
+    except PasswordPoolBusy:
+        return jsonify({"success": False, "message": "服务器繁忙，请稍后再试"}), 503
     
     # 登录成功，更新最后登录时间
-    db.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?", (user[0],))
+    if new_hash:
+        db.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP, password_hash = ? WHERE id = ?", (new_hash, user[0]))
+        print(f"🔑 用户 {user['username']} 的密码哈希已按新参数更新")
+    else:
+        db.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?", (user[0],))
     db.commit()
     
     # 设置会话 - 确保使用正确的字段名
@@ -291,7 +671,7 @@ def get_current_user():
 
 @app.route("/favicon.ico")
 def favicon():
-    return send_from_directory(STATIC_PATH, "favicon.ico")
+    return send_from_directory(STATIC_NEW_PATH, "favicon.ico")
 
 
 @app.route("/submit_answer", methods=["POST"])
@@ -304,17 +684,117 @@ def submit_answer():
     is_correct = bool(data.get("is_correct"))
     selected_option = data.get("selected_option")
     answer_time = data.get("answer_time")
+    if is_generated_id(qid):
+        is_correct = generated_is_correct(qid, selected_option)
     
-    db = get_db()
-    db.execute("""
-        INSERT INTO question_stats (question_id, user_id, is_correct, selected_option, answer_time)
-        VALUES (?, ?, ?, ?, ?)
-    """, (qid, session["user_id"], is_correct, selected_option, answer_time))
-    db.commit()
+    record_answer(qid, session["user_id"], is_correct, selected_option, answer_time)
     
     return jsonify({"success": True})
 
 
+# ---------------- 答题记录写入 ----------------
+answer_journal = None
+if app.config['JOURNAL_ENABLED']:
+    answer_journal = AnswerJournal(
+        os.path.dirname(os.path.abspath(DB_PATH)),
+        os.path.basename(DB_PATH) + '.journal',
+        fsync_batch=app.config['JOURNAL_FSYNC_BATCH']
+    )
+    atexit.register(answer_journal.seal)
+
+
+def record_answer(qid, user_id, is_correct, selected_option, answer_time, is_difficult=False, session_id=None):
+    """写入一条答题记录；启用答题日志时只追加到本进程的日志文件，由定时任务合并进数据库"""
+    session_registry.touch(session_id, user_id)
+    if g.get("defer_answers") and answer_journal is None:
+        # 过载降级：先放进内存队列，由 flush_deferred_answers 批量写入
+        deferred_answers.append((qid, user_id, is_correct, selected_option, answer_time, is_difficult, session_id))
+        return
+    if answer_journal is not None and str(qid).lstrip('-').isdigit():
+        answer_journal.append(qid, user_id, is_correct, selected_option, answer_time, is_difficult, session_id)
+        return
+
+    db = get_db()
+    db.execute(f"""
+        INSERT INTO {stats_router.table(qid)} (question_id, user_id, is_correct, selected_option, answer_time, is_difficult, session_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (qid, user_id, is_correct, selected_option, answer_time, is_difficult, session_id))
+    db.commit()
+    cache_versions.bump('question_stats')
+
+
+deferred_flush_lock = threading.Lock()
+
+
+def flush_deferred_answers():
+    """把过载时延后的答题记录按分片批量写入（定时任务），返回写入条数
+
+    提交成功后才从队列中移除，写入失败（如数据库被锁）时记录留在队列里下次重试。
+    """
+    with deferred_flush_lock:
+        # 其他线程只会在队尾追加，队首的这一批在写入期间不会变化
+        batch = list(itertools.islice(deferred_answers, 5000))
+        if not batch:
+            return 0
+        db = get_db()
+        try:
+            for schema, rows in stats_router.group(batch).items():
+                db.executemany(f"""
+                    INSERT INTO {schema}.question_stats (question_id, user_id, is_correct, selected_option, answer_time, is_difficult, session_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            print(f"⚠️ 写入延后的答题记录失败，稍后重试: {e}")
+            return 0
+        for _ in batch:
+            deferred_answers.popleft()
+    cache_versions.bump('question_stats')
+    print(f"📥 已写入延后的答题记录 {len(batch)} 条")
+    return len(batch)
+
+
+def flush_deferred_answers_at_exit():
+    """进程退出前写入队列中剩余的记录"""
+    with app.app_context():
+        while deferred_answers and flush_deferred_answers():
+            pass
+
+
+if admission is not None:
+    scheduler.every(1, flush_deferred_answers)
+    atexit.register(flush_deferred_answers_at_exit)
+
+
+def compact_answer_journal():
+    """封存本进程的日志，并把所有进程已封存（或写入进程已退出）的日志合并进 question_stats"""
+    answer_journal.seal()
+    with file_lock(JOURNAL_LOCK_PATH):
+        count = answer_journal.compact(get_db(), stats_router)
+    if count:
+        cache_versions.bump('question_stats')
+        print(f"📥 已合并答题日志 {count} 条")
+
+
+if answer_journal is not None:
+    scheduler.every(app.config['JOURNAL_COMPACT_SECONDS'], compact_answer_journal)
+if analytics_snapshot is not None:
+    scheduler.every(60, analytics_snapshot.refresh, name="refresh_analytics_snapshot", run_immediately=True)
+
+
+def is_difficult_answer(selected_option, answer_time):
+    """答题时间超过限时的80%标记为难题：选择题限时15秒，数学题40秒"""
+    if answer_time is None:
+        return False
+    # 根据 selected_option 判断题目类型
+    if selected_option and selected_option in ['A', 'B', 'C', 'D', 'E']:
+        time_limit = 15
+    else:
+        time_limit = 40
+    return answer_time > time_limit * 0.8
+
+
 @app.route("/update_question_stats", methods=["POST"])
 def update_question_stats():
     data = request.get_json()
@@ -326,198 +806,183 @@ def update_question_stats():
 
     if not qid:
         return jsonify(success=False, message="缺少题目ID")
+    if is_generated_id(qid):
+        correct = generated_is_correct(qid, selected_option)
 
-    db = get_db()
-    cur = db.cursor()
-    
     # 获取用户ID（如果已登录）
     user_id = session.get('user_id')
     
     print(f"📝 更新题目统计: 题目ID={qid}, 用户ID={user_id}, 会话ID={session_id}, 用时={answer_time}")
     
     # 所有题目都进行难题标记
-    is_difficult = False
-    if answer_time is not None:
-        # 根据 selected_option 判断题目类型
-        if selected_option and selected_option in ['A', 'B', 'C', 'D', 'E']:
-            question_type = 'choice'
-            time_limit = 15
-        else:
-            question_type = 'math'
-            time_limit = 40
-        
-        # 所有题目都标记难题（答题时间超过限时的80%）
-        if answer_time > time_limit * 0.8:
-            is_difficult = True
-            print(f"🔥 标记为难题: 用时{answer_time}秒 > 阈值{time_limit * 0.8}秒")
+    is_difficult = is_difficult_answer(selected_option, answer_time)
+    if is_difficult:
+        print(f"🔥 标记为难题: 用时{answer_time}秒")
 
     # 插入统计记录（包含用户ID和session_id）
-    cur.execute("""
-        INSERT INTO question_stats (question_id, user_id, is_correct, selected_option, answer_time, is_difficult, session_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (qid, user_id, correct, selected_option, answer_time, is_difficult, session_id))
-    db.commit()
+    record_answer(qid, user_id, correct, selected_option, answer_time, is_difficult, session_id)
     
     print(f"✅ 统计记录插入成功")
 
     return jsonify(success=True)
 
 
-@app.route("/get_question_chart_data/<int:qid>")
-def get_question_chart_data(qid):
+CHART_CHOICE_OPTIONS = ['A', 'B', 'C', 'D', 'E']
+CHART_BATCH_MAX = 100
+
+
+def load_chart_answers(question_ids):
+    """{题目ID: 正确答案}，生成题按 ID 重算，其余优先取题库映射，缺失的一次 IN 查询补齐"""
+    answers = {}
+    missing = []
+    bank = question_bank.current()
+    for qid in question_ids:
+        question = generate_question(qid) if is_generated_id(qid) else (bank.get(qid) if bank is not None else None)
+        if question is not None:
+            answers[qid] = question['a']
+        elif not is_generated_id(qid):
+            missing.append(qid)
+    if missing:
+        placeholders = ','.join(['?'] * len(missing))
+        for row in get_db().execute(f"SELECT id, answer FROM questions WHERE id IN ({placeholders})", missing):
+            answers[row['id']] = row['answer']
+    return answers
+
+
+def build_chart_data(question_ids):
+    """批量计算统计图数据：{题目ID: 数据}，不存在的题目不出现在结果中
+
+    每个分片只执行三条按 question_id 分组的查询（总体、按选项、最近一次用时），
+    查询数与题目数量无关。
+    """
+    answers = load_chart_answers(question_ids)
+    qids = [qid for qid in question_ids if qid in answers]
+    if not qids:
+        return {}
+
+    overall = {}
+    by_option = {qid: {} for qid in qids}
+    recent = {}
     db = get_db()
-    cur = db.cursor()
-
-    # 获取题目基本信息
-    cur.execute("SELECT difficulty, answer FROM questions WHERE id = ?", (qid,))
-    question = cur.fetchone()
-    if not question:
-        return jsonify({"error": "题目不存在"}), 404
-
-    correct_answer = question['answer']
-    
-    # 判断题目类型
-    cur.execute("""
-        SELECT selected_option, COUNT(*) as count
-        FROM question_stats
-        WHERE question_id = ? AND selected_option IS NOT NULL
-        GROUP BY selected_option
-    """, (qid,))
-    option_stats_raw = cur.fetchall()
-    
-    choice_options = ['A', 'B', 'C', 'D', 'E']
-    has_choice_options = any(opt[0] in choice_options for opt in option_stats_raw)
-    question_type = 'choice' if has_choice_options else 'math'
-    
-    # 所有题目类型都使用统一的时间限制判断
-    # 选择题15秒，数学题40秒
-    time_limit = 40 if question_type == 'math' else 15
-
-    # 获取总体统计
-    cur.execute("""
-        SELECT 
-            COUNT(*) AS total,
-            SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) AS correct_count,
-            AVG(answer_time) AS avg_time
-        FROM question_stats
-        WHERE question_id = ?
-    """, (qid,))
-    overall_stats = cur.fetchone()
-
-    overall_avg_time = float(overall_stats['avg_time'] or 0) if overall_stats['avg_time'] else 0
-
-    # 获取选项分布统计
-    option_stats = {}
-    time_stats = {}
-    
-    if question_type == 'choice':
-        # 计算各个选项的分别平均时间
-        options = ['A', 'B', 'C', 'D', 'E']
-        for option in options:
-            # 获取该选项的选择人数
-            cur.execute("""
-                SELECT COUNT(*)
-                FROM question_stats
-                WHERE question_id = ? AND selected_option = ?
-            """, (qid, option))
-            count_row = cur.fetchone()
-            option_count = count_row[0] or 0
-            
-            total_count = overall_stats['total'] or 1
-            percentage = round((option_count / total_count) * 100, 1) if total_count > 0 else 0
-            
-            option_stats[option] = {
-                'count': option_count,
-                'percentage': percentage
+    for schema, group in stats_router.group([(qid,) for qid in qids]).items():
+        table = f"{schema}.question_stats"
+        group_ids = [row[0] for row in group]
+        placeholders = ','.join(['?'] * len(group_ids))
+        for row in db.execute(f"""
+            SELECT question_id,
+                   COUNT(*) AS total,
+                   SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) AS correct_count,
+                   SUM(CASE WHEN NOT is_correct THEN 1 ELSE 0 END) AS wrong_count,
+                   AVG(answer_time) AS avg_time
+            FROM {table}
+            WHERE question_id IN ({placeholders})
+            GROUP BY question_id
+        """, group_ids):
+            overall[row['question_id']] = row
+        for row in db.execute(f"""
+            SELECT question_id, selected_option, COUNT(*) AS count, AVG(answer_time) AS avg_time
+            FROM {table}
+            WHERE question_id IN ({placeholders}) AND selected_option IS NOT NULL
+            GROUP BY question_id, selected_option
+        """, group_ids):
+            by_option[row['question_id']][row['selected_option']] = row
+        # SQLite 中与 MAX() 一起查询的裸列取自最大值所在的行
+        for row in db.execute(f"""
+            SELECT question_id, answer_time, MAX(created_at)
+            FROM {table}
+            WHERE question_id IN ({placeholders}) AND answer_time IS NOT NULL
+            GROUP BY question_id
+        """, group_ids):
+            recent[row['question_id']] = row['answer_time']
+
+    charts = {}
+    for qid in qids:
+        stats = overall.get(qid)
+        total = stats['total'] if stats else 0
+        correct_count = (stats['correct_count'] if stats else 0) or 0
+        overall_avg_time = float(stats['avg_time']) if stats and stats['avg_time'] else 0
+        options = by_option[qid]
+
+        question_type = 'choice' if any(opt in CHART_CHOICE_OPTIONS for opt in options) else 'math'
+        # 选择题15秒，数学题40秒
+        time_limit = 40 if question_type == 'math' else 15
+        total_count = total or 1
+
+        option_stats = {}
+        time_stats = {}
+        if question_type == 'choice':
+            for option in CHART_CHOICE_OPTIONS:
+                row = options.get(option)
+                option_count = row['count'] if row else 0
+                option_stats[option] = {
+                    'count': option_count,
+                    'percentage': round((option_count / total_count) * 100, 1)
+                }
+                time_stats[option] = float(row['avg_time']) if row and row['avg_time'] else 0
+        else:
+            wrong_count = (stats['wrong_count'] if stats else 0) or 0
+            option_stats['正确'] = {'count': correct_count, 'percentage': round((correct_count / total_count) * 100, 1)}
+            option_stats['错误'] = {'count': wrong_count, 'percentage': round((wrong_count / total_count) * 100, 1)}
+            # 数学题所有选项共用总体平均用时
+            time_stats['正确'] = overall_avg_time
+            time_stats['错误'] = overall_avg_time
+
+        # 最近一条有答题时间的记录，超过时间限制的80%标记为难题
+        user_data = None
+        if qid in recent:
+            user_time = float(recent[qid])
+            user_data = {
+                'answer_time': user_time,
+                'is_difficult': user_time > (time_limit * 0.8),
+                'time_threshold': time_limit * 0.8
             }
-            
-            # 计算该选项的平均用时
-            cur.execute("""
-                SELECT AVG(answer_time)
-                FROM question_stats
-                WHERE question_id = ? AND selected_option = ? AND answer_time IS NOT NULL
-            """, (qid, option))
-            time_row = cur.fetchone()
-            option_avg_time = float(time_row[0] or 0) if time_row[0] else 0
-            
-            time_stats[option] = option_avg_time
-    else:
-        # 数学题：统计正确/错误
-        cur.execute("""
-            SELECT 
-                SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct_count,
-                SUM(CASE WHEN NOT is_correct THEN 1 ELSE 0 END) as wrong_count
-            FROM question_stats
-            WHERE question_id = ?
-        """, (qid,))
-        math_stats = cur.fetchone()
-        
-        total_count = overall_stats['total'] or 1
-        correct_count = math_stats['correct_count'] or 0
-        wrong_count = math_stats['wrong_count'] or 0
-        
-        option_stats['正确'] = {
-            'count': correct_count,
-            'percentage': round((correct_count / total_count) * 100, 1) if total_count > 0 else 0
-        }
-        option_stats['错误'] = {
-            'count': wrong_count,
-            'percentage': round((wrong_count / total_count) * 100, 1) if total_count > 0 else 0
-        }
-        
-        # 数学题所有选项共用总体平均用时
-        time_stats['正确'] = overall_avg_time
-        time_stats['错误'] = overall_avg_time
 
-    # 获取当前用户的答题信息 - 所有题目都支持
-    user_data = None
-    
-    # 获取最近一条有答题时间的记录（无论是否登录）
-    cur.execute("""
-        SELECT answer_time, is_difficult
-        FROM question_stats
-        WHERE question_id = ? AND answer_time IS NOT NULL
-        ORDER BY created_at DESC
-        LIMIT 1
-    """, (qid,))
-    recent_record = cur.fetchone()
-    
-    print(f"📊 最近答题记录查询结果: {recent_record}")
-    
-    if recent_record:
-        user_answer_time = recent_record['answer_time']
-        print(f"⏱️ 最近答题时间: {user_answer_time}")
-        
-        user_time = float(user_answer_time)
-        
-        # 所有题目都标记难题（超过时间限制的80%）
-        is_difficult = user_time > (time_limit * 0.8)
-        
-        user_data = {
-            'answer_time': user_time,
-            'is_difficult': is_difficult,
-            'time_threshold': time_limit * 0.8
+        charts[qid] = {
+            "question_type": question_type,
+            "correct_answer": answers[qid],
+            "time_limit": time_limit,
+            "overall_stats": {
+                "total": total,
+                "correct_count": correct_count,
+                "accuracy": round(correct_count / max(total_count, 1) * 100, 1),
+                "avg_time": overall_avg_time
+            },
+            "option_stats": option_stats,
+            "time_stats": time_stats,
+            "user_data": user_data,
+            "overall_avg_time": overall_avg_time
         }
-        print(f"✅ 成功设置用户数据: {user_data}")
-    else:
-        print("❌ 未找到有答题时间的记录")
+    return charts
+
 
-    print(f"📤 最终返回的用户数据: {user_data}")
+@app.route("/get_question_chart_data/<int:qid>")
+def get_question_chart_data(qid):
+    data = build_chart_data([qid]).get(qid)
+    if data is None:
+        return jsonify({"error": "题目不存在"}), 404
+    if wants_columnar(request.args):
+        return jsonify(encode_chart_data(data))
+    return jsonify(data)
 
+
+@app.route("/api/question_chart_data")
+def get_question_chart_data_batch():
+    """一次取多道题的统计图数据：?ids=1,2,3（最多 CHART_BATCH_MAX 个），用于结束后回顾整局"""
+    try:
+        qids = list(dict.fromkeys(int(x) for x in request.args.get("ids", "").split(",") if x.strip()))
+    except ValueError:
+        return jsonify({"success": False, "message": "ids 必须是逗号分隔的题目ID"}), 400
+    if not qids:
+        return jsonify({"success": False, "message": "缺少题目ID"}), 400
+    if len(qids) > CHART_BATCH_MAX:
+        return jsonify({"success": False, "message": f"一次最多 {CHART_BATCH_MAX} 道题"}), 400
+
+    charts = build_chart_data(qids)
+    encode = encode_chart_data if wants_columnar(request.args) else (lambda data: data)
     return jsonify({
-        "question_type": question_type,
-        "correct_answer": correct_answer,
-        "time_limit": time_limit,
-        "overall_stats": {
-            "total": overall_stats['total'] or 0,
-            "correct_count": overall_stats['correct_count'] or 0,
-            "accuracy": round((overall_stats['correct_count'] or 0) / max(overall_stats['total'] or 1, 1) * 100, 1),
-            "avg_time": overall_avg_time
-        },
-        "option_stats": option_stats,
-        "time_stats": time_stats,
-        "user_data": user_data,
-        "overall_avg_time": overall_avg_time
+        "success": True,
+        "charts": {str(qid): encode(data) for qid, data in charts.items()},
+        "missing": [qid for qid in qids if qid not in charts]
     })
 
 
@@ -525,12 +990,23 @@ def get_question_chart_data(qid):
 @app.route("/cleanup_stats")
 def cleanup_stats():
     db = get_db()
-    db.execute("DELETE FROM question_stats WHERE created_at < datetime('now', '-7 days')")
+    for table in stats_router.tables():
+        db.execute(f"DELETE FROM {table} WHERE created_at < datetime('now', '-7 days')")
     db.commit()
+    cache_versions.bump('question_stats')
     return jsonify({"success": True, "message": "清理完毕"})
 
 
 
+# ---------------- 对局开始/结束 ----------------
+session_registry = ActiveSessionRegistry(
+    os.path.dirname(DB_PATH), os.path.basename(DB_PATH),
+    active_window=app.config['SESSION_ACTIVE_WINDOW_SECONDS'],
+    abandon_after=app.config['SESSION_ABANDON_SECONDS']
+)
+SESSION_REAPER_LOCK_PATH = DB_PATH + '.reaper.lock'
+
+
 @app.route("/api/session/start", methods=["POST"])
 def start_session():
     try:
@@ -542,17 +1018,11 @@ def start_session():
         if not session_id:
             return jsonify({"success": False, "message": "缺少会话ID"}), 400
         
-        db = get_db()
-        
-        # 简化检查逻辑
-        existing = db.execute(
-            "SELECT id FROM game_sessions WHERE id = ?", 
-            (session_id,)
-        ).fetchone()
-        
-        if not existing:
+        # 本进程已登记过的对局不再访问数据库；否则直接插入，已存在时忽略
+        if not session_registry.start(session_id, session.get('user_id')):
+            db = get_db()
             db.execute("""
-                INSERT INTO game_sessions (id, user_id, start_time)
+                INSERT OR IGNORE INTO game_sessions (id, user_id, start_time)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
             """, (session_id, session.get('user_id')))
             db.commit()
@@ -579,18 +1049,6 @@ def end_session():
     db = get_db()
     
     try:
-        # 检查会话是否存在
-        session_exists = db.execute(
-            "SELECT id FROM game_sessions WHERE id = ?", 
-            (session_id,)
-        ).fetchone()
-        
-        if not session_exists:
-            return jsonify({
-                "success": False, 
-                "message": "会话不存在，请重新开始游戏"
-            }), 404
-        
         # 确保数据类型正确
         final_score = int(data.get("final_score", 0))
         total_answered = int(data.get("total_answered", 0))
@@ -601,8 +1059,8 @@ def end_session():
         
         print(f"📊 更新会话数据: 分数={final_score}, 最高连对={max_streak_during_game}, 答题数={total_answered}, 正确数={total_correct}, 正确率={accuracy:.2f}%")
         
-        # 更新game_sessions表
-        db.execute("""
+        # 更新game_sessions表，没有更新到行说明会话不存在（可能已被当作放弃的对局清理）
+        updated = db.execute("""
             UPDATE game_sessions 
             SET end_time = CURRENT_TIMESTAMP,
                 final_score = ?,
@@ -611,12 +1069,22 @@ def end_session():
                 total_answered = ?,
                 total_correct = ?
             WHERE id = ?
-        """, (final_score, max_streak_during_game, accuracy, total_answered, total_correct, session_id))
+        """, (final_score, max_streak_during_game, accuracy, total_answered, total_correct, session_id)).rowcount
+        session_registry.finish(session_id)
+        
+        if not updated:
+            return jsonify({
+                "success": False, 
+                "message": "会话不存在，请重新开始游戏"
+            }), 404
         
         # 传递正确的参数数量（6个参数）
         update_leaderboard(session_id, final_score, max_streak_during_game, accuracy, total_answered, max_streak_during_game)
         
         db.commit()
+        cache_versions.bump('leaderboard')
+        cache_versions.bump('sessions')
+        sync_finished_sessions()
         return jsonify({"success": True, "message": "成绩提交成功"})
         
     except Exception as e:
@@ -628,42 +1096,301 @@ def end_session():
         }), 500
 
 
+def reap_abandoned_sessions():
+    """结算或删除超过 SESSION_ABANDON_SECONDS 没有活动的未结束对局（定时任务）
+
+    最后活动时间取最近一条答题记录和各 worker 的进行中对局登记中较晚的一个。
+    没有答题记录的直接删除；有答题记录的按记录汇总答题数和正确率后结束，客户端未上报的分数和连对记为 0。
+    还有记录留在未合并答题日志里的对局这次跳过，等合并进数据库后再处理。
+    多个 worker 同时运行时由文件锁串行化。
+    """
+    if answer_journal is not None:
+        compact_answer_journal()
+    recently_active = session_registry.active_ids()
+
+    with file_lock(SESSION_REAPER_LOCK_PATH):
+        db = get_db()
+        cutoff = db.execute("SELECT datetime('now', ?)", (f"-{app.config['SESSION_ABANDON_SECONDS']} seconds",)).fetchone()[0]
+        ids = [row['id'] for row in db.execute("""
+            SELECT id FROM game_sessions
+            WHERE end_time IS NULL AND start_time < ?
+        """, (cutoff,)).fetchall() if row['id'] not in recently_active]
+        if not ids:
+            return
+
+        # 先读日志再查数据库：读日志期间被合并的记录会出现在之后的查询里
+        in_journal = answer_journal.pending_sessions() if answer_journal is not None else set()
+        ids = [sid for sid in ids if sid not in in_journal]
+        totals = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for table in stats_router.tables():
+                for row in db.execute(f"""
+                    SELECT session_id, COUNT(*) AS answered, SUM(is_correct) AS correct, MAX(created_at) AS last_answer
+                    FROM {table} WHERE session_id IN ({placeholders})
+                    GROUP BY session_id
+                """, chunk):
+                    answered, correct, last_answer = totals.get(row['session_id'], (0, 0, ''))
+                    totals[row['session_id']] = (answered + row['answered'], correct + (row['correct'] or 0),
+                                                 max(last_answer, row['last_answer'] or ''))
+
+        empty = [(sid,) for sid in ids if sid not in totals]
+        # 两小时前开始但最近仍在答题的对局还没有放弃
+        finished = [
+            (correct / answered * 100, answered, correct, sid)
+            for sid, (answered, correct, last_answer) in totals.items()
+            if last_answer < cutoff
+        ]
+        db.executemany("DELETE FROM game_sessions WHERE id = ? AND end_time IS NULL", empty)
+        db.executemany("""
+            UPDATE game_sessions
+            SET end_time = CURRENT_TIMESTAMP, final_score = 0, max_streak = 0,
+                accuracy = ?, total_answered = ?, total_correct = ?
+            WHERE id = ? AND end_time IS NULL
+        """, finished)
+        db.commit()
+
+    if finished:
+        # 结算的对局带有正确率，可能进入日榜/周榜
+        cache_versions.bump('sessions')
+        cache_versions.bump('leaderboard')
+    if empty or finished:
+        print(f"🧹 清理放弃的对局: 删除 {len(empty)} 局，结算 {len(finished)} 局")
+
+
+scheduler.every(session_registry.publish_interval, session_registry.publish, name="publish_active_sessions")
+scheduler.every(300, reap_abandoned_sessions, run_immediately=True)
+
+
+@app.route("/api/live")
+def live_stats():
+    """当前在线对局数和玩家数（最近 SESSION_ACTIVE_WINDOW_SECONDS 秒内开始或答过题）"""
+    return jsonify({"success": True, **session_registry.live()})
+
+
+# ---------------- 历史对局 ----------------
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def page_limit():
+    try:
+        return min(max(int(request.args.get("limit", HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return HISTORY_PAGE_SIZE
+
+
+def encode_cursor(values):
+    """把上一页最后一行的排序键编码成不透明的游标"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """游标无效时返回 None"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) and len(values) == size else None
+
+
+@app.route("/api/me/sessions")
+def my_sessions():
+    """当前用户已结束的对局，按结束时间倒序，?cursor= 取下一页
+
+    键集分页：按 (end_time, id) 从上一页末尾继续，走 idx_game_sessions_user_end，翻到多深每页代价都一样。
+    """
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+
+    limit = page_limit()
+    params = [session['user_id']]
+    after = ""
+    cursor = request.args.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, 2)
+        if values is None:
+            return jsonify({"success": False, "message": "无效的游标"}), 400
+        after = "AND (end_time, id) < (?, ?)"
+        params += values
+
+    rows = get_db().execute(f"""
+        SELECT id, start_time, end_time, final_score, max_streak, accuracy, total_answered, total_correct
+        FROM game_sessions
+        WHERE user_id = ? AND end_time IS NOT NULL {after}
+        ORDER BY end_time DESC, id DESC
+        LIMIT ?
+    """, params + [limit + 1]).fetchall()
+
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor([items[-1]['end_time'], items[-1]['id']]) if len(rows) > limit else None
+    return jsonify({"success": True, "sessions": items, "next_cursor": next_cursor})
+
+
+@app.route("/api/sessions/<session_id>/answers")
+def session_answers(session_id):
+    """某局的逐题记录，按答题时间正序，?cursor= 取下一页
+
+    答题记录按题目分片，同一局的记录分散在各分片里；每个分片按 (created_at, id) 各取一页，
+    再按 (created_at, 分片序号, id) 归并，游标记录这三个值。
+    登录用户的对局只有本人和管理员可以查看，游客对局凭会话ID查看。
+    """
+    row = get_db().execute("SELECT user_id FROM game_sessions WHERE id = ?", (session_id,)).fetchone()
+    if row is None:
+        return jsonify({"success": False, "message": "会话不存在"}), 404
+    if row['user_id'] is not None and row['user_id'] != session.get('user_id') and not is_admin_user():
+        return jsonify({"success": False, "message": "无权查看该对局"}), 403
+
+    limit = page_limit()
+    cursor = None
+    if request.args.get("cursor"):
+        cursor = decode_cursor(request.args["cursor"], 3)
+        if cursor is None or not isinstance(cursor[1], int):
+            return jsonify({"success": False, "message": "无效的游标"}), 400
+
+    db = get_db()
+    pages = []
+    for shard, table in enumerate(stats_router.tables()):
+        params = [session_id]
+        after = ""
+        if cursor is not None:
+            created_at, cursor_shard, cursor_id = cursor
+            if shard < cursor_shard:
+                after = "AND created_at > ?"
+                params.append(created_at)
+            elif shard == cursor_shard:
+                after = "AND (created_at, id) > (?, ?)"
+                params += [created_at, cursor_id]
+            else:
+                after = "AND created_at >= ?"
+                params.append(created_at)
+        rows = db.execute(f"""
+            SELECT id, question_id, is_correct, selected_option, answer_time, is_difficult, created_at
+            FROM {table}
+            WHERE session_id = ? {after}
+            ORDER BY created_at, id
+            LIMIT ?
+        """, params + [limit + 1]).fetchall()
+        pages.append([(r['created_at'], shard, r['id'], r) for r in rows])
+
+    merged = list(heapq.merge(*pages, key=lambda item: item[:3]))
+    page = merged[:limit]
+
+    question_ids = [r['question_id'] for *_, r in page]
+    texts = {q['id']: q for q in load_questions_by_id([qid for qid in question_ids if not is_generated_id(qid)])}
+    answers = []
+    for created_at, shard, row_id, r in page:
+        qid = r['question_id']
+        question = generate_question(qid) if is_generated_id(qid) else texts.get(qid)
+        answers.append({
+            "question_id": qid,
+            "question": question['q'] if question else None,
+            "answer": question['a'] if question else None,
+            "selected_option": r['selected_option'],
+            "is_correct": bool(r['is_correct']),
+            "answer_time": r['answer_time'],
+            "is_difficult": bool(r['is_difficult']),
+            "created_at": created_at
+        })
+    next_cursor = encode_cursor(list(page[-1][:3])) if len(merged) > limit else None
+    return jsonify({"success": True, "session_id": session_id, "answers": answers, "next_cursor": next_cursor})
+
+
+LEADERBOARD_TYPES = ['score', 'streak', 'accuracy']
+LEADERBOARD_WINDOWS = ['day', 'week', 'all']
+# 上榜条件：答题数至少30，且对应指标达到门槛
+LEADERBOARD_MIN_ANSWERED = 30
+LEADERBOARD_MIN_VALUES = {'score': 100, 'streak': 10, 'accuracy': 70}
+
+# 日榜/周榜：按天分桶的滚动榜单，由 sync_finished_sessions 增量更新
+windowed_leaderboard = WindowedLeaderboard(LEADERBOARD_TYPES, k=10)
+LEADERBOARD_UTC_OFFSET = timedelta(hours=app.config['LEADERBOARD_UTC_OFFSET_HOURS'])
+leaderboard_rollover_state = {"day": None}
+
+
+def can_enter_leaderboard(leaderboard_type, value, total_answered):
+    return total_answered >= LEADERBOARD_MIN_ANSWERED and value >= LEADERBOARD_MIN_VALUES[leaderboard_type]
+
+
+def leaderboard_day(utc_time=None):
+    """UTC 时间对应的榜单日期（按配置的时区偏移）"""
+    return ((utc_time or datetime.utcnow()) + LEADERBOARD_UTC_OFFSET).date()
+
+
+def window_days(window):
+    """日榜只有今天，周榜从本周一到今天"""
+    today = leaderboard_day()
+    if window == 'day':
+        return [today]
+    return [today - timedelta(days=i) for i in range(today.weekday() + 1)]
+
+
+def rollover_leaderboard_windows():
+    """跨天时丢弃一周以前的桶（定时任务），只删字典键，不扫描数据"""
+    today = leaderboard_day()
+    if leaderboard_rollover_state["day"] == today:
+        return
+    removed = windowed_leaderboard.prune(today - timedelta(days=6))
+    if leaderboard_rollover_state["day"] is not None:
+        # 日榜内容随日期变化，让已缓存的 ETag 失效
+        cache_versions.bump('leaderboard')
+        print(f"🔄 榜单跨天: {today}，丢弃 {removed} 个过期分桶")
+    leaderboard_rollover_state["day"] = today
+
+
+scheduler.every(60, rollover_leaderboard_windows, run_immediately=True)
+
+
+def query_leaderboard_rows(db, leaderboard_type):
+    """从数据库读取某个榜单的前10名"""
+    # leaderboard_type 已校验，对应的字段名与类型同名
+    query = f"""
+        SELECT username, {leaderboard_type} as value, total_answered, created_at
+        FROM leaderboard 
+        WHERE leaderboard_type = ?
+        ORDER BY value DESC
+        LIMIT 10
+    """
+    return [dict(row) for row in db.execute(query, (leaderboard_type,)).fetchall()]
+
+
+def get_leaderboard_rows(leaderboard_type):
+    """读取榜单前10名，数据版本未变化时直接使用进程内缓存"""
+    # 先取版本再查询，查询期间发生的写入会在下次读取时刷新
+    version = cache_versions.get('leaderboard')
+    cached = leaderboard_cache.get(leaderboard_type)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    rows = query_leaderboard_rows(get_db(), leaderboard_type)
+    leaderboard_cache[leaderboard_type] = (version, rows)
+    print(f"✅ 查询结果: {len(rows)} 条记录")
+    return rows
+
+
 @app.route("/api/leaderboard/<leaderboard_type>")
 def get_leaderboard(leaderboard_type):
-    print(f"📊 获取排行榜: {leaderboard_type}")
+    window = request.args.get("window", "all")
+    print(f"📊 获取排行榜: {leaderboard_type} ({window})")
     
-    if leaderboard_type not in ['score', 'streak', 'accuracy']:
+    if leaderboard_type not in LEADERBOARD_TYPES:
         return jsonify({"error": "Invalid leaderboard type"}), 400
-    
-    db = get_db()
+    if window not in LEADERBOARD_WINDOWS:
+        return jsonify({"error": "Invalid window"}), 400
     
     try:
-        if leaderboard_type == 'score':
-            order_field = 'score'
-        elif leaderboard_type == 'streak':
-            order_field = 'streak' 
-        elif leaderboard_type == 'accuracy':
-            order_field = 'accuracy'
-        
-        # 获取实际的排行榜数据
-        query = f"""
-            SELECT username, {order_field} as value, total_answered, created_at
-            FROM leaderboard 
-            WHERE leaderboard_type = ?
-            ORDER BY value DESC
-            LIMIT 10
-        """
-        
-        print(f"🔍 执行SQL查询: {query}")
-        rows = db.execute(query, (leaderboard_type,)).fetchall()
-        
-        print(f"✅ 查询结果: {len(rows)} 条记录")
+        if window == 'all':
+            rows = get_leaderboard_rows(leaderboard_type)
+        else:
+            sync_finished_sessions()
+            rows = windowed_leaderboard.top(leaderboard_type, window_days(window))
         
         leaderboard_data = []
         
         # 添加实际数据
-        for i, row in enumerate(rows, 1):
-            row_dict = dict(row)
+        for i, row_dict in enumerate(rows, 1):
             leaderboard_data.append({
                 "rank": i,
                 "username": row_dict['username'],
@@ -707,10 +1434,560 @@ def get_leaderboard(leaderboard_type):
         return jsonify({"error": "获取排行榜失败"}), 500
 
 
+# ---------------- 名次与百分位 ----------------
+# 分数、连对按 1 分桶，正确率按 0.1% 分桶
+RANK_METRIC_COLUMNS = {'score': 'final_score', 'streak': 'max_streak', 'accuracy': 'accuracy'}
+rank_index = RankIndex({'score': 1, 'streak': 1, 'accuracy': 0.1})
+# 增量同步水位：已同步的最大 end_time，以及 end_time 恰好等于水位的对局ID
+session_sync_state = {"version": None, "end_time": "", "boundary_ids": set()}
+session_sync_lock = threading.Lock()
+
+
+def sync_finished_sessions():
+    """把上次同步之后结束的对局加入名次索引和日榜/周榜
+
+    其他 worker 结束的对局通过 'sessions' 数据版本感知，只读取 end_time 水位之后的行。
+    """
+    version = cache_versions.get('sessions')
+    if version == session_sync_state["version"]:
+        return
+
+    with session_sync_lock:
+        if version == session_sync_state["version"]:
+            return
+
+        rows = get_db().execute("""
+            SELECT gs.id, gs.user_id, u.username, gs.final_score, gs.max_streak,
+                   gs.accuracy, gs.total_answered, gs.end_time
+            FROM game_sessions gs
+            LEFT JOIN users u ON gs.user_id = u.id
+            WHERE gs.end_time IS NOT NULL AND gs.end_time >= ?
+            ORDER BY gs.end_time
+        """, (session_sync_state["end_time"],)).fetchall()
+        oldest_day = leaderboard_day() - timedelta(days=6)
+
+        watermark = session_sync_state["end_time"]
+        boundary = session_sync_state["boundary_ids"]
+        for row in rows:
+            if row['end_time'] == watermark and row['id'] in boundary:
+                continue
+            values = {metric: row[column] or 0 for metric, column in RANK_METRIC_COLUMNS.items()}
+            rank_index.add_session(row['id'], row['user_id'], values)
+            add_to_windowed_leaderboard(row, values, oldest_day)
+            if row['end_time'] > watermark:
+                watermark = row['end_time']
+                boundary = {row['id']}
+            else:
+                boundary.add(row['id'])
+
+        session_sync_state.update(version=version, end_time=watermark, boundary_ids=boundary)
+
+
+def add_to_windowed_leaderboard(row, values, oldest_day):
+    """把一局结果放进对应日期的分桶，门槛与总榜相同"""
+    day = leaderboard_day(datetime.fromisoformat(row['end_time']))
+    if day < oldest_day:
+        return
+    total_answered = row['total_answered'] or 0
+    eligible = {
+        metric: value for metric, value in values.items()
+        if can_enter_leaderboard(metric, value, total_answered)
+    }
+    if not eligible:
+        return
+    # 与 update_leaderboard 一致：未登录用户显示为 游客+会话ID前6位
+    username = row['username'] if row['user_id'] and row['username'] else f"游客{row['id'][:6]}"
+    windowed_leaderboard.add(day, row['id'], eligible, {
+        "username": username,
+        "total_answered": total_answered,
+        "created_at": row['end_time']
+    })
+
+
+@app.route("/api/rank/<leaderboard_type>")
+def get_rank(leaderboard_type):
+    """查询某局（session_id 参数）或当前用户最好成绩在所有对局中的名次和百分位"""
+    if leaderboard_type not in LEADERBOARD_TYPES:
+        return jsonify({"error": "Invalid leaderboard type"}), 400
+
+    sync_finished_sessions()
+
+    session_id = request.args.get("session_id")
+    if session_id:
+        value = rank_index.session_value(session_id, leaderboard_type)
+    elif 'user_id' in session:
+        value = rank_index.user_best_value(session['user_id'], leaderboard_type)
+    else:
+        return jsonify({"success": False, "message": "请先登录或提供会话ID"}), 400
+
+    if value is None:
+        return jsonify({"success": False, "message": "没有找到已结束的对局"}), 404
+
+    rank, total, percentile = rank_index.rank(leaderboard_type, value)
+    return jsonify({
+        "success": True,
+        "leaderboard_type": leaderboard_type,
+        "value": value,
+        "rank": rank,
+        "total": total,
+        "percentile": percentile
+    })
+
+
+# ---------------- 分类/难度榜 ----------------
+DIMENSIONS = ['category', 'difficulty']
+dimension_leaderboard = DimensionLeaderboard(k=10, min_answered=app.config['DIMENSION_BOARD_MIN_ANSWERED'])
+# 答题流同步水位（每个分片的 question_stats 的 rowid 各自单调递增）
+answer_sync_state = {"version": None, "rowid": {}}
+answer_sync_lock = threading.Lock()
+question_meta_cache = {}   # question_id -> (category, difficulty)
+username_cache = {}        # user_id -> username
+
+
+def question_meta(qid):
+    """题目的 (分类, 难度)：优先取题库映射，否则查一次数据库后缓存"""
+    if is_generated_id(qid):
+        return generated_meta(qid)  # 生成题的 ID 不重复，不放进缓存
+    bank = question_bank.current()
+    meta = bank.meta(qid) if bank is not None else None
+    if meta is not None:
+        return meta
+
+    meta = question_meta_cache.get(qid)
+    if meta is None:
+        row = get_db().execute("SELECT category, difficulty FROM questions WHERE id = ?", (qid,)).fetchone()
+        meta = question_meta_cache[qid] = (row['category'], row['difficulty']) if row else (None, None)
+    return meta
+
+
+def stats_timestamp(created_at):
+    """question_stats.created_at（UTC 字符串）转为时间戳，无法解析时按当前时间"""
+    try:
+        return datetime.fromisoformat(created_at).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def sync_answer_stream():
+    """读取上次同步之后新增的答题记录，累计到分类/难度榜和错题复习队列
+
+    第一次调用时读取全部记录，之后只读 rowid 水位之后的行，不需要连接 questions 和 users 表。
+    同一道题的记录都在同一个分片里，按 rowid 读取即为作答顺序。
+    """
+    version = cache_versions.get('question_stats')
+    if version == answer_sync_state["version"]:
+        return
+
+    with answer_sync_lock:
+        if version == answer_sync_state["version"]:
+            return
+
+        watermarks = answer_sync_state["rowid"]
+        for table in stats_router.tables():
+            last_rowid = watermarks.get(table, 0)
+            cur = get_db().execute(f"""
+                SELECT rowid, question_id, user_id, is_correct, answer_time
+                FROM {table}
+                WHERE rowid > ?
+                ORDER BY rowid
+            """, (last_rowid,))
+            for rowid, qid, user_id, is_correct, answer_time in cur:
+                last_rowid = rowid
+                if user_id is None:
+                    continue
+                category, difficulty = question_meta(qid)
+                dimension_leaderboard.record('category', category, user_id, is_correct, answer_time)
+                dimension_leaderboard.record('difficulty', difficulty, user_id, is_correct, answer_time)
+            watermarks[table] = last_rowid
+
+        # 复习卡片写在数据库里，水位也在数据库里，与本进程的水位无关
+        review_scheduler.sync(get_db(), stats_router.tables(), stats_timestamp)
+
+        answer_sync_state["version"] = version
+
+
+def lookup_usernames(user_ids):
+    """按主键批量读取用户名（只查缓存里没有的）"""
+    missing = [uid for uid in user_ids if uid not in username_cache]
+    if missing:
+        placeholders = ','.join(['?'] * len(missing))
+        for row in get_db().execute(f"SELECT id, username FROM users WHERE id IN ({placeholders})", missing):
+            username_cache[row['id']] = row['username']
+    return {uid: username_cache.get(uid, "---") for uid in user_ids}
+
+
+@app.route("/api/leaderboard/<dimension>/<key>")
+def get_dimension_leaderboard(dimension, key):
+    """分类/难度榜：metric=accuracy（正确率最高）或 speed（平均用时最短）"""
+    metric = request.args.get("metric", "accuracy")
+    if dimension not in DIMENSIONS or metric not in DimensionLeaderboard.METRICS:
+        return jsonify({"error": "Invalid leaderboard"}), 400
+
+    sync_answer_stream()
+    entries = dimension_leaderboard.top(dimension, key, metric)
+    names = lookup_usernames([e["user_id"] for e in entries])
+
+    return jsonify({
+        "dimension": dimension,
+        "key": key,
+        "metric": metric,
+        "keys": dimension_leaderboard.keys(dimension),
+        "data": [{
+            "rank": i,
+            "username": names[e["user_id"]],
+            "value": e["value"],
+            "total_answered": e["answered"]
+        } for i, e in enumerate(entries, 1)]
+    })
+
+
+# ---------------- 实时多人房间 ----------------
+def persist_room_results(room):
+    """房间结束后把所有玩家的成绩和答题记录批量写入数据库（在房间的写库线程中调用）"""
+    with app.app_context():
+        db = get_db()
+        start_time = utc_timestamp(room.started_at or room.created_at)
+        end_time = utc_timestamp(time.time())
+
+        sessions = []
+        answers = []
+        for player in list(room.players.values()):
+            if not player.answered:
+                continue
+            session_id = f"room-{room.id}-{player.key}"
+            accuracy = player.correct / player.answered * 100
+            sessions.append((session_id, player.user_id, start_time, end_time, player.score,
+                             player.max_streak, accuracy, player.answered, player.correct))
+            for qid, is_correct, option, answer_time in player.answers:
+                answers.append((qid, player.user_id, is_correct, option, answer_time,
+                                is_difficult_answer(option, answer_time), session_id))
+
+        if not sessions:
+            return
+
+        db.executemany("""
+            INSERT OR REPLACE INTO game_sessions
+                (id, user_id, start_time, end_time, final_score, max_streak, accuracy, total_answered, total_correct)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, sessions)
+        for schema, rows in stats_router.group(answers).items():
+            db.executemany(f"""
+                INSERT INTO {schema}.question_stats (question_id, user_id, is_correct, selected_option, answer_time, is_difficult, session_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        db.commit()
+
+        # 达到门槛的玩家进入总榜
+        for session_id, _, _, _, score, streak, accuracy, answered, _ in sessions:
+            if any(can_enter_leaderboard(t, v, answered) for t, v in
+                   (('score', score), ('streak', streak), ('accuracy', accuracy))):
+                update_leaderboard(session_id, score, streak, accuracy, answered, streak)
+
+        cache_versions.bump('question_stats')
+        cache_versions.bump('sessions')
+        cache_versions.bump('leaderboard')
+        print(f"✅ 房间 {room.id} 结束: 写入 {len(sessions)} 局成绩、{len(answers)} 条答题记录")
+
+
+room_manager = RoomManager(
+    sample_questions,
+    persist_room_results,
+    tick_seconds=app.config['ROOM_TICK_SECONDS'],
+    reveal_seconds=app.config['ROOM_REVEAL_SECONDS'],
+    max_players=app.config['ROOM_MAX_PLAYERS'],
+    max_rooms=app.config['ROOM_MAX_ROOMS'],
+    send_queue_frames=app.config['ROOM_SEND_QUEUE_FRAMES']
+)
+sock = Sock(app) if Sock is not None and app.config['ROOMS_ENABLED'] else None
+
+
+@app.route("/api/rooms", methods=["POST"])
+def create_room():
+    """创建房间（需要登录），创建者发送 start 消息后开始答题"""
+    if sock is None:
+        return jsonify({"success": False, "message": "实时房间未启用"}), 503
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+
+    data = request.get_json() or {}
+    difficulty = data.get("difficulty", "easy")
+    if difficulty not in LEVEL_DIFFICULTIES:
+        return jsonify({"success": False, "message": "无效的难度"}), 400
+    count = max(1, min(int(data.get("count", 10)), 50))
+    time_limit = max(5, min(int(data.get("time_limit", 15)), 60))
+
+    room = room_manager.create_room(session['user_id'], difficulty, count, time_limit)
+    if room is None:
+        return jsonify({"success": False, "message": "无法创建房间，请稍后再试"}), 503
+    return jsonify({"success": True, **room.summary()})
+
+
+@app.route("/api/rooms/<room_id>")
+def get_room(room_id):
+    room = room_manager.get(room_id)
+    if room is None:
+        return jsonify({"success": False, "message": "房间不存在"}), 404
+    return jsonify({"success": True, **room.summary()})
+
+
+if sock is not None:
+    @sock.route("/ws/room/<room_id>")
+    def room_socket(ws, room_id):
+        """房间 WebSocket：客户端发送 {"type": "answer", "index": n, "option": "B"} 或 {"type": "start"}"""
+        room = room_manager.get(room_id)
+        if room is None:
+            ws.send(json.dumps({"type": "error", "message": "房间不存在"}, ensure_ascii=False))
+            return
+
+        user_id = session.get('user_id')
+        username = session.get('username') or f"游客{uuid.uuid4().hex[:6]}"
+        player = room_manager.join(room, ws, user_id, username)
+        if player is None:
+            ws.send(json.dumps({"type": "error", "message": "房间已满或已结束"}, ensure_ascii=False))
+            return
+
+        try:
+            while True:
+                try:
+                    message = json.loads(ws.receive())
+                except (TypeError, ValueError):
+                    continue
+                message_type = message.get("type")
+                if message_type == "answer":
+                    room_manager.submit_answer(room, player, message.get("index"), message.get("option"))
+                elif message_type == "start":
+                    room_manager.start_room(room, user_id)
+        finally:
+            room_manager.leave(room, player)
+
+
+# ---------------- 每日/每周挑战 ----------------
+CHALLENGE_PERIODS = ['day', 'week']
+CHALLENGE_QUESTION_COUNT = app.config['CHALLENGE_QUESTION_COUNT']
+challenge_cache = ChallengeCache()
+challenge_leaderboard_cache = {}  # (周期, 周期编号, 难度) -> (数据版本, 前10名)
+challenge_starts_seen = set()  # 本进程已写入开始时间的 (周期, 周期编号, 难度, 用户ID)
+
+
+def challenge_period_key(period):
+    """日挑战按日期，周挑战按 ISO 周编号"""
+    today = leaderboard_day()
+    if period == 'day':
+        return today.isoformat()
+    year, week, _ = today.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def load_questions_by_id(question_ids):
+    """按给定顺序读取题目，优先使用题库映射"""
+    bank = question_bank.current()
+    if bank is not None:
+        return [q for q in (bank.get(qid) for qid in question_ids) if q is not None]
+    placeholders = ','.join(['?'] * len(question_ids))
+    rows = get_db().execute(
+        f"SELECT {QUESTION_COLUMNS} FROM questions WHERE id IN ({placeholders})", question_ids
+    ).fetchall() if question_ids else []
+    by_id = {row['id']: question_to_dict(row) for row in rows}
+    return [by_id[qid] for qid in question_ids if qid in by_id]
+
+
+def prepare_challenge(period, difficulty):
+    """取得当前周期的挑战题目，第一次访问时按种子抽题并写入 challenge_sets
+
+    多个 worker 同时抽题时以先写入数据库的为准，之后题库变化也不会改变当期题目。
+    """
+    period_key = challenge_period_key(period)
+    bank = question_bank.current()
+    source = bank.fingerprint if bank is not None else None
+    payload = challenge_cache.get(period, difficulty, period_key, source)
+    if payload is not None:
+        return payload
+
+    db = get_db()
+    select_sql = "SELECT question_ids FROM challenge_sets WHERE period = ? AND period_key = ? AND difficulty = ?"
+    row = db.execute(select_sql, (period, period_key, difficulty)).fetchone()
+    if row is None:
+        source = difficulty
+        if difficulty == 'sadistic' and not db.execute(
+            "SELECT 1 FROM questions WHERE difficulty = 'sadistic' LIMIT 1"
+        ).fetchone():
+            source = 'hard'  # 与 get_questions 一致：SADISTIC 无题时回退到 HARD
+        ids = [r[0] for r in db.execute("SELECT id FROM questions WHERE difficulty = ?", (source,))]
+        picked = pick_question_ids(ids, challenge_seed(period, period_key, difficulty), CHALLENGE_QUESTION_COUNT)
+        db.execute("""
+            INSERT OR IGNORE INTO challenge_sets (period, period_key, difficulty, question_ids)
+            VALUES (?, ?, ?, ?)
+        """, (period, period_key, difficulty, json.dumps(picked)))
+        db.commit()
+        row = db.execute(select_sql, (period, period_key, difficulty)).fetchone()
+        print(f"🎯 生成挑战题目: {period} {period_key} {difficulty} 共 {len(picked)} 题")
+
+    payload = ChallengePayload(period, period_key, difficulty,
+                               load_questions_by_id(json.loads(row['question_ids'])), source)
+    challenge_cache.put(period, difficulty, payload)
+    return payload
+
+
+def record_challenge_start(period, period_key, difficulty, user_id):
+    """记录用户第一次获取本期挑战题目的时间，用时从这里开始计算
+
+    只保留第一次：重新获取题目不会重置计时。本进程写过的不再访问数据库。
+    """
+    key = (period, period_key, difficulty, user_id)
+    if key in challenge_starts_seen:
+        return
+    db = get_db()
+    db.execute("""
+        INSERT OR IGNORE INTO challenge_starts (period, period_key, difficulty, user_id, started_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (*key, time.time()))
+    db.commit()
+    challenge_starts_seen.add(key)
+
+
+def rollover_challenges():
+    """定时任务：周期切换后预先生成所有难度的挑战题目"""
+    for period in CHALLENGE_PERIODS:
+        for difficulty in LEVEL_DIFFICULTIES:
+            prepare_challenge(period, difficulty)
+    current = {period: challenge_period_key(period) for period in CHALLENGE_PERIODS}
+    challenge_starts_seen.difference_update(
+        [key for key in challenge_starts_seen if current.get(key[0]) != key[1]]
+    )
+
+
+scheduler.every(60, rollover_challenges, run_immediately=True)
+
+
+def challenge_difficulty():
+    level = int(request.args.get("level", 0))
+    return LEVEL_DIFFICULTIES[level] if 0 <= level < len(LEVEL_DIFFICULTIES) else None
+
+
+@app.route("/api/challenge/<period>")
+def get_challenge(period):
+    """挑战题目：所有玩家共享同一份预先序列化（并预先压缩）的内容"""
+    difficulty = challenge_difficulty()
+    if period not in CHALLENGE_PERIODS or difficulty is None:
+        return jsonify({"error": "Invalid challenge"}), 400
+
+    payload = prepare_challenge(period, difficulty)
+    if 'user_id' in session:
+        record_challenge_start(period, payload.period_key, difficulty, session['user_id'])
+    if payload.etag in request.headers.get('If-None-Match', ''):
+        response = app.response_class(status=304)
+    elif request.accept_encodings['gzip']:
+        response = app.response_class(payload.gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = app.response_class(payload.body, mimetype='application/json')
+    response.headers['ETag'] = payload.etag
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route("/api/challenge/<period>/submit", methods=["POST"])
+def submit_challenge(period):
+    """提交挑战答案，服务端判分和计时，每个用户每期只保留最好成绩"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    difficulty = challenge_difficulty()
+    if period not in CHALLENGE_PERIODS or difficulty is None:
+        return jsonify({"error": "Invalid challenge"}), 400
+
+    data = request.get_json(silent=True) or {}
+    answers = data.get("answers") if isinstance(data, dict) else None
+    if not isinstance(answers, list) or not all(isinstance(item, dict) for item in answers):
+        return jsonify({"success": False, "message": "答案格式错误"}), 400
+
+    payload = prepare_challenge(period, difficulty)
+    # 用时由服务端计算：从第一次获取本期题目到提交，不信任客户端上报的时间
+    started = get_db().execute("""
+        SELECT started_at FROM challenge_starts
+        WHERE period = ? AND period_key = ? AND difficulty = ? AND user_id = ?
+    """, (period, payload.period_key, difficulty, session['user_id'])).fetchone()
+    if started is None:
+        return jsonify({"success": False, "message": "请先获取挑战题目"}), 400
+    total_time = max(0.0, time.time() - started['started_at'])
+
+    seen = set()
+    correct = 0
+    for item in answers:
+        qid = item.get("id")
+        if not isinstance(qid, int) or qid not in payload.answers or qid in seen:
+            continue
+        seen.add(qid)
+        if answers_match(payload.answers[qid], item.get("answer")):
+            correct += 1
+
+    db = get_db()
+    db.execute("""
+        INSERT INTO challenge_results (period, period_key, difficulty, user_id, username, correct, total_answered, total_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (period, period_key, difficulty, user_id) DO UPDATE SET
+            correct = excluded.correct,
+            total_answered = excluded.total_answered,
+            total_time = excluded.total_time,
+            created_at = CURRENT_TIMESTAMP
+        WHERE excluded.correct > challenge_results.correct
+           OR (excluded.correct = challenge_results.correct AND excluded.total_time < challenge_results.total_time)
+    """, (period, payload.period_key, difficulty, session['user_id'], session.get('username', ''),
+          correct, len(seen), round(total_time, 2)))
+    db.commit()
+    cache_versions.bump('challenge')
+
+    return jsonify({
+        "success": True,
+        "key": payload.period_key,
+        "correct": correct,
+        "total_answered": len(seen),
+        "total_time": round(total_time, 2)
+    })
+
+
+@app.route("/api/challenge/<period>/leaderboard")
+def get_challenge_leaderboard(period):
+    """挑战榜：答对题数多者在前，相同时总用时少者在前"""
+    difficulty = challenge_difficulty()
+    if period not in CHALLENGE_PERIODS or difficulty is None:
+        return jsonify({"error": "Invalid challenge"}), 400
+
+    period_key = challenge_period_key(period)
+    cache_key = (period, period_key, difficulty)
+    version = cache_versions.get('challenge')
+    cached = challenge_leaderboard_cache.get(cache_key)
+    if cached and cached[0] == version:
+        rows = cached[1]
+    else:
+        rows = [dict(row) for row in get_db().execute("""
+            SELECT username, correct, total_answered, total_time, created_at
+            FROM challenge_results
+            WHERE period = ? AND period_key = ? AND difficulty = ?
+            ORDER BY correct DESC, total_time ASC
+            LIMIT 10
+        """, cache_key).fetchall()]
+        # 只保留当前周期
+        for key in [k for k in challenge_leaderboard_cache if k[:2] != cache_key[:2] and k[0] == period]:
+            del challenge_leaderboard_cache[key]
+        challenge_leaderboard_cache[cache_key] = (version, rows)
+
+    return jsonify({
+        "period": period,
+        "key": period_key,
+        "difficulty": difficulty,
+        "data": [dict(row, rank=i) for i, row in enumerate(rows, 1)]
+    })
+
+
 @app.route("/api/debug/leaderboard_data")
 def debug_leaderboard_data():
-    """调试接口：检查排行榜数据"""
-    db = get_db()
+    """调试接口：检查排行榜数据（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    db = get_analytics_db()
     
     # 检查所有排行榜数据
     leaderboard_stats = {}
@@ -739,8 +2016,12 @@ def debug_leaderboard_data():
 
 @app.route("/api/debug/table_structure")
 def debug_table_structure():
-    """检查表结构"""
-    db = get_db()
+    """检查表结构（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    db = get_analytics_db()
     
     tables = ['leaderboard', 'game_sessions']
     table_structures = {}
@@ -781,6 +2062,7 @@ def fix_leaderboard_data():
         """)
         
         db.commit()
+        cache_versions.bump('leaderboard')
         print("✅ 排行榜数据修复完成")
         
     except Exception as e:
@@ -810,9 +2092,9 @@ def update_leaderboard(session_id, score, streak, accuracy, total_answered, max_
         print(f"🔄 更新排行榜: 用户={username}, 分数={score}, 最高连对={max_streak_during_game}, 正确率={accuracy:.1f}%, 答题数={total_answered}")
         
         # 添加上榜条件检测标准：必须答题数超过30
-        can_enter_score = total_answered >= 30 and score >= 100  # 分数榜门槛：30题且100分
-        can_enter_streak = total_answered >= 30 and max_streak_during_game >= 10  # 连对榜门槛：30题且10连对
-        can_enter_accuracy = total_answered >= 30 and accuracy >= 70  # 正确率榜门槛：30题且70%正确率   
+        can_enter_score = can_enter_leaderboard('score', score, total_answered)  # 分数榜门槛：30题且100分
+        can_enter_streak = can_enter_leaderboard('streak', max_streak_during_game, total_answered)  # 连对榜门槛：30题且10连对
+        can_enter_accuracy = can_enter_leaderboard('accuracy', accuracy, total_answered)  # 正确率榜门槛：30题且70%正确率   
         
         print(f"📊 上榜条件检测 - 分数: {can_enter_score}, 连对: {can_enter_streak}, 正确率: {can_enter_accuracy}")
         
@@ -969,6 +2251,7 @@ def keep_top10_only():
             details.append(f"{lb_type}榜: {current_count}→{after_count}条")
         
         db.commit()
+        cache_versions.bump('leaderboard')
         
         if total_deleted > 0:
             message = f"✅ 已强制保留各榜单前10名，共清理了 {total_deleted} 条记录。详情：{' | '.join(details)}"
@@ -986,6 +2269,83 @@ def keep_top10_only():
         return jsonify({"success": False, "message": f"操作失败: {str(e)}"}), 500
 
 
+@app.route("/admin/profile", methods=["GET"])
+def profile_status():
+    """当前剖析配置与本进程的计数（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    return jsonify({"success": True, **request_profiler.status()})
+
+
+@app.route("/admin/profile/start", methods=["POST"])
+def profile_start():
+    """开始剖析某个接口：{"endpoint": "submit_answer", "every": 10, "mode": "sample"}（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+
+    data = request.get_json(silent=True) or {}
+    endpoint = data.get("endpoint")
+    mode = data.get("mode", "sample")
+    if endpoint not in app.view_functions:
+        return jsonify({"success": False, "message": f"未知接口: {endpoint}"}), 400
+    if mode not in PROFILE_MODES:
+        return jsonify({"success": False, "message": f"mode 只能是 {', '.join(PROFILE_MODES)}"}), 400
+    try:
+        config = request_profiler.start(
+            endpoint,
+            every=int(data.get("every", 10)),
+            mode=mode,
+            interval_ms=int(data.get("interval_ms", app.config['PROFILE_SAMPLE_INTERVAL_MS'])),
+            max_requests=int(data.get("max_requests", app.config['PROFILE_MAX_REQUESTS']))
+        )
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "every / interval_ms / max_requests 必须是整数"}), 400
+    print(f"🔬 {session.get('username')} 开始剖析 {endpoint}（{mode}，每 {config['every']} 个请求 1 个）")
+    return jsonify({"success": True, "config": config})
+
+
+@app.route("/admin/profile/stop", methods=["POST"])
+def profile_stop():
+    """停止剖析；已采集的结果保留，可用 ?id= 继续查看（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    session_id = (request_profiler.status()["config"] or {}).get("id")
+    request_profiler.stop()
+    return jsonify({"success": True, "id": session_id})
+
+
+@app.route("/admin/profile/collapsed")
+def profile_collapsed():
+    """collapsed stack 文本，每行 "帧;帧;帧 权重"（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    counts = request_profiler.collapsed(request.args.get("id"))
+    body = "\n".join(f"{stack} {count}" for stack, count in sorted(counts.items()))
+    return app.response_class(body + "\n" if body else "", mimetype="text/plain")
+
+
+@app.route("/admin/profile/flamegraph")
+def profile_flamegraph():
+    """SVG 火焰图（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    session_id = request.args.get("id") or (request_profiler.status()["config"] or {}).get("id")
+    counts = request_profiler.collapsed(session_id)
+    if not counts:
+        return jsonify({"success": False, "message": "暂无剖析数据"}), 404
+    return app.response_class(render_flamegraph(counts, title=f"profile {session_id}"), mimetype="image/svg+xml")
+
+
 def validate_leaderboard_entries_simple():
     """简化版排行榜数据验证"""
     db = get_db()
@@ -1003,6 +2363,7 @@ def validate_leaderboard_entries_simple():
         deleted_count = db.execute("SELECT changes()").fetchone()[0]
         if deleted_count > 0:
             db.commit()
+            cache_versions.bump('leaderboard')
             print(f"✅ 清理了 {deleted_count} 条不达标排行榜记录")
         
         return deleted_count
@@ -1018,15 +2379,23 @@ def validate_leaderboard_entries_simple():
 # 在Flask中添加调试路由
 @app.route("/api/debug/tables")
 def debug_tables():
-    """调试接口：检查表状态"""
-    db = get_db()
+    """调试接口：检查表状态（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    db = get_analytics_db()
     
     tables_to_check = ['game_sessions', 'leaderboard', 'question_stats']
     table_status = {}
     
     for table in tables_to_check:
         try:
-            count = db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if table == 'question_stats' and stats_router.enabled:
+                # 分片快照以相同库名附加在分析连接上，逐个分片计数后汇总
+                count = sum(db.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in stats_router.tables())
+            else:
+                count = db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
             table_status[table] = {
                 'exists': True,
                 'count': count
@@ -1067,7 +2436,14 @@ def optimize_database():
         "CREATE INDEX IF NOT EXISTS idx_leaderboard_streak ON leaderboard(streak DESC)",
         "CREATE INDEX IF NOT EXISTS idx_leaderboard_accuracy ON leaderboard(accuracy DESC)",
         "CREATE INDEX IF NOT EXISTS idx_game_sessions_user ON game_sessions(user_id)",
-        "CREATE INDEX IF NOT EXISTS idx_question_stats_session ON question_stats(session_id)"
+        "CREATE INDEX IF NOT EXISTS idx_question_stats_session ON question_stats(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_game_sessions_end_time ON game_sessions(end_time)",
+        "CREATE INDEX IF NOT EXISTS idx_challenge_results_rank ON challenge_results(period, period_key, difficulty, correct DESC, total_time)",
+        # 历史对局和对局详情的键集分页
+        "CREATE INDEX IF NOT EXISTS idx_game_sessions_user_end ON game_sessions(user_id, end_time, id)",
+        "CREATE INDEX IF NOT EXISTS idx_question_stats_session_created ON question_stats(session_id, created_at)",
+        # 按到期时间取复习题
+        "CREATE INDEX IF NOT EXISTS idx_review_cards_due ON review_cards(user_id, due)"
     ]
     
     for index_sql in indexes:
@@ -1082,8 +2458,12 @@ def optimize_database():
 
 @app.route("/debug/leaderboard_all")
 def debug_leaderboard_all():
-    """查看所有排行榜数据"""
-    db = get_db()
+    """查看所有排行榜数据（仅管理员）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
+    db = get_analytics_db()
     
     try:
         all_data = db.execute("""
@@ -1102,11 +2482,115 @@ def debug_leaderboard_all():
 
 
 
+def ensure_schema():
+    """数据库结构落后于 SCHEMA_VERSION 时执行建表和建索引
+
+    版本记录在 PRAGMA user_version 中，已是最新时只需一次查询；
+    需要迁移时多个 worker 通过文件锁串行，只有第一个真正执行。
+    """
+    db = get_db()
+    if db.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return False
+
+    with file_lock(STARTUP_LOCK_PATH):
+        # 拿到锁后再检查一次，可能已被其他 worker 完成
+        if db.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return False
+
+        init_tables()
+        optimize_database()
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        db.commit()
+        print(f"✅ 数据库结构已更新到版本 {SCHEMA_VERSION}")
+        return True
+
+
+def questions_fingerprint(bank_fingerprint):
+    """快照指纹：结构版本 + 题库映射的内容指纹，题目被修改后快照与映射一起失效"""
+    return (SCHEMA_VERSION, bank_fingerprint)
+
+
+def build_snapshot(db, fingerprint):
+    """构建启动快照：各榜单前10名（题库单独编译成映射文件）"""
+    leaderboard_version = cache_versions.get('leaderboard')
+    leaderboards = {t: query_leaderboard_rows(db, t) for t in LEADERBOARD_TYPES}
+
+    return {
+        "fingerprint": fingerprint,
+        "leaderboard_version": leaderboard_version,
+        "leaderboards": leaderboards
+    }
+
+
+def refresh_question_bank():
+    """题库映射缺失或与 questions 表内容不一致时在文件锁内重新编译（只有一个 worker 编译）"""
+    db = get_db()
+    bank_fingerprint = source_fingerprint(db)
+    bank = question_bank.current()
+    if bank is None or bank.fingerprint != bank_fingerprint:
+        with file_lock(STARTUP_LOCK_PATH):
+            bank = question_bank.current()
+            if bank is None or bank.fingerprint != bank_fingerprint:
+                count = compile_from_db(db, QUESTION_BANK_PATH)
+                print(f"✅ 已编译题库映射: {QUESTION_BANK_PATH}（{count} 题）")
+    return bank_fingerprint
+
+
+def warm_start():
+    """加载题库映射和启动快照，缺失或过期时在文件锁内重建（只有一个 worker 重建）"""
+    db = get_db()
+    fingerprint = questions_fingerprint(refresh_question_bank())
+    snapshot = load_snapshot(SNAPSHOT_PATH)
+
+    if not snapshot or snapshot.get("fingerprint") != fingerprint:
+        with file_lock(STARTUP_LOCK_PATH):
+            snapshot = load_snapshot(SNAPSHOT_PATH)
+            if not snapshot or snapshot.get("fingerprint") != fingerprint:
+                snapshot = build_snapshot(db, fingerprint)
+                save_snapshot(SNAPSHOT_PATH, snapshot)
+                print(f"✅ 已生成启动快照: {SNAPSHOT_PATH}")
+
+    for leaderboard_type, rows in snapshot["leaderboards"].items():
+        leaderboard_cache[leaderboard_type] = (snapshot["leaderboard_version"], rows)
+
+
+# 重新导入或原地修改题目后，由定时检查重新编译题库映射
+if app.config['WARM_START_ENABLED']:
+    scheduler.every(app.config['QUESTION_BANK_CHECK_SECONDS'], refresh_question_bank)
+
+
 def init_tables():
     """初始化数据库表"""
     db = get_db()
     
+    # 新租户的数据库只有 questions 表，用户和答题统计表也在这里创建
     tables_to_create = {
+        'users': """
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                email TEXT,
+                max_score INTEGER DEFAULT 0,
+                max_streak INTEGER DEFAULT 0,
+                max_mistake INTEGER DEFAULT 0,
+                last_login DATETIME,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        'question_stats': """
+            CREATE TABLE question_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question_id INTEGER,
+                user_id INTEGER,
+                is_correct BOOLEAN,
+                selected_option TEXT,
+                answer_time REAL,
+                is_difficult BOOLEAN DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                session_id TEXT
+            )
+        """,
         'game_sessions': """
             CREATE TABLE game_sessions (
                 id TEXT PRIMARY KEY,
@@ -1133,6 +2617,63 @@ def init_tables():
                 leaderboard_type TEXT,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
+        """,
+        'challenge_sets': """
+            CREATE TABLE challenge_sets (
+                period TEXT NOT NULL,
+                period_key TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                question_ids TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (period, period_key, difficulty)
+            )
+        """,
+        'challenge_results': """
+            CREATE TABLE challenge_results (
+                period TEXT NOT NULL,
+                period_key TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                correct INTEGER,
+                total_answered INTEGER,
+                total_time REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (period, period_key, difficulty, user_id)
+            )
+        """,
+        'challenge_starts': """
+            CREATE TABLE challenge_starts (
+                period TEXT NOT NULL,
+                period_key TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                started_at REAL NOT NULL,
+                PRIMARY KEY (period, period_key, difficulty, user_id)
+            )
+        """,
+        'review_cards': """
+            CREATE TABLE review_cards (
+                user_id INTEGER NOT NULL,
+                question_id INTEGER NOT NULL,
+                ease REAL NOT NULL,
+                reps INTEGER NOT NULL,
+                interval REAL NOT NULL,
+                due REAL NOT NULL,
+                PRIMARY KEY (user_id, question_id)
+            )
+        """,
+        'review_sync': """
+            CREATE TABLE review_sync (
+                source TEXT PRIMARY KEY,
+                last_rowid INTEGER NOT NULL
+            )
+        """,
+        'journal_compacted': """
+            CREATE TABLE journal_compacted (
+                name TEXT PRIMARY KEY,
+                compacted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
         """
     }
     
@@ -1162,9 +2703,90 @@ def init_tables():
     db.commit()
 
 
+# ---------------- 健康检查 ----------------
+# 后台定时探测的结果，/readyz 只读这份缓存，不在请求里访问数据库
+health_state = {
+    "database": None,
+    "checked_at": None,
+    "latency_ms": None,
+    "error": None,
+    "schema_version": None,
+    "question_bank": None
+}
+
+
+def probe_health():
+    """用独立连接读取 user_version，确认数据库可访问且结构已迁移（定时任务）"""
+    started = time.perf_counter()
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=1)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        finally:
+            conn.close()
+        health_state.update(database=True, error=None, schema_version=version)
+    except sqlite3.Error as e:
+        health_state.update(database=False, error=str(e))
+    bank = question_bank.current()
+    health_state.update(
+        checked_at=time.time(),
+        latency_ms=round((time.perf_counter() - started) * 1000, 2),
+        question_bank=len(bank) if bank is not None else None
+    )
+
+
+# 探测使用单独的线程：主调度线程上的备份、日志合并等任务可能运行很久，
+# 不能因此让 /readyz 把正常的 worker 判为未就绪
+health_scheduler = Scheduler(app, name="health-probe")
+health_scheduler.every(app.config['HEALTH_PROBE_SECONDS'], probe_health, run_immediately=True)
+
+
+@app.route("/healthz")
+def healthz():
+    """存活检查：进程能处理请求即可，不访问数据库"""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """就绪检查：返回后台探测的数据库状态、结构版本、缓存和写入队列，未就绪时 503"""
+    checked_at = health_state["checked_at"]
+    age = time.time() - checked_at if checked_at is not None else None
+    # 探测线程停止后结果不再更新，过期的结果不能当作就绪
+    stale = app.config['SCHEDULER_ENABLED'] and (age is None or age > 3 * app.config['HEALTH_PROBE_SECONDS'])
+    ready = bool(health_state["database"]) and (health_state["schema_version"] or 0) >= SCHEMA_VERSION and not stale
+
+    body = {
+        "ready": ready,
+        "database": {
+            "ok": health_state["database"],
+            "checked_seconds_ago": round(age, 1) if age is not None else None,
+            "latency_ms": health_state["latency_ms"],
+            "error": health_state["error"]
+        },
+        "schema_version": {"current": health_state["schema_version"], "expected": SCHEMA_VERSION},
+        "caches": {
+            "question_bank": health_state["question_bank"],
+            "leaderboards": len(leaderboard_cache),
+            "rank_index_synced": session_sync_state["version"] is not None,
+            "tenants_loaded": len(tenant_dispatcher.loaded()) if tenant_dispatcher is not None else None
+        },
+        "writer": {
+            "deferred_answers": len(deferred_answers),
+            "journal_enabled": answer_journal is not None
+        },
+        "admission": admission.status() if admission is not None else None
+    }
+    return jsonify(body), 200 if ready else 503
+
+
 @app.route("/debug/status")
 def debug_status():
-    """调试接口：检查应用状态"""
+    """调试接口：检查应用状态（仅管理员，负载均衡的健康检查请用 /healthz 和 /readyz）"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "message": "请先登录"}), 401
+    if not is_admin_user():
+        return jsonify({"success": False, "message": "权限不足，仅管理员可操作"}), 403
     status = {
         "flask_running": True,
         "database_connected": False,
@@ -1173,8 +2795,10 @@ def debug_status():
     }
     
     try:
-        db = get_db()
+        db = get_analytics_db()
         status["database_connected"] = True
+        if analytics_snapshot is not None:
+            status["analytics_snapshot_age"] = analytics_snapshot.age()
         
         # 检查关键表
         tables = ['users', 'questions', 'records', 'question_stats', 'game_sessions', 'leaderboard']
@@ -1201,13 +2825,19 @@ def debug_status():
 
 @app.route("/debug/admin_status")
 def debug_admin_status():
-    """调试接口：检查当前用户的管理员状态"""
+    """调试接口：检查当前用户的管理员状态（仅管理员，返回内容包含管理员名单）"""
     if 'user_id' not in session:
         return jsonify({
             "logged_in": False,
             "is_admin": False,
             "message": "用户未登录"
-        })
+        }), 401
+    if not is_admin_user():
+        return jsonify({
+            "logged_in": True,
+            "is_admin": False,
+            "message": "权限不足，仅管理员可操作"
+        }), 403
     
     username = session.get('username', '')
     is_admin = is_admin_user()
@@ -1239,10 +2869,38 @@ def cleanup_leaderboard_manual():
     except Exception as e:
         return jsonify({"success": False, "message": f"清理失败: {str(e)}"}), 500
 
-# 在应用启动时调用（只调用一次）
+def tenant_busy():
+    """有进行中或还没写库的多人房间时不能卸载"""
+    return room_manager.busy()
+
+
+def release_resources():
+    """租户被淘汰时调用：停止后台线程，封存答题日志、写入延后的答题记录，缓存随模块一起释放"""
+    scheduler.stop()
+    health_scheduler.stop()
+    room_manager.stop()
+    if answer_journal is not None:
+        answer_journal.seal()
+    if admission is not None:
+        flush_deferred_answers_at_exit()
+
+
+# 在应用启动时调用：结构已是最新时只读一次 user_version
 with app.app_context():
-    init_tables()
-    optimize_database()
+    ensure_schema()
+    if stats_router.enabled:
+        with file_lock(STARTUP_LOCK_PATH):
+            stats_router.ensure_schema(get_db())
+    if answer_journal is not None:
+        # 崩溃恢复：合并上次运行留下的日志
+        compact_answer_journal()
+    if app.config['WARM_START_ENABLED']:
+        try:
+            warm_start()
+        except Exception as e:
+            print(f"⚠️ 加载启动快照失败，回退到直接查询数据库: {e}")
+    sync_finished_sessions()
+    probe_health()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,262 @@
+"""名次与百分位索引
+
+对每个指标（分数、连对、正确率）维护一棵按分桶计数的树状数组 (Fenwick tree)，
+插入、删除和"有多少局比它高"都是 O(log N)。
+"""
+import threading
+
+
+class FenwickTree:
+    """计数用树状数组，下标从 0 开始，超出容量时自动扩容"""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def _grow(self, min_size):
+        new_size = self.size
+        while new_size < min_size:
+            new_size *= 2
+        counts = [self.count_at(i) for i in range(self.size)]
+        self.size = new_size
+        self.tree = [0] * (new_size + 1)
+        self.total = 0
+        for i, c in enumerate(counts):
+            if c:
+                self.add(i, c)
+
+    def add(self, index, delta=1):
+        if index >= self.size:
+            self._grow(index + 1)
+        self.total += delta
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index):
+        """下标 0..index（含）的计数之和"""
+        if index < 0:
+            return 0
+        i = min(index, self.size - 1) + 1
+        result = 0
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def count_at(self, index):
+        return self.prefix_sum(index) - self.prefix_sum(index - 1)
+
+    def count_greater(self, index):
+        return self.total - self.prefix_sum(index)
+
+
+class RankIndex:
+    """所有已结束对局的名次索引
+
+    metrics: {指标名: 分桶宽度}，例如正确率按 0.1 分桶。
+    同一对局重复提交时先减去旧值再加入新值，保证计数准确。
+    """
+
+    def __init__(self, metrics):
+        self.bucket_widths = dict(metrics)
+        self.trees = {name: FenwickTree() for name in metrics}
+        self.sessions = {}  # session_id -> (user_id, {指标: 值})
+        self.user_best = {name: {} for name in metrics}
+        self._lock = threading.Lock()
+
+    def _bucket(self, metric, value):
+        return max(0, int(round((value or 0) / self.bucket_widths[metric])))
+
+    def add_session(self, session_id, user_id, values):
+        with self._lock:
+            old = self.sessions.get(session_id)
+            if old is not None:
+                for metric, value in old[1].items():
+                    self.trees[metric].add(self._bucket(metric, value), -1)
+
+            self.sessions[session_id] = (user_id, dict(values))
+            for metric, value in values.items():
+                self.trees[metric].add(self._bucket(metric, value), 1)
+                if user_id is not None:
+                    best = self.user_best[metric]
+                    if value is not None and value > best.get(user_id, float('-inf')):
+                        best[user_id] = value
+
+    def remove_session(self, session_id):
+        with self._lock:
+            old = self.sessions.pop(session_id, None)
+            if old is not None:
+                for metric, value in old[1].items():
+                    self.trees[metric].add(self._bucket(metric, value), -1)
+
+    def rank(self, metric, value):
+        """返回 (名次, 总局数, 百分位)，名次 = 严格更高的局数 + 1"""
+        with self._lock:
+            tree = self.trees[metric]
+            total = tree.total
+            higher = tree.count_greater(self._bucket(metric, value))
+        rank = higher + 1
+        percentile = round((total - higher) / total * 100, 1) if total else 0
+        return rank, total, percentile
+
+    def session_value(self, session_id, metric):
+        entry = self.sessions.get(session_id)
+        return entry[1].get(metric) if entry else None
+
+    def user_best_value(self, user_id, metric):
+        return self.user_best[metric].get(user_id)
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+class TopK:
+    """按值降序保存前 K 条记录，同一个 key 只保留一条
+
+    floor 记录因容量不足被拒绝或挤出的最大值：榜外的记录都不会高于它。
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.entries = []  # [(值, key, 记录)]，降序
+        self.floor = float('-inf')
+
+    def offer(self, key, value, item):
+        self.entries = [e for e in self.entries if e[1] != key]
+        if len(self.entries) >= self.k and value <= self.entries[-1][0]:
+            self.floor = max(self.floor, value)
+            return False
+        # K 很小，线性插入即可；同分时先到的排在前面
+        pos = len(self.entries)
+        while pos > 0 and self.entries[pos - 1][0] < value:
+            pos -= 1
+        self.entries.insert(pos, (value, key, item))
+        if len(self.entries) > self.k:
+            self.floor = max(self.floor, self.entries[-1][0])
+            del self.entries[self.k:]
+        return True
+
+    def items(self):
+        return [item for _, _, item in self.entries]
+
+
+class WindowedLeaderboard:
+    """按天分桶的滚动榜单
+
+    每天每个指标一个 TopK，日榜读当天的桶，周榜合并本周各天的桶
+    （各桶前 K 名的并集里一定包含整体前 K 名），过期的桶整体丢弃，不需要重新扫描。
+    """
+
+    def __init__(self, metrics, k=10):
+        self.metrics = list(metrics)
+        self.k = k
+        self.buckets = {}  # date -> {指标: TopK}
+        self._lock = threading.Lock()
+
+    def add(self, day, key, values, item):
+        """values: {指标: 值}；item: 榜单展示用的记录（dict）"""
+        with self._lock:
+            bucket = self.buckets.get(day)
+            if bucket is None:
+                bucket = self.buckets[day] = {m: TopK(self.k) for m in self.metrics}
+            for metric, value in values.items():
+                if value is not None:
+                    bucket[metric].offer(key, value, dict(item, value=value))
+
+    def top(self, metric, days):
+        with self._lock:
+            merged = TopK(self.k)
+            for day in days:
+                bucket = self.buckets.get(day)
+                if bucket is None:
+                    continue
+                for value, key, item in bucket[metric].entries:
+                    merged.offer(key, value, item)
+        return merged.items()
+
+    def prune(self, oldest_day):
+        """丢弃 oldest_day 之前的桶，返回丢弃的数量"""
+        with self._lock:
+            expired = [day for day in self.buckets if day < oldest_day]
+            for day in expired:
+                del self.buckets[day]
+        return len(expired)
+
+
+class DimensionLeaderboard:
+    """按维度（分类、难度）累计每个玩家的答题数据，维护正确率最高和平均用时最短的前 K 名
+
+    每个 (维度, 取值) 下每个玩家只占 [答题数, 正确数, 用时总和, 计时题数] 四个数。
+    每个榜单保留 2K 名候选，成员成绩下降时原地更新；榜外的人都不高于候选的 floor，
+    所以只要不低于 floor 的候选还有 K 名，前 K 名就是准确的，不够时才从累计数据重建。
+    更新都是 O(K)，重建只在 K 名以上的候选跌出之后发生一次。
+    """
+
+    METRICS = ('accuracy', 'speed')
+
+    def __init__(self, k=10, min_answered=20):
+        self.k = k
+        self.capacity = 2 * k
+        self.min_answered = min_answered
+        self.stats = {}   # (维度, 取值) -> {user_id: [answered, correct, time_sum, timed]}
+        self.boards = {}  # (维度, 取值, 指标) -> TopK
+        self._lock = threading.Lock()
+
+    def _entry(self, user_id, s, metric):
+        """返回 (排序值, 展示记录)，排序值越大越靠前；数据不足时返回 None"""
+        answered, correct, time_sum, timed = s
+        if answered < self.min_answered:
+            return None
+        if metric == 'accuracy':
+            value = round(correct / answered * 100, 1)
+            return value, {"user_id": user_id, "value": value, "answered": answered}
+        if not timed:
+            return None
+        avg_time = round(time_sum / timed, 2)
+        return -avg_time, {"user_id": user_id, "value": avg_time, "answered": answered}
+
+    def _rebuild(self, dimension, key, metric):
+        board = TopK(self.capacity)
+        for user_id, s in self.stats.get((dimension, key), {}).items():
+            entry = self._entry(user_id, s, metric)
+            if entry is not None:
+                board.offer(user_id, entry[0], entry[1])
+        self.boards[(dimension, key, metric)] = board
+
+    def record(self, dimension, key, user_id, is_correct, answer_time):
+        with self._lock:
+            users = self.stats.setdefault((dimension, key), {})
+            s = users.get(user_id)
+            if s is None:
+                s = users[user_id] = [0, 0, 0.0, 0]
+            s[0] += 1
+            if is_correct:
+                s[1] += 1
+            if answer_time is not None:
+                s[2] += float(answer_time)
+                s[3] += 1
+
+            for metric in self.METRICS:
+                entry = self._entry(user_id, s, metric)
+                if entry is None:
+                    continue
+                board_key = (dimension, key, metric)
+                board = self.boards.get(board_key)
+                if board is None:
+                    board = self.boards[board_key] = TopK(self.capacity)
+                board.offer(user_id, entry[0], entry[1])
+                if board.floor > float('-inf') and sum(1 for e in board.entries if e[0] >= board.floor) < self.k:
+                    # 可信的候选不足 K 名，榜外可能有人应当补上
+                    self._rebuild(dimension, key, metric)
+
+    def top(self, dimension, key, metric):
+        with self._lock:
+            board = self.boards.get((dimension, key, metric))
+            return board.items()[:self.k] if board else []
+
+    def keys(self, dimension):
+        with self._lock:
+            return sorted(k for d, k in self.stats if d == dimension and k is not None)
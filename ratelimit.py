@@ -0,0 +1,96 @@
+"""进程内令牌桶限流器
+
+每个键只保存 (令牌数, 上次补充时间) 两个数，表用 OrderedDict 做 LRU，
+超过容量时淘汰最久未访问的键，内存有上界。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketTable:
+    """按键存放令牌桶的 LRU 表"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        # rate: 每秒补充的令牌数；burst: 桶容量
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key, cost=1.0):
+        """尝试扣除令牌，返回 (是否放行, 需要等待的秒数)"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens, last = bucket
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                self._buckets.move_to_end(key)
+
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed = False
+                retry_after = (cost - tokens) / self.rate if self.rate > 0 else 60.0
+
+            # LRU 淘汰
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """按路由配置的限流器，同一路由分别按 IP 和 user_id 计数
+
+    user_keyed 中的路由对已登录用户只按 user_id 计数，未登录时按 IP。
+    """
+
+    def __init__(self, limits, max_keys=10000, user_keyed=()):
+        # limits: {endpoint: (每秒令牌数, 桶容量)}
+        self.tables = {
+            endpoint: TokenBucketTable(rate, burst, max_keys)
+            for endpoint, (rate, burst) in limits.items()
+        }
+        self.user_keyed = set(user_keyed)
+
+    def check(self, endpoint, ip, user_id=None):
+        """检查一次请求，返回 (是否放行, 需要等待的秒数)"""
+        table = self.tables.get(endpoint)
+        if table is None:
+            return True, 0.0
+
+        if user_id is not None and endpoint in self.user_keyed:
+            return table.allow(("user", user_id))
+
+        allowed, retry_after = table.allow(("ip", ip))
+        if allowed and user_id is not None:
+            allowed, retry_after = table.allow(("user", user_id))
+        return allowed, retry_after
+
+
+def parse_limits(spec, defaults):
+    """解析 "endpoint=rate:burst,endpoint=rate:burst" 形式的配置，覆盖默认值"""
+    limits = dict(defaults)
+    if not spec:
+        return limits
+    for item in spec.split(','):
+        item = item.strip()
+        if not item or '=' not in item:
+            continue
+        endpoint, value = item.split('=', 1)
+        try:
+            rate, burst = value.split(':', 1)
+            limits[endpoint.strip()] = (float(rate), float(burst))
+        except ValueError:
+            print(f"⚠️ 忽略无效的限流配置: {item}")
+    return limits
@@ -0,0 +1,282 @@
+"""流量回放：把 traffic.py 录制的请求重新发给一份数据库副本上的 questions.py，统计延迟和错误
+
+用法：
+    # 回放到某个版本的代码，结果写入 JSON
+    python replay.py run traffic/*.log* --app-dir . --db questions.db --speed 4 --out new.json
+    # 比较两次回放结果
+    python replay.py compare old.json new.json
+    # 一步完成：分别在两个目录的代码上回放同一份流量并比较
+    python replay.py ab traffic/*.log* --base ../quiz-old --candidate . --db questions.db
+
+每次回放都先用 SQLite 备份 API 把数据库复制到临时目录，原库不受影响；
+副本中的用户名、邮箱换成与录制时相同的加盐化名（盐取 --salt，默认 TRAFFIC_RECORD_SALT / SECRET_KEY），
+密码统一改为 REPLAY_PASSWORD，录制前就已注册的玩家回放登录时也能成功。
+两个版本收到完全相同的请求序列，随机数种子也相同。
+speed=1 按录制时的时间间隔发送，speed=N 加速 N 倍，speed=0 不等待。
+同一客户端的请求按顺序在同一个 Cookie 罐里发送，不同客户端并发。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from traffic import REPLAY_PASSWORD, TrafficRecorder
+
+DEFAULT_SALT = 'dev-key-change-in-production'  # 与 config.py 中 SECRET_KEY 的默认值一致
+# 状态码与录制时不同的请求超过这个比例时，对比结果视为不可信
+MISMATCH_TOLERANCE = 0.01
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # 滚动时被截断的行
+    records.sort(key=lambda r: r["t"])
+    return records
+
+
+def copy_database(src, dest):
+    source = sqlite3.connect(src)
+    target = sqlite3.connect(dest)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def pseudonymize_users(db_path, recorder):
+    """把副本中的用户改成录制时的化名和回放密码，返回改写的用户数"""
+    password_hash = generate_password_hash(REPLAY_PASSWORD, os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2')
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.create_function("pseudonym", 1, lambda value: f"u{recorder.pseudonym(value)}" if value else value)
+        count = conn.execute(
+            "UPDATE users SET username = pseudonym(username), email = pseudonym(email), password_hash = ?",
+            (password_hash,)
+        ).rowcount
+        # 榜单里冗余存放的用户名也一起改，显示的名字与 users 表一致
+        for table in ("leaderboard", "challenge_results"):
+            try:
+                conn.execute(f"UPDATE {table} SET username = pseudonym(username)")
+            except sqlite3.OperationalError:
+                pass
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    """samples: [(接口, 状态码, 录制时状态码, 毫秒)] -> {接口: 统计}"""
+    by_endpoint = {}
+    for endpoint, status, recorded_status, ms in samples:
+        by_endpoint.setdefault(endpoint, []).append((status, recorded_status, ms))
+    summary = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = sorted(ms for _, _, ms in rows)
+        summary[endpoint] = {
+            "count": len(rows),
+            "errors": sum(1 for status, _, _ in rows if status >= 500),
+            "status_mismatches": sum(1 for status, recorded, _ in rows if status != recorded),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2)
+        }
+    return summary
+
+
+def run_replay(args):
+    records = load_records(args.logs)
+    if not records:
+        print("❌ 没有可回放的请求")
+        return 1
+
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    db_copy = os.path.join(workdir, "questions.db")
+    copy_database(args.db, db_copy)
+    salt = args.salt or os.environ.get("TRAFFIC_RECORD_SALT") or os.environ.get("SECRET_KEY") or DEFAULT_SALT
+    recorder = TrafficRecorder(None, '', salt)
+    users = pseudonymize_users(db_copy, recorder)
+    print(f"👤 已将副本中的 {users} 个用户改为录制时的化名")
+    admins = os.environ.get("ADMIN_USERS") or "admin,administrator"
+    os.environ["ADMIN_USERS"] = ",".join(f"u{recorder.pseudonym(name.strip())}" for name in admins.split(","))
+    os.environ["DATABASE_PATH"] = db_copy
+    os.environ.setdefault("TRAFFIC_RECORD_ENABLED", "0")
+    if not args.keep_rate_limit:
+        # 回放时所有客户端都来自本机，按 IP 限流会误伤
+        os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    random.seed(args.seed)
+    import questions
+    app = questions.app
+    adapter = app.url_map.bind("localhost")
+
+    def endpoint_of(method, path):
+        try:
+            return adapter.match(path.split("?", 1)[0], method=method)[0]
+        except Exception:
+            return "unmatched"
+
+    clients = {}
+    for record in records:
+        clients.setdefault(record["c"], []).append(record)
+
+    samples = []
+    samples_lock = threading.Lock()
+    t0 = records[0]["t"]
+    started = time.perf_counter()
+
+    def replay_client(client_records):
+        client = app.test_client()
+        local = []
+        for record in client_records:
+            if args.speed > 0:
+                delay = (record["t"] - t0) / args.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            kwargs = {"json": record["b"]} if "b" in record else {}
+            begin = time.perf_counter()
+            try:
+                status = client.open(record["p"], method=record["m"], **kwargs).status_code
+            except Exception as e:
+                print(f"❌ {record['m']} {record['p']}: {e}")
+                status = 599
+            elapsed = (time.perf_counter() - begin) * 1000
+            local.append((endpoint_of(record["m"], record["p"]), status, record.get("s", status), elapsed))
+        with samples_lock:
+            samples.extend(local)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(replay_client, clients.values()))
+
+    result = {
+        "app_dir": os.path.abspath(args.app_dir),
+        "requests": len(samples),
+        "clients": len(clients),
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        "endpoints": summarize(samples)
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"✅ 回放 {len(samples)} 个请求（{len(clients)} 个客户端），用时 {result['wall_seconds']} 秒，结果: {args.out}")
+    mismatches = sum(e["status_mismatches"] for e in result["endpoints"].values())
+    if mismatches:
+        # 状态码与录制时不同说明回放走了别的分支（例如登录失败），延迟对比不可信
+        print(f"⚠️ {mismatches} 个请求的状态码与录制时不同，请检查 --salt 是否与录制时的 TRAFFIC_RECORD_SALT 一致")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+def compare(base_path, candidate_path):
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(candidate_path, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    print(f"{'接口':<32}{'请求数':>8}{'p50':>18}{'p95':>18}{'错误':>10}{'状态不符':>10}")
+    for endpoint in sorted(set(base["endpoints"]) | set(candidate["endpoints"])):
+        b = base["endpoints"].get(endpoint)
+        c = candidate["endpoints"].get(endpoint)
+        if not b or not c:
+            print(f"{endpoint:<32}{'仅出现在一侧':>8}")
+            continue
+
+        def delta(key):
+            change = (c[key] - b[key]) / b[key] * 100 if b[key] else 0
+            return f"{b[key]:.1f}→{c[key]:.1f} {change:+.0f}%"
+
+        print(f"{endpoint:<32}{c['count']:>8}{delta('p50_ms'):>18}{delta('p95_ms'):>18}{b['errors']:>5}→{c['errors']:<4}"
+              f"{b['status_mismatches']:>5}→{c['status_mismatches']:<4}")
+
+    for label, result in (("基准", base), ("新版本", candidate)):
+        mismatches = sum(e["status_mismatches"] for e in result["endpoints"].values())
+        if mismatches > MISMATCH_TOLERANCE * max(1, result["requests"]):
+            print(f"❌ {label}有 {mismatches}/{result['requests']} 个请求的状态码与录制时不同，回放走了别的代码路径，延迟对比不可信")
+            return 1
+    return 0
+
+
+def run_ab(args):
+    outdir = tempfile.mkdtemp(prefix="replay-ab-")
+    logs = [os.path.abspath(p) for p in args.logs]
+    outputs = []
+    for label, app_dir in (("base", args.base), ("candidate", args.candidate)):
+        app_dir = os.path.abspath(app_dir)
+        out = os.path.join(outdir, f"{label}.json")
+        cmd = [sys.executable, os.path.abspath(__file__), "run", *logs, "--app-dir", app_dir, "--db", os.path.abspath(args.db),
+               "--speed", str(args.speed), "--concurrency", str(args.concurrency), "--seed", str(args.seed), "--out", out]
+        if args.salt:
+            cmd += ["--salt", args.salt]
+        if args.keep_rate_limit:
+            cmd.append("--keep-rate-limit")
+        # 每个版本在独立进程里导入，避免两份 questions.py 的模块互相覆盖
+        if subprocess.run(cmd, cwd=app_dir).returncode != 0:
+            return 1
+        outputs.append(out)
+    return compare(*outputs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回放录制的线上流量")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_replay_options(p):
+        p.add_argument("logs", nargs="+", help="traffic.py 录制的日志文件（含滚动后的 .1 .2 …）")
+        p.add_argument("--db", required=True, help="要复制的数据库")
+        p.add_argument("--speed", type=float, default=1.0, help="回放倍速，0 表示不等待")
+        p.add_argument("--concurrency", type=int, default=16, help="同时回放的客户端数")
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--keep-rate-limit", action="store_true", help="回放时保留限流")
+        p.add_argument("--salt", help="录制时的 TRAFFIC_RECORD_SALT，默认取环境变量 TRAFFIC_RECORD_SALT 或 SECRET_KEY")
+
+    run = sub.add_parser("run", help="回放到一个版本")
+    add_replay_options(run)
+    run.add_argument("--app-dir", default=".", help="questions.py 所在目录")
+    run.add_argument("--out", required=True)
+
+    cmp_parser = sub.add_parser("compare", help="比较两次回放结果")
+    cmp_parser.add_argument("base")
+    cmp_parser.add_argument("candidate")
+
+    ab = sub.add_parser("ab", help="在两个版本上回放并比较")
+    add_replay_options(ab)
+    ab.add_argument("--base", required=True, help="基准版本的 questions.py 所在目录")
+    ab.add_argument("--candidate", required=True, help="新版本的 questions.py 所在目录")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run_replay(args)
+    if args.command == "compare":
+        return compare(args.base, args.candidate)
+    return run_ab(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
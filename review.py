@@ -0,0 +1,144 @@
+"""错题间隔复习（SM-2）
+
+玩家答错的题进入他的复习队列，之后每次作答按 SM-2 调整间隔：
+- 答错：重复次数清零，RELEARN 分钟后再次到期，难度系数下降
+- 答对：第 1 次间隔 1 天，第 2 次 6 天，之后乘以难度系数
+
+卡片状态（难度系数、重复次数、间隔、到期时间）保存在 review_cards 表中，
+重启和部署后不会丢失，也不依赖只保留 7 天的 question_stats。
+卡片由答题记录流增量更新：review_sync 记录每个统计表已处理到的 rowid，
+推进水位和写卡片在同一个事务里，多个 worker 同时同步时每条记录只会被处理一次。
+取题时把取出的卡片推迟 hold_seconds 写回表里，其他 worker 也不会重复下发。
+"""
+import time
+
+DAY = 86400
+MIN_EASE = 1.3
+DEFAULT_EASE = 2.5
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+
+
+class ReviewCard:
+    __slots__ = ("ease", "reps", "interval", "due")
+
+    def __init__(self, ease=DEFAULT_EASE, reps=0, interval=0, due=0):
+        self.ease = ease
+        self.reps = reps
+        self.interval = interval
+        self.due = due
+
+    def record(self, correct, answered_at, relearn_seconds):
+        quality = QUALITY_CORRECT if correct else QUALITY_WRONG
+        self.ease = next_ease(self.ease, quality)
+        if correct:
+            self.reps += 1
+            if self.reps == 1:
+                self.interval = DAY
+            elif self.reps == 2:
+                self.interval = 6 * DAY
+            else:
+                self.interval = self.interval * self.ease
+        else:
+            self.reps = 0
+            self.interval = relearn_seconds
+        self.due = answered_at + self.interval
+
+
+def next_ease(ease, quality):
+    """SM-2 难度系数更新公式"""
+    ease += 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    return max(MIN_EASE, ease)
+
+
+class ReviewScheduler:
+    def __init__(self, relearn_seconds=600, hold_seconds=600):
+        self.relearn_seconds = relearn_seconds
+        self.hold_seconds = hold_seconds
+
+    def sync(self, db, tables, timestamp, batch=5000):
+        """把各统计表水位之后的答题记录计入卡片，返回处理的记录数
+
+        tables: 统计表名列表；timestamp: created_at -> 秒级时间戳
+        """
+        total = 0
+        for table in tables:
+            while True:
+                count = self._sync_batch(db, table, timestamp, batch)
+                total += count
+                if count < batch:
+                    break
+        return total
+
+    def _sync_batch(self, db, table, timestamp, batch):
+        row = db.execute("SELECT last_rowid FROM review_sync WHERE source = ?", (table,)).fetchone()
+        if row is None:
+            db.execute("INSERT OR IGNORE INTO review_sync (source, last_rowid) VALUES (?, 0)", (table,))
+            db.commit()
+            row = db.execute("SELECT last_rowid FROM review_sync WHERE source = ?", (table,)).fetchone()
+        last_rowid = row[0]
+        rows = db.execute(f"""
+            SELECT rowid, question_id, user_id, is_correct, created_at
+            FROM {table}
+            WHERE rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+        """, (last_rowid, batch)).fetchall()
+        if not rows:
+            return 0
+
+        # 先推进水位（同时拿到写锁），没推进成功说明这批记录已被其他 worker 处理
+        cur = db.execute("UPDATE review_sync SET last_rowid = ? WHERE source = ? AND last_rowid = ?",
+                         (rows[-1][0], table, last_rowid))
+        if cur.rowcount == 0:
+            db.rollback()
+            return 0
+
+        cards = {}  # (user_id, 题目ID) -> ReviewCard
+        for _, qid, user_id, is_correct, created_at in rows:
+            if user_id is None:
+                continue
+            key = (user_id, qid)
+            card = cards.get(key)
+            if card is None:
+                stored = db.execute("""
+                    SELECT ease, reps, interval, due FROM review_cards WHERE user_id = ? AND question_id = ?
+                """, key).fetchone()
+                if stored is not None:
+                    card = cards[key] = ReviewCard(*stored)
+                elif is_correct:
+                    continue  # 只跟踪答错过的题
+                else:
+                    card = cards[key] = ReviewCard()
+            card.record(bool(is_correct), timestamp(created_at), self.relearn_seconds)
+
+        db.executemany("""
+            INSERT OR REPLACE INTO review_cards (user_id, question_id, ease, reps, interval, due)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(user_id, qid, c.ease, c.reps, c.interval, c.due) for (user_id, qid), c in cards.items()])
+        db.commit()
+        return len(rows)
+
+    def pop_due(self, db, user_id, k, now=None):
+        """取出最多 k 道已到期的题（按到期先后）；取出的题推迟 hold_seconds，避免作答前被重复下发"""
+        now = time.time() if now is None else now
+        candidates = [row[0] for row in db.execute("""
+            SELECT question_id FROM review_cards
+            WHERE user_id = ? AND due <= ?
+            ORDER BY due
+            LIMIT ?
+        """, (user_id, now, k))]
+        result = []
+        for qid in candidates:
+            # 只有仍然到期的才算取到，同时取题的其他 worker 已推迟的跳过
+            cur = db.execute("""
+                UPDATE review_cards SET due = ? WHERE user_id = ? AND question_id = ? AND due <= ?
+            """, (now + self.hold_seconds, user_id, qid, now))
+            if cur.rowcount:
+                result.append(qid)
+        db.commit()
+        return result
+
+    def summary(self, db, user_id):
+        row = db.execute("SELECT COUNT(*), MIN(due) FROM review_cards WHERE user_id = ?", (user_id,)).fetchone()
+        return {"cards": row[0], "next_due": row[1]}
@@ -0,0 +1,357 @@
+"""多人实时答题房间
+
+房间状态全部保存在内存中：
+- 每道题的消息只序列化一次，同一个字符串发给房间里的所有连接
+- 玩家的答案先放进队列，由定时线程每个 tick 批量判分
+- 实时比分按 tick 推送，而不是每收到一个答案推送一次
+- 每个连接有自己的有界发送队列和发送线程，tick 线程只入队；队列满的慢连接会被断开
+- 对局结束后由单独的线程调用 persist 回调一次性批量写入数据库，不阻塞其他房间的 tick
+
+房间只存在于创建它的进程中，多 worker 部署时需要把 /ws/room/ 路由到同一个 worker。
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+
+def answers_match(expected, given):
+    """服务端判分：选择题比较字母，数学题按数值比较（允许微小误差），否则比较去空白后的文本"""
+    if expected is None or given is None:
+        return False
+    expected = str(expected).strip().replace(',', '')
+    given = str(given).strip().replace(',', '')
+    if len(expected) == 1 and expected.upper() in 'ABCDE':
+        return given.upper() == expected.upper()
+    try:
+        return abs(float(expected) - float(given)) < 1e-6
+    except ValueError:
+        return expected.lower() == given.lower()
+
+
+def utc_timestamp(ts):
+    """与 SQLite CURRENT_TIMESTAMP 相同格式的 UTC 时间字符串"""
+    return datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Player:
+    __slots__ = ('key', 'ws', 'user_id', 'username', 'score', 'streak', 'max_streak',
+                 'answered', 'correct', 'answers', 'connected', 'last_answered',
+                 'outbox', 'max_queued', 'closing', '_wakeup')
+
+    def __init__(self, key, ws, user_id, username, max_queued=64):
+        self.key = key
+        self.ws = ws
+        self.user_id = user_id
+        self.username = username
+        self.score = 0
+        self.streak = 0
+        self.max_streak = 0
+        self.answered = 0
+        self.correct = 0
+        self.answers = []  # [(question_id, is_correct, selected_option, answer_time)]
+        self.connected = True
+        self.last_answered = -1  # 最近一次作答的题目序号，防止重复作答
+        self.outbox = deque()     # 待发送的帧，由本连接的发送线程取出
+        self.max_queued = max_queued
+        self.closing = False
+        self._wakeup = threading.Condition()
+
+    def enqueue(self, frame):
+        """放入发送队列，不阻塞；队列已满说明客户端跟不上，断开它"""
+        with self._wakeup:
+            if self.closing:
+                return False
+            if len(self.outbox) >= self.max_queued:
+                self.connected = False
+                self.closing = True
+                self.outbox.clear()
+                self._wakeup.notify()
+                return False
+            self.outbox.append(frame)
+            self._wakeup.notify()
+            return True
+
+    def close(self):
+        """发完已入队的帧后关闭连接"""
+        with self._wakeup:
+            self.closing = True
+            self._wakeup.notify()
+
+    def run_sender(self):
+        """发送线程：逐帧调用阻塞的 ws.send，慢连接只拖慢自己"""
+        while True:
+            with self._wakeup:
+                while not self.outbox and not self.closing:
+                    self._wakeup.wait()
+                if not self.outbox:
+                    break
+                frame = self.outbox.popleft()
+            try:
+                self.ws.send(frame)
+            except Exception:
+                self.connected = False
+                with self._wakeup:
+                    self.closing = True
+                    self.outbox.clear()
+                break
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+
+class Room:
+    def __init__(self, room_id, host_user_id, questions, time_limit, reveal_seconds, max_players):
+        self.id = room_id
+        self.host_user_id = host_user_id
+        self.questions = questions
+        self.time_limit = time_limit
+        self.reveal_seconds = reveal_seconds
+        self.max_players = max_players
+        self.players = {}
+        self.pending_answers = deque()
+        self.state = 'lobby'   # lobby -> question -> reveal -> ... -> finished
+        self.index = -1
+        self.phase_deadline = 0
+        self.question_started = 0
+        self.created_at = time.time()
+        self.started_at = None      # 墙上时间，写入 game_sessions.start_time
+        self.start_requested = False
+        self.scores_dirty = False
+
+    # ---------- 发送 ----------
+    def broadcast(self, frame):
+        """frame 已经是序列化好的字符串，所有连接共用；只放入各连接的发送队列"""
+        for player in list(self.players.values()):
+            if player.connected:
+                player.enqueue(frame)
+
+    def send_to(self, player, message):
+        if player.connected:
+            player.enqueue(json.dumps(message, ensure_ascii=False))
+
+    def summary(self):
+        return {
+            "room_id": self.id,
+            "state": self.state,
+            "players": sum(1 for p in list(self.players.values()) if p.connected),
+            "question_index": self.index,
+            "total_questions": len(self.questions),
+            "time_limit": self.time_limit
+        }
+
+    # ---------- 状态推进（只在 tick 线程中调用） ----------
+    # 玩家由 WebSocket 线程随时加入或离开，遍历 players 时先复制一份
+    def start(self, now):
+        if self.state != 'lobby':
+            return
+        self.started_at = time.time()
+        self.pending_answers.clear()
+        self._next_question(now)
+
+    def _next_question(self, now):
+        self.index += 1
+        if self.index >= len(self.questions):
+            self.state = 'finished'
+            self.broadcast(json.dumps({"type": "finished", "scoreboard": self._scoreboard()}, ensure_ascii=False))
+            return
+
+        q = self.questions[self.index]
+        self.state = 'question'
+        self.question_started = now
+        self.phase_deadline = now + self.time_limit
+        # 题目帧不包含答案
+        self.broadcast(json.dumps({
+            "type": "question",
+            "index": self.index,
+            "total": len(self.questions),
+            "id": q["id"],
+            "q": q["q"],
+            "qtype": q["type"],
+            "opts": q["opts"],
+            "time_limit": self.time_limit
+        }, ensure_ascii=False))
+
+    def _grade_pending(self):
+        """批量处理队列中的答案"""
+        q = self.questions[self.index] if 0 <= self.index < len(self.questions) else None
+        while self.pending_answers:
+            player, index, option, received_at = self.pending_answers.popleft()
+            if q is None or self.state != 'question' or index != self.index or player.last_answered == index:
+                continue
+            player.last_answered = index
+            answer_time = round(received_at - self.question_started, 2)
+            is_correct = answers_match(q["a"], option)
+            player.answered += 1
+            if is_correct:
+                player.correct += 1
+                player.streak += 1
+                player.max_streak = max(player.max_streak, player.streak)
+                # 答得越快加分越多：基础10分 + 最多10分速度奖励
+                player.score += 10 + int(10 * max(0.0, 1 - answer_time / self.time_limit))
+            else:
+                player.streak = 0
+            player.answers.append((q["id"], is_correct, option, answer_time))
+            self.scores_dirty = True
+
+    def _reveal(self, now):
+        q = self.questions[self.index]
+        self.state = 'reveal'
+        self.phase_deadline = now + self.reveal_seconds
+        self.broadcast(json.dumps({"type": "reveal", "index": self.index, "answer": q["a"]}, ensure_ascii=False))
+        for player in list(self.players.values()):
+            if player.last_answered == self.index:
+                last = player.answers[-1]
+                self.send_to(player, {"type": "result", "index": self.index, "correct": last[1], "score": player.score})
+
+    def _scoreboard(self, limit=10):
+        ranked = sorted(self.players.values(), key=lambda p: -p.score)[:limit]
+        return [{"username": p.username, "score": p.score, "streak": p.streak} for p in ranked]
+
+    def tick(self, now):
+        """定时调用：批量判分、推送比分、推进题目；返回房间是否已结束"""
+        if self.state == 'question':
+            self._grade_pending()
+            connected = [p for p in list(self.players.values()) if p.connected]
+            if now >= self.phase_deadline or (connected and all(p.last_answered == self.index for p in connected)):
+                self._reveal(now)
+        elif self.state == 'reveal' and now >= self.phase_deadline:
+            self._next_question(now)
+        else:
+            self.pending_answers.clear()
+
+        if self.scores_dirty:
+            self.scores_dirty = False
+            answered = sum(1 for p in list(self.players.values()) if p.last_answered == self.index)
+            self.broadcast(json.dumps({
+                "type": "scores",
+                "index": self.index,
+                "answered": answered,
+                "scoreboard": self._scoreboard()
+            }, ensure_ascii=False))
+
+        return self.state == 'finished'
+
+
+class RoomManager:
+    """管理本进程内的所有房间，一个后台线程按 tick 驱动全部房间，另一个线程写入结束的房间"""
+
+    def __init__(self, sample_fn, persist_fn, tick_seconds=0.5, reveal_seconds=3,
+                 max_players=500, max_rooms=100, idle_timeout=3600, send_queue_frames=64):
+        self.sample_fn = sample_fn      # (difficulty, count) -> 题目列表
+        self.persist_fn = persist_fn    # (room) -> None，对局结束后批量写库
+        self.tick_seconds = tick_seconds
+        self.reveal_seconds = reveal_seconds
+        self.max_players = max_players
+        self.max_rooms = max_rooms
+        self.idle_timeout = idle_timeout
+        self.send_queue_frames = send_queue_frames
+        self.rooms = {}
+        self.unsaved = queue.Queue()  # 已结束、等待写库的房间
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            threading.Thread(target=self._run, name="rooms", daemon=True).start()
+            threading.Thread(target=self._persist_loop, name="rooms-persist", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._pid is not None:
+            self.unsaved.put(None)  # 写库线程处理完已排队的房间后退出
+        self._pid = None
+
+    def busy(self):
+        """有进行中或还没写库的房间"""
+        return bool(self.rooms) or self.unsaved.unfinished_tasks > 0
+
+    def create_room(self, host_user_id, difficulty, count, time_limit):
+        with self._lock:
+            if len(self.rooms) >= self.max_rooms:
+                return None
+            questions = self.sample_fn(difficulty, count)
+            if not questions:
+                return None
+            room_id = uuid.uuid4().hex[:8]
+            room = Room(room_id, host_user_id, questions, time_limit, self.reveal_seconds, self.max_players)
+            self.rooms[room_id] = room
+        self.ensure_started()
+        return room
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def join(self, room, ws, user_id, username):
+        if len(room.players) >= room.max_players or room.state == 'finished':
+            return None
+        player = Player(uuid.uuid4().hex[:12], ws, user_id, username, self.send_queue_frames)
+        room.players[player.key] = player
+        threading.Thread(target=player.run_sender, name=f"room-{room.id}-send", daemon=True).start()
+        room.send_to(player, {"type": "joined", "player": player.key, **room.summary()})
+        return player
+
+    def leave(self, room, player):
+        player.connected = False
+        player.close()
+        if room.state == 'lobby':
+            room.players.pop(player.key, None)
+
+    def submit_answer(self, room, player, index, option):
+        # 只入队，判分在 tick 线程里批量进行
+        room.pending_answers.append((player, index, option, time.monotonic()))
+
+    def start_room(self, room, user_id):
+        if user_id is None or user_id != room.host_user_id:
+            return False
+        # 实际在 tick 线程中启动，房间状态只由 tick 线程修改
+        room.start_requested = True
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            for room in list(self.rooms.values()):
+                try:
+                    if room.start_requested:
+                        room.start_requested = False
+                        room.start(started)
+                    if room.tick(started):
+                        self._finish(room)
+                    elif room.state == 'lobby' and time.time() - room.created_at > self.idle_timeout:
+                        self.rooms.pop(room.id, None)
+                except Exception as e:
+                    print(f"❌ 房间 {room.id} 处理失败: {e}")
+                    self.rooms.pop(room.id, None)
+            self._stop.wait(max(0.0, self.tick_seconds - (time.monotonic() - started)))
+
+    def _finish(self, room):
+        self.rooms.pop(room.id, None)
+        # 发送线程发完结束帧后关闭连接
+        for player in list(room.players.values()):
+            player.close()
+        self.unsaved.put(room)
+
+    def _persist_loop(self):
+        while True:
+            room = self.unsaved.get()
+            try:
+                if room is None:
+                    return
+                self.persist_fn(room)
+            except Exception as e:
+                print(f"❌ 保存房间 {room.id} 结果失败: {e}")
+            finally:
+                self.unsaved.task_done()
@@ -0,0 +1,66 @@
+"""进程内定时任务
+
+每个 worker 进程一个后台线程，按固定间隔执行注册的任务。
+线程在进程收到第一个请求时启动（ensure_started），
+这样 gunicorn --preload 时 fork 出的子进程也会各自启动自己的线程。
+"""
+import os
+import threading
+import time
+import traceback
+
+
+class Scheduler:
+    def __init__(self, app=None, name="scheduler"):
+        self.app = app
+        self.name = name
+        self.jobs = []  # [名称, 间隔秒数, 函数, 下次执行时间]
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def every(self, seconds, fn, name=None, run_immediately=False):
+        """注册一个周期任务"""
+        first_run = time.monotonic() + (0 if run_immediately else seconds)
+        self.jobs.append([name or fn.__name__, seconds, fn, first_run])
+        return fn
+
+    def ensure_started(self):
+        """当前进程还没有调度线程时启动一个"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_pending(self):
+        """执行所有到期的任务，返回距离下一个任务的秒数"""
+        now = time.monotonic()
+        for job in self.jobs:
+            name, interval, fn, due = job
+            if due > now:
+                continue
+            job[3] = now + interval
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        fn()
+                else:
+                    fn()
+            except Exception as e:
+                print(f"❌ 定时任务 {name} 执行失败: {e}")
+                print(traceback.format_exc())
+        if not self.jobs:
+            return 60
+        return max(0.05, min(job[3] for job in self.jobs) - time.monotonic())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.run_pending())
@@ -0,0 +1,123 @@
+"""进行中对局登记
+
+每个 worker 在内存里记录自己见过的进行中对局（开始、答题时登记，结束时移除），
+开始对局时已登记的会话不再访问数据库。
+定时任务清理长时间无活动的条目，并把最近活跃的对局写到 {prefix}.active.{pid}，
+在线人数由所有 worker 的文件合并得出（同一对局可能出现在多个 worker 上，按会话ID去重）。
+"""
+import json
+import os
+import threading
+import time
+
+
+class ActiveSessionRegistry:
+    def __init__(self, directory, prefix, active_window=300, abandon_after=7200, publish_interval=15):
+        self.directory = directory
+        self.prefix = prefix
+        self.active_window = active_window
+        self.abandon_after = abandon_after
+        self.publish_interval = publish_interval
+        self._sessions = {}  # session_id -> [user_id, 最后活动时间]
+        self._lock = threading.Lock()
+        self._live_cache = (0, None)
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{self.prefix}.active.{pid}")
+
+    def start(self, session_id, user_id):
+        """登记一局，返回本进程之前是否已经见过它"""
+        with self._lock:
+            known = session_id in self._sessions
+            self._sessions[session_id] = [user_id, time.time()]
+        return known
+
+    def touch(self, session_id, user_id=None):
+        if not session_id:
+            return
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self._sessions[session_id] = [user_id, time.time()]
+            else:
+                entry[0] = entry[0] or user_id
+                entry[1] = time.time()
+
+    def finish(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def expire(self):
+        """丢弃超过 abandon_after 没有活动的条目，返回丢弃数量"""
+        cutoff = time.time() - self.abandon_after
+        with self._lock:
+            stale = [sid for sid, (_, seen) in self._sessions.items() if seen < cutoff]
+            for sid in stale:
+                del self._sessions[sid]
+        return len(stale)
+
+    def _recent(self):
+        cutoff = time.time() - self.active_window
+        with self._lock:
+            return {sid: entry for sid, entry in self._sessions.items() if entry[1] >= cutoff}
+
+    def publish(self):
+        """清理过期条目，并把本进程最近活跃的对局写入文件（定时任务）"""
+        self.expire()
+        path = self._path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._recent(), f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ 写入在线对局失败: {e}")
+
+    def _merged(self, now):
+        """合并本进程内存和其他 worker 发布的文件：{会话ID: [user_id, 最后活动时间]}"""
+        # 本进程用内存中的最新数据，其他 worker 读它们发布的文件
+        merged = self._recent()
+        head = f"{self.prefix}.active."
+        own = os.path.basename(self._path(os.getpid()))
+        for name in os.listdir(self.directory):
+            if not name.startswith(head) or name.endswith('.tmp') or name == own:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                # worker 退出后文件不再更新，超过两个周期的视为失效
+                if now - os.stat(path).st_mtime > 2 * self.publish_interval + 1:
+                    os.remove(path)
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for sid, entry in entries.items():
+                if sid not in merged or entry[1] > merged[sid][1]:
+                    merged[sid] = entry
+
+        cutoff = now - self.active_window
+        return {sid: entry for sid, entry in merged.items() if entry[1] >= cutoff}
+
+    def active_ids(self):
+        """所有 worker 上最近 active_window 秒内有活动的会话ID"""
+        return set(self._merged(time.time()))
+
+    def live(self):
+        """所有 worker 合计的在线对局数与玩家数（结果缓存几秒）"""
+        now = time.time()
+        cached_at, cached = self._live_cache
+        if cached is not None and now - cached_at < min(5, self.publish_interval):
+            return cached
+
+        sessions = self._merged(now)
+        users = {entry[0] for entry in sessions.values() if entry[0]}
+        guests = sum(1 for entry in sessions.values() if not entry[0])
+        result = {
+            "active_sessions": len(sessions),
+            "active_players": len(users) + guests,
+            "guests": guests,
+            "window_seconds": self.active_window
+        }
+        self._live_cache = (now, result)
+        return result
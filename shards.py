@@ -0,0 +1,115 @@
+"""答题统计分片
+
+question_stats 按 question_id 取模分到 N 个独立的 SQLite 文件，ATTACH 到主连接上，
+库名为 stats0 … stats{N-1}。每个文件有自己的写锁，落在不同分片的写入互不排队；
+单题的读写只访问一个分片，全局统计（清理、计数、增量同步）逐个分片执行后汇总。
+
+分片数决定了数据位置，启用后不要修改；从未分片切换过来时，
+主库中已有的记录会在启动时按同样的规则迁移到各分片。
+"""
+import sqlite3
+
+# SQLite 默认最多 ATTACH 10 个库
+MAX_SHARDS = 10
+
+SHARD_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.question_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question_id INTEGER,
+        user_id INTEGER,
+        is_correct BOOLEAN,
+        selected_option TEXT,
+        answer_time REAL,
+        is_difficult BOOLEAN DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        session_id TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_question_stats_question ON question_stats(question_id)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_question_stats_session ON question_stats(session_id)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_question_stats_created ON question_stats(created_at)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_question_stats_session_created ON question_stats(session_id, created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.journal_compacted (
+        name TEXT PRIMARY KEY,
+        compacted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+]
+
+STATS_COLUMNS = "question_id, user_id, is_correct, selected_option, answer_time, is_difficult, created_at, session_id"
+
+
+def shard_index(question_id, count):
+    """与迁移 SQL 中 abs(CAST(question_id AS INTEGER)) % N 保持一致"""
+    try:
+        return abs(int(question_id)) % count
+    except (TypeError, ValueError):
+        return 0
+
+
+class StatsShardRouter:
+    """把 question_id 映射到表名；count 为 0 时所有访问都落在主库的 question_stats"""
+
+    def __init__(self, db_path, count):
+        if count > MAX_SHARDS:
+            print(f"⚠️ 答题统计分片数 {count} 超过上限，改为 {MAX_SHARDS}")
+            count = MAX_SHARDS
+        self.db_path = db_path
+        self.count = max(0, count)
+
+    @property
+    def enabled(self):
+        return self.count > 0
+
+    def path(self, index):
+        return f"{self.db_path}.stats{index}"
+
+    def schema(self, question_id):
+        return f"stats{shard_index(question_id, self.count)}" if self.enabled else "main"
+
+    def schemas(self):
+        return [f"stats{i}" for i in range(self.count)] if self.enabled else ["main"]
+
+    def table(self, question_id):
+        return f"{self.schema(question_id)}.question_stats"
+
+    def tables(self):
+        return [f"{schema}.question_stats" for schema in self.schemas()]
+
+    def group(self, rows, key=0):
+        """按分片分组：{库名: [行]}"""
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.schema(row[key]), []).append(row)
+        return groups
+
+    def attach(self, db):
+        for i in range(self.count):
+            db.execute(f"ATTACH DATABASE ? AS stats{i}", (self.path(i),))
+            db.execute(f"PRAGMA stats{i}.journal_mode=WAL")
+            db.execute(f"PRAGMA stats{i}.synchronous=NORMAL")
+
+    def ensure_schema(self, db):
+        """建表，并把主库中尚未迁移的记录按分片规则搬过去（在启动文件锁内调用）"""
+        if not self.enabled:
+            return
+        for schema in self.schemas():
+            for sql in SHARD_TABLES:
+                db.execute(sql.format(schema=schema))
+        try:
+            pending = db.execute("SELECT COUNT(*) FROM main.question_stats").fetchone()[0]
+        except sqlite3.OperationalError:
+            pending = 0
+        if pending:
+            for i in range(self.count):
+                db.execute(f"""
+                    INSERT INTO stats{i}.question_stats ({STATS_COLUMNS})
+                    SELECT {STATS_COLUMNS} FROM main.question_stats
+                    WHERE abs(CAST(question_id AS INTEGER)) % {self.count} = {i}
+                    ORDER BY id
+                """)
+            db.execute("DELETE FROM main.question_stats")
+            print(f"✅ 已将 {pending} 条答题记录迁移到 {self.count} 个分片")
+        db.commit()
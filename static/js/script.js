@@ -978,13 +978,14 @@ function fetchQuestionsAndStart(callback) {
 
   console.log("🔄 开始拉取题目，等级:", level, "分数:", score);
 
-  fetch(`/get_questions?score=${score}&level=${level}`)
+  fetch(`/get_questions?score=${score}&level=${level}&format=columnar`)
     .then((r) => {
       if (!r.ok) {
         throw new Error(`HTTP error! status: ${r.status}`);
       }
       return r.json();
     })
+    .then(decodeColumnar)
     .then((data) => {
       if (!data || !Array.isArray(data) || data.length === 0) {
         // 如果是SADISTIC难度没有题目，提示并降级
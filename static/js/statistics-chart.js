@@ -684,6 +684,68 @@ function showAnswerAndCooldown(selectedIndex) {
   }
 }
 // =================== 统计功能 ===================
+// 批量预取的统计图数据，题目ID -> 数据
+const chartDataCache = new Map();
+
+// 一次请求取多道题的统计图数据（例如一局结束后回顾全部题目），结果放进缓存
+function loadChartDataBatch(qids) {
+  const ids = [...new Set(qids.filter(Boolean))];
+  if (ids.length === 0) {
+    return Promise.resolve(chartDataCache);
+  }
+  return fetch(`/api/question_chart_data?format=columnar&ids=${ids.join(",")}`)
+    .then((response) => {
+      if (!response.ok) {
+        throw new Error(`HTTP错误: ${response.status}`);
+      }
+      return response.json();
+    })
+    .then((result) => {
+      for (const [qid, data] of Object.entries(result.charts || {})) {
+        chartDataCache.set(String(qid), decodeChartData(data));
+      }
+      return chartDataCache;
+    });
+}
+window.loadChartDataBatch = loadChartDataBatch;
+
+function renderTextStats(data) {
+  const overall = data.overall_stats || {};
+  let html = `<div style="font-size: 12px; background: #f5f5f5; padding: 8px; border-radius: 4px;">`;
+  html += `<strong>本题统计：</strong><br>`;
+  html += `作答人数: ${overall.total || 0}<br>`;
+  html += `正确率: ${overall.accuracy || 0}%<br>`;
+
+  const currentQuestion = currentQ || window.currentQuestion;
+  if (
+    currentQuestion &&
+    (currentQuestion.difficulty === "easy" ||
+      currentQuestion.difficulty === "medium")
+  ) {
+    html += `平均用时: ${
+      overall.avg_time ? overall.avg_time.toFixed(1) + "秒" : "暂无"
+    }<br>`;
+  }
+
+  if (
+    data.question_type === "choice" &&
+    data.option_stats &&
+    Object.keys(data.option_stats).length > 0
+  ) {
+    html += `<br><strong>选项分布：</strong>`;
+    for (const [option, stat] of Object.entries(data.option_stats)) {
+      html += `<br>${option}: ${stat.count} 人 (${stat.percentage}%)`;
+    }
+  }
+
+  html += `</div>`;
+  const statsResult = document.getElementById("statsResult");
+  if (statsResult) {
+    statsResult.innerHTML = html;
+    statsResult.style.display = "block";
+  }
+}
+
 function loadQuestionStats(qid) {
   if (!qid) {
     console.error("❌ loadQuestionStats: 缺少题目ID");
@@ -692,74 +754,39 @@ function loadQuestionStats(qid) {
 
   console.log(`📊 开始加载题目统计，ID: ${qid}`);
 
-  fetch(`/get_question_chart_data/${qid}`)
-    .then((response) => {
-      if (!response.ok) {
-        throw new Error(`HTTP错误: ${response.status}`);
-      }
-      return response.json();
-    })
-    .then((data) => {
-      console.log("✅ 获取图表数据成功:", data);
-      // 创建图表模态框
-      createChartModal(data, qid);
-    })
-    .catch((error) => {
-      console.error("❌ 获取图表数据失败:", error);
-      // 回退到文字统计
-      console.log("🔄 回退到文字统计...");
-      fetch(`/get_question_stats/${qid}`)
+  const cached = chartDataCache.get(String(qid));
+  const request = cached
+    ? Promise.resolve(cached)
+    : fetch(`/get_question_chart_data/${qid}?format=columnar`)
         .then((response) => {
           if (!response.ok) {
             throw new Error(`HTTP错误: ${response.status}`);
           }
           return response.json();
         })
-        .then((data) => {
-          console.log("✅ 获取文字统计成功:", data);
-          let html = `<div style="font-size: 12px; background: #f5f5f5; padding: 8px; border-radius: 4px;">`;
-          html += `<strong>本题统计：</strong><br>`;
-          html += `作答人数: ${data.total || 0}<br>`;
-          html += `正确率: ${data.accuracy || 0}%<br>`;
-
-          const currentQuestion = currentQ || window.currentQuestion;
-          if (
-            currentQuestion &&
-            (currentQuestion.difficulty === "easy" ||
-              currentQuestion.difficulty === "medium")
-          ) {
-            html += `平均用时: ${
-              data.avg_time ? data.avg_time.toFixed(1) + "秒" : "暂无"
-            }<br>`;
-          }
+        .then(decodeChartData);
 
-          if (
-            currentQuestion &&
-            currentQuestion.type === "choice" &&
-            data.option_stats &&
-            Object.keys(data.option_stats).length > 0
-          ) {
-            html += `<br><strong>选项分布：</strong>`;
-            for (const [option, count] of Object.entries(data.option_stats)) {
-              const percentage = ((count / data.total) * 100).toFixed(1);
-              html += `<br>${option}: ${count} 人 (${percentage}%)`;
-            }
-          }
-
-          html += `</div>`;
-          document.getElementById("statsResult").innerHTML = html;
-
-          // 显示统计区域
-          const statsResult = document.getElementById("statsResult");
-          if (statsResult) {
-            statsResult.style.display = "block";
-          }
-        })
-        .catch((err) => {
-          console.error("❌ 获取文字统计也失败:", err);
-          document.getElementById("statsResult").innerHTML =
-            '<span style="color: red;">获取统计失败，请稍后重试</span>';
-        });
+  let chartData = null;
+  request
+    .then((data) => {
+      console.log("✅ 获取图表数据成功:", data);
+      chartData = data;
+      // 创建图表模态框
+      createChartModal(data, qid);
+    })
+    .catch((error) => {
+      console.error("❌ 显示统计图失败:", error);
+      // 数据已取到但图表无法显示时，回退到文字统计
+      if (chartData) {
+        console.log("🔄 回退到文字统计...");
+        renderTextStats(chartData);
+        return;
+      }
+      const statsResult = document.getElementById("statsResult");
+      if (statsResult) {
+        statsResult.innerHTML =
+          '<span style="color: red;">获取统计失败，请稍后重试</span>';
+      }
     });
 }
 
@@ -0,0 +1,41 @@
+// =================== 列式 JSON 解码（与 wire.py 对应） ===================
+// 服务器在 ?format=columnar 时返回列式数据，这里还原成原来的对象数组；
+// 普通 JSON 原样返回，所以旧接口和新接口可以混用。
+function decodeColumnar(payload) {
+  if (!payload || payload.format !== "columnar") return payload;
+
+  const n = payload.n;
+  const names = Object.keys(payload.columns);
+  const columns = names.map((name) => {
+    const col = payload.columns[name];
+    if (Array.isArray(col)) return col;
+    // 字典编码的列
+    const values = new Array(n);
+    for (let i = 0; i < n; i++) values[i] = col.dict[col.idx[i]];
+    return values;
+  });
+
+  const rows = new Array(n);
+  for (let i = 0; i < n; i++) {
+    const row = {};
+    for (let c = 0; c < names.length; c++) row[names[c]] = columns[c][i];
+    rows[i] = row;
+  }
+  return rows;
+}
+
+function decodeChartData(payload) {
+  if (!payload || payload.format !== "columnar") return payload;
+
+  const { options, format, ...data } = payload;
+  data.option_stats = {};
+  data.time_stats = {};
+  options.label.forEach((label, i) => {
+    data.option_stats[label] = {
+      count: options.count[i],
+      percentage: options.percentage[i],
+    };
+    data.time_stats[label] = options.avg_time[i];
+  });
+  return data;
+}
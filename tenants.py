@@ -0,0 +1,182 @@
+"""多租户
+
+每个租户（学校、活动）一个独立的 SQLite 文件 {TENANT_DIR}/{租户名}.db，题库、用户、榜单互不相通。
+按子域名（foo.quiz.example.com）或路径前缀（/t/foo/...）识别租户，其余请求仍由默认数据库处理。
+
+questions.py 的数据库路径、缓存、榜单、题库映射和定时任务都是模块级状态，
+所以每个租户把 questions.py 以独立的模块名再加载一份，得到完全隔离的一套应用
+（即 Flask 文档中按子域名分发应用的做法）。已加载的租户放在容量有限的 LRU 中：
+热门租户常驻内存，冷门租户被淘汰时停止后台线程、封存答题日志并释放缓存，
+下次访问时重新加载（有启动快照和题库映射，加载很快）。进行中有多人房间的租户不会被淘汰。
+"""
+import hashlib
+import hmac
+import importlib.util
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+TENANT_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+PATH_PREFIX = '/t/'
+MODES = ('subdomain', 'path')
+# 加载失败的租户在这段时间内直接返回 503，不在每个请求里重新导入
+LOAD_RETRY_SECONDS = 30
+
+TenantSpec = namedtuple('TenantSpec', 'name db_path')
+
+_loading = threading.local()
+
+
+def loading_tenant():
+    """questions.py 导入时调用：正在为哪个租户加载（TenantSpec），不是租户加载时返回 None"""
+    return getattr(_loading, 'tenant', None)
+
+
+def derive_secret(secret, name):
+    """每个租户独立的会话签名密钥，一个租户的登录 Cookie 在其他租户无效"""
+    key = secret.encode('utf-8') if isinstance(secret, str) else secret
+    return hmac.new(key, f"tenant:{name}".encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class TenantDispatcher:
+    """WSGI 中间件：识别租户并转发给对应租户的应用，没有租户的请求交给 default_app"""
+
+    def __init__(self, default_app, module_path, directory, mode, base_domain=None, max_loaded=8, on_load=None):
+        if mode not in MODES:
+            raise ValueError(f"未知的租户识别方式: {mode}")
+        self.default_app = default_app
+        self.module_path = module_path
+        self.directory = directory
+        self.mode = mode
+        self.base_domain = (base_domain or '').lower().strip('.')
+        self.max_loaded = max(1, max_loaded)
+        self.on_load = on_load
+        self._loaded = OrderedDict()  # 租户名 -> 模块，按最近使用排序
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._failed = {}  # 租户名 -> 最近一次加载失败的时间
+
+    def db_path(self, name):
+        return os.path.join(self.directory, f"{name}.db")
+
+    def resolve(self, environ):
+        """返回 (租户名, environ)；路径前缀模式会把前缀移到 SCRIPT_NAME"""
+        if self.mode == 'subdomain':
+            host = environ.get('HTTP_HOST', '').split(':', 1)[0].lower()
+            suffix = '.' + self.base_domain
+            if not self.base_domain or not host.endswith(suffix):
+                return None, environ
+            name = host[:-len(suffix)]
+            return (None if name == 'www' else name), environ
+
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(PATH_PREFIX):
+            return None, environ
+        name, _, rest = path[len(PATH_PREFIX):].partition('/')
+        environ = dict(environ)
+        environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + PATH_PREFIX + name
+        environ['PATH_INFO'] = '/' + rest
+        return name, environ
+
+    def get_app(self, name):
+        """已加载时直接返回；否则加载（同一租户只加载一次）
+
+        租户不存在时返回 None，加载失败时返回一个响应 503 的 WSGI 应用。
+        """
+        with self._lock:
+            module = self._loaded.get(name)
+            if module is not None:
+                self._loaded.move_to_end(name)
+                return module.app
+        if not TENANT_NAME_RE.match(name) or not os.path.isfile(self.db_path(name)):
+            return None
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            with self._lock:
+                module = self._loaded.get(name)
+                if module is not None:
+                    self._loaded.move_to_end(name)
+                    return module.app
+            failed_at = self._failed.get(name)
+            if failed_at is not None and time.time() - failed_at < LOAD_RETRY_SECONDS:
+                return self._unavailable
+            try:
+                module = self._load(name)
+            except Exception as e:
+                self._failed[name] = time.time()
+                print(f"❌ 加载租户 {name} 失败: {e}")
+                return self._unavailable
+            with self._lock:
+                self._failed.pop(name, None)
+                self._loaded[name] = module
+                evicted = self._pop_idle()
+        for old in evicted:
+            self._release(old)
+        return module.app
+
+    def _load(self, name):
+        module_name = f"questions__tenant_{name.replace('-', '_')}"
+        spec = importlib.util.spec_from_file_location(module_name, self.module_path)
+        module = importlib.util.module_from_spec(spec)
+        # Flask 通过 sys.modules 查找应用根目录（模板、静态文件）
+        sys.modules[module_name] = module
+        _loading.tenant = TenantSpec(name, self.db_path(name))
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            sys.modules.pop(module_name, None)
+            raise
+        finally:
+            _loading.tenant = None
+        if self.on_load is not None:
+            self.on_load(module)
+        print(f"🏫 已加载租户: {name}")
+        return module
+
+    def _pop_idle(self):
+        """超出容量时按最久未使用的顺序淘汰空闲租户（在锁内调用）"""
+        evicted = []
+        for name in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded:
+                break
+            module = self._loaded[name]
+            if module.tenant_busy():
+                continue
+            evicted.append(self._loaded.pop(name))
+        return evicted
+
+    def _release(self, module):
+        try:
+            module.release_resources()
+        except Exception as e:
+            print(f"⚠️ 释放租户资源失败: {e}")
+        sys.modules.pop(module.__name__, None)
+        print(f"🧊 已卸载租户: {module.TENANT.name}")
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded)
+
+    @staticmethod
+    def _error(start_response, status, message):
+        body = json.dumps({"error": message}).encode('utf-8')
+        start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    def _unavailable(self, environ, start_response):
+        return self._error(start_response, '503 SERVICE UNAVAILABLE', "tenant unavailable")
+
+    def __call__(self, environ, start_response):
+        name, environ = self.resolve(environ)
+        if name is None:
+            return self.default_app(environ, start_response)
+        app = self.get_app(name)
+        if app is None:
+            return self._error(start_response, '404 NOT FOUND', "tenant not found")
+        return app(environ, start_response)
@@ -0,0 +1,127 @@
+"""线上流量录制
+
+WSGI 中间件，把每个请求的方法、路径、请求体和耗时追加到按大小滚动的日志里（每行一个 JSON）。
+每个 worker 进程写自己的文件，滚动时不需要跨进程协调。
+
+匿名化：
+- 不记录 Cookie 和请求头，客户端用 IP + User-Agent 的加盐哈希表示（登录前后保持不变），回放时每个客户端一个 Cookie 罐
+- 请求体中的用户名、邮箱替换为加盐哈希，同一个用户名总是得到同一个化名，回放时注册/登录仍然对得上
+- 密码统一替换为 REPLAY_PASSWORD
+
+回放见 replay.py。
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+REPLAY_PASSWORD = "replay-password"
+ANONYMIZED_FIELDS = ("username", "email")
+SECRET_FIELDS = ("password", "old_password", "new_password")
+SKIPPED_PREFIXES = ("/static/", "/static1/", "/favicon.ico", "/healthz", "/readyz")
+
+
+class TrafficRecorder:
+    def __init__(self, app, directory, salt, max_bytes=10 * 1024 * 1024, backups=5, max_body=4096):
+        self.app = app
+        self.directory = directory
+        self.salt = salt.encode('utf-8') if isinstance(salt, str) else salt
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_body = max_body
+        self._logger = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_logger(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    os.makedirs(self.directory, exist_ok=True)
+                    logger = logging.getLogger(f"traffic.{os.getpid()}")
+                    logger.propagate = False
+                    logger.setLevel(logging.INFO)
+                    for handler in list(logger.handlers):
+                        logger.removeHandler(handler)
+                    handler = RotatingFileHandler(
+                        os.path.join(self.directory, f"traffic.{os.getpid()}.log"),
+                        maxBytes=self.max_bytes, backupCount=self.backups, encoding='utf-8'
+                    )
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    logger.addHandler(handler)
+                    self._logger = logger
+                    self._pid = os.getpid()
+        return self._logger
+
+    def pseudonym(self, value):
+        return hashlib.blake2b(str(value).encode('utf-8'), key=self.salt[:64], digest_size=6).hexdigest()
+
+    def _anonymize_body(self, raw):
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None  # 只回放 JSON 请求体
+        if isinstance(data, dict):
+            for field in ANONYMIZED_FIELDS:
+                if data.get(field):
+                    data[field] = f"u{self.pseudonym(data[field])}"
+            for field in SECRET_FIELDS:
+                if field in data:
+                    data[field] = REPLAY_PASSWORD
+        return data
+
+    def _client_key(self, environ):
+        forwarded = environ.get('HTTP_X_FORWARDED_FOR', '').split(',')[0].strip()
+        address = forwarded or environ.get('REMOTE_ADDR', '')
+        return self.pseudonym(f"{address}|{environ.get('HTTP_USER_AGENT', '')}")
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(SKIPPED_PREFIXES) or environ.get('HTTP_UPGRADE'):
+            return self.app(environ, start_response)
+
+        # 先读出请求体，再放回去给应用使用
+        body = b''
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if 0 < length <= self.max_body:
+            body = environ['wsgi.input'].read(length)
+            environ['wsgi.input'] = io.BytesIO(body)
+
+        client = self._client_key(environ)
+        status_holder = {}
+
+        def recording_start_response(status, headers, exc_info=None):
+            status_holder['status'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        started_wall = time.time()
+        started = time.perf_counter()
+        try:
+            result = self.app(environ, recording_start_response)
+        finally:
+            query = environ.get('QUERY_STRING', '')
+            record = {
+                "t": round(started_wall, 4),
+                "c": client,
+                "m": environ.get('REQUEST_METHOD', 'GET'),
+                "p": f"{path}?{query}" if query else path,
+                "s": status_holder.get('status', 500),
+                "d": round((time.perf_counter() - started) * 1000, 2)
+            }
+            data = self._anonymize_body(body)
+            if data is not None:
+                record["b"] = data
+            try:
+                self._get_logger().info(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            except Exception as e:
+                print(f"⚠️ 写入流量录制失败: {e}")
+        return result
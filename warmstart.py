@@ -0,0 +1,53 @@
+"""启动辅助：跨进程文件锁与预构建快照
+
+多个 gunicorn worker 同时启动时，只有拿到文件锁的那个执行建表/建索引，
+其余 worker 等待后直接读取结果。快照用 pickle 保存，写入临时文件后原子替换。
+"""
+import os
+import pickle
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path):
+    """独占的跨进程文件锁，阻塞直到获得锁"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def save_snapshot(path, data):
+    """写入快照：先写临时文件再 rename，读者永远看不到写了一半的文件"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """读取快照，不存在或损坏时返回 None"""
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ 读取快照失败: {e}")
+        return None
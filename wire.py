@@ -0,0 +1,51 @@
+"""紧凑的列式 JSON 编码
+
+题目列表里每道题都重复 "id"、"difficulty"、"category" 等键名，
+列式编码改为每个字段一个数组，重复度高的字段（难度、分类、题型）再做字典编码：
+    {"format": "columnar", "n": 2,
+     "columns": {"id": [1, 2], "difficulty": {"dict": ["easy"], "idx": [0, 0]}, ...}}
+前端解码见 static/js/wire.js。客户端通过 ?format=columnar 请求这种编码，
+放在查询参数里，HTTP 缓存中间件按路径和查询参数计算 ETag，两种编码不会互相命中。
+"""
+
+COLUMNAR = "columnar"
+
+
+def wants_columnar(args):
+    return args.get("format") == COLUMNAR
+
+
+def encode_columns(rows, columns, dictionary=()):
+    """rows: dict 列表；dictionary 中的字段做字典编码"""
+    encoded = {}
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        if column in dictionary:
+            index = {}
+            idx = [index.setdefault(v, len(index)) for v in values]
+            encoded[column] = {"dict": list(index), "idx": idx}
+        else:
+            encoded[column] = values
+    return {"format": COLUMNAR, "n": len(rows), "columns": encoded}
+
+
+def encode_questions(questions):
+    return encode_columns(
+        questions,
+        ("id", "difficulty", "category", "q", "a", "type", "opts"),
+        dictionary=("difficulty", "category", "type")
+    )
+
+
+def encode_chart_data(data):
+    """option_stats / time_stats 两个以选项为键的嵌套字典合并成平行数组"""
+    labels = list(data["option_stats"])
+    compact = {k: v for k, v in data.items() if k not in ("option_stats", "time_stats")}
+    compact["format"] = COLUMNAR
+    compact["options"] = {
+        "label": labels,
+        "count": [data["option_stats"][label]["count"] for label in labels],
+        "percentage": [data["option_stats"][label]["percentage"] for label in labels],
+        "avg_time": [data["time_stats"].get(label, 0) for label in labels]
+    }
+    return compact